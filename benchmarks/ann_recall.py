@@ -0,0 +1,122 @@
+"""
+ann_recall - benchmarks recall vs. latency of the approximate (IVF) vector store index against the exact index.
+"""
+import argparse
+import json
+import time
+from typing import *
+
+import numpy as np
+
+from simsites.util.nn_index import IVFIndex, NumpyIndex
+
+
+def gen_corpus(
+        num_vectors: int,
+        dims: int = 384,
+        num_topics: int = 200,
+        seed: int = 0
+) -> np.ndarray:
+    """
+    Generates a synthetic corpus of clustered embeddings, loosely mimicking the embeddings of lines of web pages.
+    :param num_vectors: number of embeddings to generate
+    :param dims: embedding dimensions, defaults to 384
+    :param num_topics: number of clusters the embeddings are drawn around
+    :param seed: random seed
+    :return: float32 array of shape (num_vectors, dims)
+    """
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(num_topics, dims))
+    return (topics[rng.integers(num_topics, size=num_vectors)] + 0.8 * rng.normal(size=(num_vectors, dims))).astype(
+        np.float32
+    )
+
+
+def time_search(index: Any, queries: np.ndarray, k: int) -> Tuple[np.ndarray, float]:
+    """
+    Times a search of each query, one at a time (the vector store's typical access pattern).
+    :param index: index to search
+    :param queries: query embeddings
+    :param k: number of neighbors per query
+    :return: tuple of (indices of the neighbors, mean latency per query in milliseconds)
+    """
+    results = list()
+    start = time.perf_counter()
+    for query in queries:
+        results.append(index.search(queries=query[None, :], k=k)[1][0])
+    elapsed = time.perf_counter() - start
+    return np.array(results), 1000 * elapsed / len(queries)
+
+
+def main(
+        num_vectors: int,
+        num_queries: int,
+        k: int,
+        n_lists: int,
+        probes: List[int],
+        output_fname: AnyStr = None
+) -> None:
+    """
+    Builds exact and IVF indexes over the same synthetic corpus and reports recall@k and query latency of the IVF index
+    at several n_probe settings.
+    :param num_vectors: corpus size
+    :param num_queries: number of queries
+    :param k: number of neighbors per query
+    :param n_lists: number of IVF lists
+    :param probes: n_probe values to benchmark
+    :param output_fname: if specified, saves the results to a JSON file.
+    :return: None
+    """
+    corpus = gen_corpus(num_vectors)
+    queries = gen_corpus(num_queries, seed=1)
+    exact = NumpyIndex()
+    start = time.perf_counter()
+    exact.add(corpus)
+    exact_build = time.perf_counter() - start
+    ivf = IVFIndex(n_lists=n_lists)
+    start = time.perf_counter()
+    ivf.add(corpus)
+    ivf_build = time.perf_counter() - start
+    truth, exact_latency = time_search(exact, queries, k)
+    results = {
+        'num_vectors': num_vectors,
+        'num_queries': num_queries,
+        'k': k,
+        'n_lists': n_lists,
+        'exact': {'build_s': exact_build, 'latency_ms': exact_latency},
+        'ivf': list()
+    }
+    print("{0:>8} {1:>10} {2:>14}".format('n_probe', 'recall@' + str(k), 'latency (ms)'))
+    print("{0:>8} {1:>10.3f} {2:>14.3f}".format('exact', 1., exact_latency))
+    for n_probe in probes:
+        ivf.n_probe = n_probe
+        found, latency = time_search(ivf, queries, k)
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        print("{0:>8} {1:>10.3f} {2:>14.3f}".format(n_probe, recall, latency))
+        results['ivf'].append({'n_probe': n_probe, 'build_s': ivf_build, 'recall': recall, 'latency_ms': latency})
+    if output_fname:
+        with open(output_fname, 'w') as fidout:
+            json.dump(results, fidout, indent=2)
+        print("Results saved to '{0}'".format(output_fname))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='ann_recall.py',
+        description='Benchmarks recall vs. latency of the IVF vector store index against exact search'
+    )
+    parser.add_argument('-n', '--num_vectors', type=int, default=100000, help='Corpus size')
+    parser.add_argument('-q', '--num_queries', type=int, default=200, help='Number of queries')
+    parser.add_argument('-k', type=int, default=10, help='Neighbors per query')
+    parser.add_argument('--n_lists', type=int, default=256, help='Number of IVF lists')
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help='n_probe values to test')
+    parser.add_argument('-o', '--output', help='Specify an output file', required=False)
+    args = parser.parse_args()
+    main(
+        num_vectors=args.num_vectors,
+        num_queries=args.num_queries,
+        k=args.k,
+        n_lists=args.n_lists,
+        probes=args.probes,
+        output_fname=args.output
+    )
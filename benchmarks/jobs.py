@@ -0,0 +1,109 @@
+"""
+jobs - measures how the throughput of the job queue scales with the number of worker processes, running the recorded
+search against the mock server, and checks that every job completes exactly once.
+
+    python benchmarks/jobs.py --jobs 24 --workers 1 2 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_server import MockServer
+from benchmarks.run import BENCHMARK_SEARCH
+from simsites import jobs
+from simsites.config import configure
+import simsites.llm.openai as openai
+from simsites.util import serpapi
+
+
+def worker_process(db: AnyStr, results_dir: AnyStr, mock_url: AnyStr):
+    """
+    Runs a worker against the mock server until the queue is empty.
+    :param db: queue database file
+    :param results_dir: results folder
+    :param mock_url: base URL of the mock server
+    :return: None
+    """
+    configure(openai_api_key='mock', serpapi_key='mock')
+    serpapi.SERPAPI_JSON_URL = mock_url + '/search.json'
+    openai.OPENAI_COMPLETIONS_URL = mock_url + '/v1/chat/completions'
+    openai.OPENAI_EMBEDDINGS_URL = mock_url + '/v1/embeddings'
+    queue = jobs.JobQueue(db)
+    worker = jobs.Worker(queue, results_dir=results_dir, llm=openai, embed_function=openai.embeddings)
+    # Workers with nothing left to claim wait for the others' running jobs: poll often so they exit promptly
+    worker.run(exit_when_empty=True, poll_interval=0.1)
+    queue.close()
+
+
+def run(num_jobs: int, num_workers: int, mock_url: AnyStr, workdir: AnyStr) -> Dict[AnyStr, Any]:
+    """
+    Enqueues num_jobs searches and runs them with num_workers processes.
+    :param num_jobs: number of jobs
+    :param num_workers: number of worker processes
+    :param mock_url: base URL of the mock server
+    :param workdir: folder for the queue and results
+    :return: dict with the 'elapsed' seconds, queue 'stats' and number of 'results' files
+    """
+    db = os.path.join(workdir, 'jobs-{0}.db'.format(num_workers))
+    results_dir = os.path.join(workdir, 'results-{0}'.format(num_workers))
+    queue = jobs.JobQueue(db)
+    queue.enqueue([BENCHMARK_SEARCH] * num_jobs, num_clusters=3)
+    start = time.perf_counter()
+    processes = [
+        multiprocessing.Process(target=worker_process, args=(db, results_dir, mock_url))
+        for _ in range(num_workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    stats = queue.stats()
+    queue.close()
+    return {'elapsed': elapsed, 'stats': stats, 'results': len(os.listdir(results_dir))}
+
+
+def main(num_jobs: int, worker_counts: List[int], latency: float) -> None:
+    """
+    Runs the benchmark for each number of workers and prints the throughput.
+    :param num_jobs: number of jobs per run
+    :param worker_counts: numbers of worker processes to try
+    :param latency: seconds added to every mock API response
+    :return: None
+    """
+    ok = True
+    print("{0:>8} {1:>10} {2:>12} {3:>8} {4:>8}".format('workers', 'time (s)', 'jobs/minute', 'speedup', 'done'))
+    with MockServer(latency=latency) as mock, tempfile.TemporaryDirectory() as workdir:
+        baseline = None
+        for num_workers in worker_counts:
+            result = run(num_jobs, num_workers, mock.url, workdir)
+            throughput = num_jobs * 60. / result['elapsed']
+            baseline = baseline or throughput
+            print("{0:>8} {1:>10.2f} {2:>12.1f} {3:>7.2f}x {4:>8}".format(
+                num_workers,
+                result['elapsed'],
+                throughput,
+                throughput / baseline,
+                result['stats']['done']
+            ))
+            ok = ok and result['stats']['done'] == num_jobs and result['results'] == num_jobs
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='jobs.py',
+        description='Measures job queue throughput against the number of workers'
+    )
+    parser.add_argument('--jobs', type=int, default=24, help='Number of jobs per run')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Numbers of workers to try')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds added to every mock API response')
+    args = parser.parse_args()
+    main(num_jobs=args.jobs, worker_counts=args.workers, latency=args.latency)
@@ -0,0 +1,243 @@
+"""
+mock_server - local stand-in for the APIs and websites simsites talks to, for offline benchmarks.
+
+Serves:
+    POST /v1/chat/completions   OpenAI/Mistral-style chat completions with a canned answer and token usage (a JSON
+                                object with one result per "Recommendation N:" when JSON output is requested)
+    POST /v1/embeddings         OpenAI/Mistral-style embeddings (deterministic hashed bag-of-words vectors)
+    GET  /search.json           recorded SerpApi JSON from benchmarks/corpus/serp
+    GET  /pages/<name>          recorded HTML from benchmarks/corpus/html
+
+Latency and error rate are configurable per server so that retry and failover paths can be exercised.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import *
+from urllib.parse import parse_qs, urlparse
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+EMBEDDING_DIMS = 256
+MOCK_COMPLETION = (
+    "Customer reviews and clear calls to action. The top results repeatedly show short testimonials and links to "
+    "schedule service, which signals to the search engine that you offer the service being searched for."
+)
+
+
+def mock_embedding(text: AnyStr, dims: int = EMBEDDING_DIMS) -> List[float]:
+    """
+    Deterministic embedding: hashed bag of words, L2-normalized, so that texts sharing words are similar.
+    :param text: text to embed
+    :param dims: embedding dimensions
+    :return: list of floats
+    """
+    vector = [0.] * dims
+    for word in re.findall(r'\w+', text.lower()):
+        digest = hashlib.md5(word.encode('utf-8')).digest()
+        vector[int.from_bytes(digest[:4], 'little') % dims] += 1. if digest[4] % 2 else -1.
+    norm = sum(v * v for v in vector) ** 0.5 or 1.
+    return [v / norm for v in vector]
+
+
+def mock_json_completion(messages: List[Dict]) -> AnyStr:
+    """
+    Returns a canned JSON answer to a request checking several recommendations, with one result per recommendation.
+    :param messages: chat messages of the request
+    :return: JSON string
+    """
+    prompt = ' '.join(str(m.get('content', '')) for m in messages)
+    ids = sorted(set(int(i) for i in re.findall(r"Recommendation (\d+):", prompt))) or [1]
+    return json.dumps({'results': [
+        {'id': i, 'implemented': False, 'assessment': MOCK_COMPLETION, 'suggestions': MOCK_COMPLETION} for i in ids
+    ]})
+
+
+def slug(search: AnyStr) -> AnyStr:
+    """
+    Converts a search to the file name of its recorded SERP.
+    :param search: search
+    :return: e.g. "dog-grooming-near-me"
+    """
+    return re.sub(r'[^a-z0-9]+', '-', search.lower()).strip('-')
+
+
+class MockServer:
+    """
+    Mock LLM API and website server running on a background thread.
+    """
+
+    def __init__(
+            self,
+            host: AnyStr = '127.0.0.1',
+            port: int = 0,
+            latency: float = 0.,
+            error_rate: float = 0.,
+            error_status: int = 429,
+            seed: int = 0
+    ):
+        """
+        :param host: interface to listen on
+        :param port: port to listen on, 0 (default) picks a free port
+        :param latency: seconds added to every API response (not to recorded pages)
+        :param error_rate: fraction of API requests answered with error_status instead of a result
+        :param error_status: HTTP status code of simulated errors, defaults to 429 (rate limited)
+        :param seed: random seed for simulated errors
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = dict()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> AnyStr:
+        """
+        Base URL of the server e.g. http://127.0.0.1:54321
+        :return: string
+        """
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def start(self) -> 'MockServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _count(self, path: AnyStr) -> bool:
+        """
+        Counts a request and decides whether it should fail.
+        :param path: request path
+        :return: True if the request should be answered with an error
+        """
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            return self._random.random() < self.error_rate
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self, status: int, body: AnyStr, content_type: AnyStr = 'application/json'):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path == '/search.json':
+                    server._count(parsed.path)
+                    query = parse_qs(parsed.query).get('q', [''])[0]
+                    fname = os.path.join(CORPUS_DIR, 'serp', slug(query) + '.json')
+                    if not os.path.exists(fname):
+                        return self._respond(200, json.dumps({'organic_results': []}))
+                    with open(fname) as fidin:
+                        return self._respond(200, fidin.read().replace('{base_url}', server.url))
+                if parsed.path.startswith('/pages/'):
+                    server._count('/pages')
+                    fname = os.path.join(CORPUS_DIR, 'html', os.path.basename(parsed.path))
+                    if os.path.exists(fname):
+                        with open(fname, encoding='utf-8') as fidin:
+                            return self._respond(200, fidin.read(), content_type='text/html; charset=utf-8')
+                self._respond(404, json.dumps({'error': 'Not found'}))
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                path = urlparse(self.path).path
+                fail = server._count(path)
+                if server.latency:
+                    time.sleep(server.latency)
+                if fail:
+                    return self._respond(server.error_status, json.dumps({'error': 'Simulated error'}))
+                if path.endswith('/chat/completions'):
+                    prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in payload.get('messages', []))
+                    completion = MOCK_COMPLETION
+                    if (payload.get('response_format') or dict()).get('type') == 'json_object':
+                        completion = mock_json_completion(payload.get('messages', []))
+                    completion_tokens = len(completion.split())
+                    return self._respond(200, json.dumps({
+                        'id': 'mock-completion',
+                        'object': 'chat.completion',
+                        'model': payload.get('model'),
+                        'choices': [{
+                            'index': 0,
+                            'message': {'role': 'assistant', 'content': completion},
+                            'finish_reason': 'stop'
+                        }],
+                        'usage': {
+                            'prompt_tokens': prompt_tokens,
+                            'completion_tokens': completion_tokens,
+                            'total_tokens': prompt_tokens + completion_tokens
+                        }
+                    }))
+                if path.endswith('/embeddings'):
+                    inputs = payload.get('input', [])
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    tokens = sum(len(line.split()) for line in inputs)
+                    return self._respond(200, json.dumps({
+                        'object': 'list',
+                        'model': payload.get('model'),
+                        'data': [
+                            {'object': 'embedding', 'index': i, 'embedding': mock_embedding(line)}
+                            for i, line in enumerate(inputs)
+                        ],
+                        'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+                    }))
+                self._respond(404, json.dumps({'error': 'Not found'}))
+
+            def log_message(self, fmt, *args):
+                logging.debug(fmt % args)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(
+        prog='mock_server.py',
+        description='Runs a mock LLM API and recorded website server'
+    )
+    parser.add_argument('--port', type=int, default=8900, help='Port to listen on')
+    parser.add_argument('--latency_ms', type=float, default=0., help='Latency added to API responses (ms)')
+    parser.add_argument('--error_rate', type=float, default=0., help='Fraction of API requests that fail')
+    parser.add_argument('--error_status', type=int, default=429, help='Status code of failed requests')
+    args = parser.parse_args()
+    mock = MockServer(
+        port=args.port,
+        latency=args.latency_ms / 1000.,
+        error_rate=args.error_rate,
+        error_status=args.error_status
+    ).start()
+    logging.info("Mock server listening on {0}".format(mock.url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
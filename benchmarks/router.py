@@ -0,0 +1,175 @@
+"""
+router - checks that "ProviderRouter" spreads completions across providers and fails over when they error, against
+local mock endpoints: a flaky provider that is rate limited part of the time, a slower healthy provider and
+(optionally) a provider that is down. Compares the success rate to sending everything to the flaky provider, and
+checks that a router instance can be used as the LLM of "workflow.run_search", that a provider answering 404 (e.g.
+unknown model) is failed over, and that requests refused with a 400 don't put a healthy provider in cooldown.
+
+    python benchmarks/router.py --requests 200 --error_rate 0.3
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from typing import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_server import MockServer
+from benchmarks.run import BENCHMARK_SEARCH
+from simsites import workflow
+from simsites.config import configure
+import simsites.llm.mistral as mistral
+import simsites.llm.openai as openai
+from simsites.llm.backend import get_completions, user_message
+from simsites.llm.router import Provider, ProviderRouter
+from simsites.util import serpapi
+
+COMPLETIONS_PATH = '/v1/chat/completions'
+
+
+def run(completion_function: Callable[[List[Dict]], Union[AnyStr, None]], num_requests: int, workers: int) -> Dict:
+    """
+    Sends num_requests completion requests concurrently.
+    :param completion_function: function taking messages and returning a response or None
+    :param num_requests: number of requests
+    :param workers: number of concurrent requests
+    :return: dict with the number of 'successes' and the 'elapsed' seconds
+    """
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        responses = list(executor.map(
+            lambda i: completion_function([user_message("Request {0}".format(i))]),
+            range(num_requests)
+        ))
+    return {
+        'successes': sum(1 for response in responses if response is not None),
+        'elapsed': time.perf_counter() - start
+    }
+
+
+def check_run_search(router: ProviderRouter, mock_url: AnyStr) -> bool:
+    """
+    Runs the search -> cluster -> recommend flow with a router instance as the LLM.
+    :param router: router
+    :param mock_url: base URL of the mock server serving the recorded search and embeddings
+    :return: True if every cluster got a recommendation
+    """
+    configure(openai_api_key='mock', serpapi_key='mock')
+    serpapi.SERPAPI_JSON_URL = mock_url + '/search.json'
+    openai.OPENAI_EMBEDDINGS_URL = mock_url + '/v1/embeddings'
+    results = workflow.run_search(
+        search=BENCHMARK_SEARCH,
+        llm=router,
+        embed_function=openai.embeddings,
+        num_clusters=3
+    )
+    recommendations = results['recommendations']
+    print("run_search with a ProviderRouter: {0} of {1} recommendation(s)".format(
+        sum(1 for recommendation in recommendations if recommendation['llm_recommendations'] is not None),
+        len(recommendations)
+    ))
+    return bool(recommendations) and all(
+        recommendation['llm_recommendations'] is not None for recommendation in recommendations
+    )
+
+
+def check_not_found() -> bool:
+    """
+    Checks that a provider answering 404 (e.g. a model it doesn't have) is failed over, with each provider sent the
+    prompts of its own module.
+    :return: True if every request is answered by the other provider
+    """
+    with MockServer(error_rate=1., error_status=404) as not_found, MockServer() as other:
+        router = ProviderRouter(
+            [
+                Provider('not_found', not_found.url + COMPLETIONS_PATH, 'mock', 'mock-missing', weight=1e6),
+                Provider('other', other.url + COMPLETIONS_PATH, 'mock', 'mock-other', weight=1e-6, prompts=mistral)
+            ],
+            cooldown=0.,
+            seed=0
+        )
+        responses = [router.make_seo_recommendations(BENCHMARK_SEARCH, ['dog', 'grooming']) for _ in range(5)]
+    stats = router.stats()
+    ok = all(response is not None for response in responses) and stats['not_found']['statuses'] == {'404': 5} and \
+        stats['other']['successes'] == 5
+    print("404 responses fail over: {0}".format(ok))
+    return ok
+
+
+def check_rejected() -> bool:
+    """
+    Checks that requests the provider refuses (400) are neither retried elsewhere nor count against its health.
+    :return: True if the provider stays healthy and the other provider isn't tried
+    """
+    with MockServer(error_rate=1., error_status=400) as rejecting, MockServer() as other:
+        router = ProviderRouter(
+            [
+                Provider('rejecting', rejecting.url + COMPLETIONS_PATH, 'mock', 'mock-rejecting', weight=1e6),
+                Provider('other', other.url + COMPLETIONS_PATH, 'mock', 'mock-other', weight=1e-6)
+            ],
+            seed=0
+        )
+        responses = [router.completions(messages=[user_message("Bad request")]) for _ in range(5)]
+    stats = router.stats()
+    ok = all(response is None for response in responses) and stats['rejecting']['healthy'] and \
+        stats['rejecting']['failures'] == 0 and stats['rejecting']['statuses'] == {'400': 5} and \
+        stats['other']['requests'] == 0
+    print("400 responses leave the provider healthy: {0}".format(ok))
+    return ok
+
+
+def main(num_requests: int, workers: int, error_rate: float, with_down: bool) -> None:
+    """
+    Runs the single-provider baseline and the routed requests, and prints the results.
+    :param num_requests: number of requests per run
+    :param workers: number of concurrent requests
+    :param error_rate: fraction of requests the flaky provider answers with 429
+    :param with_down: if True, adds a provider that answers every request with 503
+    :return: None
+    """
+    with MockServer(latency=0.01, error_rate=error_rate, error_status=429, seed=1) as flaky, \
+            MockServer(latency=0.04, seed=2) as slow, \
+            MockServer(error_rate=1., error_status=503, seed=3) as down:
+        baseline = run(
+            lambda messages: get_completions(
+                messages=messages,
+                api_key='mock',
+                completions_url=flaky.url + COMPLETIONS_PATH,
+                model='mock-flaky'
+            ),
+            num_requests,
+            workers
+        )
+        providers = [
+            Provider('flaky', flaky.url + COMPLETIONS_PATH, 'mock', 'mock-flaky', weight=2.),
+            Provider('slow', slow.url + COMPLETIONS_PATH, 'mock', 'mock-slow')
+        ]
+        if with_down:
+            providers.append(Provider('down', down.url + COMPLETIONS_PATH, 'mock', 'mock-down'))
+        router = ProviderRouter(providers, cooldown=0.05, max_cooldown=1., seed=0)
+        routed = run(lambda messages: router.completions(messages=messages), num_requests, workers)
+        workflow_ok = check_run_search(router, slow.url)
+    not_found_ok = check_not_found()
+    rejected_ok = check_rejected()
+    print("{0:<10} {1:>10} {2:>10}".format('run', 'success', 'time (s)'))
+    for name, result in (('baseline', baseline), ('routed', routed)):
+        print("{0:<10} {1:>9.1%} {2:>10.2f}".format(name, result['successes'] / num_requests, result['elapsed']))
+    print(json.dumps(router.stats(), indent=2))
+    if routed['successes'] < num_requests or not workflow_ok or not not_found_ok or not rejected_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='router.py',
+        description='Checks provider routing and failover against mock endpoints'
+    )
+    parser.add_argument('--requests', type=int, default=200, help='Number of requests per run')
+    parser.add_argument('--workers', type=int, default=8, help='Number of concurrent requests')
+    parser.add_argument('--error_rate', type=float, default=0.3, help='Fraction of 429s from the flaky provider')
+    parser.add_argument('--down', help='If specified, adds a provider that is down', action='store_true')
+    args = parser.parse_args()
+    main(num_requests=args.requests, workers=args.workers, error_rate=args.error_rate, with_down=args.down)
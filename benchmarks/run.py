@@ -0,0 +1,268 @@
+"""
+run - offline benchmark suite: times each stage and the end-to-end flows on the recorded corpus, against the mock
+server, at several corpus sizes. Results are saved as JSON so runs can be compared across commits.
+
+    python benchmarks/run.py -o results.json
+    python benchmarks/run.py -o new.json --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_server import CORPUS_DIR, MockServer
+from simsites import cluster
+from simsites.config import configure
+import simsites.llm.openai as openai
+from simsites.util import serpapi, vector_store
+from simsites.util.text_cleaner import strip_site, split_site
+
+BENCHMARK_SEARCH = 'dog grooming near me'
+CLIENT_PAGE = 'pawfect-grooming.html'
+RECOMMENDATIONS = [
+    "Add customer testimonials and reviews to your homepage.",
+    "Make it easy to schedule service with a clear booking link.",
+    "List the ZIP codes and neighborhoods you serve.",
+    "Publish your prices for each service and dog size.",
+    "Answer frequently asked questions about grooming.",
+]
+
+
+def load_pages(num_pages: int) -> List[AnyStr]:
+    """
+    Loads num_pages pages of HTML by cycling through the recorded corpus. Repeated pages get a distinguishing line so
+    that larger corpora aren't exact copies of smaller ones.
+    :param num_pages: number of pages to return
+    :return: list of HTML sources
+    """
+    html_dir = os.path.join(CORPUS_DIR, 'html')
+    recorded = list()
+    for fname in sorted(os.listdir(html_dir)):
+        with open(os.path.join(html_dir, fname), encoding='utf-8') as fidin:
+            recorded.append(fidin.read())
+    pages = list()
+    for i in range(num_pages):
+        page = recorded[i % len(recorded)]
+        if i >= len(recorded):
+            page = page.replace('<body>', '<body>\n  <div>Location #{0}</div>'.format(i), 1)
+        pages.append(page)
+    return pages
+
+
+def bench(func: Callable[[], Any], repeat: int) -> List[float]:
+    """
+    Times repeated calls of a function.
+    :param func: function to time
+    :param repeat: number of calls
+    :return: list of durations in seconds
+    """
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def git_commit() -> Union[AnyStr, None]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_stages(size: int, embed_function: Callable, repeat: int) -> List[Dict[AnyStr, Any]]:
+    """
+    Times the individual stages on a corpus of the given size.
+    :param size: number of pages
+    :param embed_function: embed function to benchmark
+    :param repeat: number of repetitions per stage
+    :return: list of results
+    """
+    pages = load_pages(size)
+    texts = [strip_site(page) for page in pages]
+    lines = [line for text in texts for line in split_site(text)]
+    clustered = cluster.cluster_sites(site_sources=pages, embed_function=embed_function)
+    store = vector_store.NNVectorStore(embed_function=embed_function, index='numpy')
+    store.add_texts(lines)
+    cases = {
+        'strip_site': lambda: [strip_site(page) for page in pages],
+        'split_site': lambda: [split_site(text) for text in texts],
+        'split_site_segment': lambda: [split_site(text, segment=True) for text in texts],
+        'generate_embeddings': lambda: embed_function(lines),
+        'cluster_sites': lambda: cluster.cluster_sites(site_sources=pages, embed_function=embed_function),
+        'top_keywords': lambda: cluster.top_keywords(clusters=clustered['clusters'], sentences=clustered['lines']),
+        'vector_store_add_numpy': lambda: vector_store.NNVectorStore(
+            embed_function=embed_function, index='numpy'
+        ).add_texts(lines),
+        'vector_store_add_sklearn': lambda: vector_store.NNVectorStore(
+            embed_function=embed_function, index='sklearn'
+        ).add_texts(lines),
+        'vector_store_query': lambda: store.get_relevant_texts_batch(queries=RECOMMENDATIONS, k=5),
+    }
+    results = list()
+    for name, func in cases.items():
+        results.append(summarize(name, size, bench(func, repeat), lines=len(lines)))
+    return results
+
+
+def run_end_to_end(mock_url: AnyStr, embed_function: Callable, repeat: int) -> List[Dict[AnyStr, Any]]:
+    """
+    Times the flows of the example scripts against the mock server.
+    :param mock_url: base URL of the mock server
+    :param embed_function: embed function to benchmark
+    :param repeat: number of repetitions per flow
+    :return: list of results
+    """
+    def search_keywords():
+        sites = serpapi.fetch_results(search=BENCHMARK_SEARCH)
+        clustered = cluster.cluster_sites(site_sources=sites, embed_function=embed_function)
+        for top_set in cluster.top_keywords(clusters=clustered['clusters'], sentences=clustered['lines']):
+            openai.make_seo_recommendations(keywords=top_set, search=BENCHMARK_SEARCH)
+
+    def check_seo_recs():
+        site_src = serpapi.fetch_result({'link': mock_url + '/pages/' + CLIENT_PAGE, 'snippet': ''})
+        store = vector_store.NNVectorStore(embed_function=embed_function, index='numpy')
+        store.add_texts(split_site(strip_site(site_src)))
+        excerpts = store.get_relevant_texts(query=RECOMMENDATIONS[0])
+        openai.check_seo_recommendation(
+            search=BENCHMARK_SEARCH,
+            recommendation=RECOMMENDATIONS[0],
+            most_relevant_excerpts=excerpts
+        )
+
+    return [
+        summarize('e2e_search_keywords', None, bench(search_keywords, repeat)),
+        summarize('e2e_check_seo_recs', None, bench(check_seo_recs, repeat))
+    ]
+
+
+def summarize(name: AnyStr, size: Union[int, None], times: List[float], **extra) -> Dict[AnyStr, Any]:
+    result = {
+        'benchmark': name,
+        'size': size,
+        'repeat': len(times),
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'mean_s': statistics.mean(times),
+        'times_s': times
+    }
+    result.update(extra)
+    print("{0:<28} {1:>6} {2:>12.4f} {3:>12.4f}".format(name, size if size else '-', result['min_s'],
+                                                         result['median_s']))
+    return result
+
+
+def compare(results: List[Dict[AnyStr, Any]], baseline_fname: AnyStr):
+    """
+    Prints the ratio of each benchmark's median time to the same benchmark in a previous run.
+    :param results: results of this run
+    :param baseline_fname: JSON results of a previous run
+    :return: None
+    """
+    with open(baseline_fname) as fidin:
+        baseline = {(r['benchmark'], r['size']): r for r in json.load(fidin)['results']}
+    print()
+    print("{0:<28} {1:>6} {2:>12} {3:>12} {4:>8}".format('benchmark', 'size', 'baseline', 'current', 'ratio'))
+    for result in results:
+        previous = baseline.get((result['benchmark'], result['size']))
+        if previous:
+            print("{0:<28} {1:>6} {2:>12.4f} {3:>12.4f} {4:>8.2f}".format(
+                result['benchmark'],
+                result['size'] if result['size'] else '-',
+                previous['median_s'],
+                result['median_s'],
+                result['median_s'] / previous['median_s'] if previous['median_s'] else float('nan')
+            ))
+
+
+def main(
+        sizes: List[int],
+        repeat: int,
+        latency: float,
+        local_embed: bool = False,
+        output_fname: AnyStr = None,
+        baseline_fname: AnyStr = None
+) -> None:
+    """
+    Runs the benchmark suite.
+    :param sizes: corpus sizes (number of pages) to benchmark the stages at
+    :param repeat: number of repetitions of each benchmark
+    :param latency: latency in seconds added to every mock API response
+    :param local_embed: if True, benchmarks the local embeddings model. If False (default), uses the LLM embeddings API
+    served by the mock server.
+    :param output_fname: if specified, saves the results to a JSON file.
+    :param baseline_fname: if specified, compares the results with a previous run.
+    :return: None
+    """
+    # The mock server accepts any API key
+    configure(openai_api_key='mock', mistral_api_key='mock', serpapi_key='mock')
+    with MockServer(latency=latency) as mock:
+        serpapi.SERPAPI_JSON_URL = mock.url + '/search.json'
+        openai.OPENAI_COMPLETIONS_URL = mock.url + '/v1/chat/completions'
+        openai.OPENAI_EMBEDDINGS_URL = mock.url + '/v1/embeddings'
+        if local_embed:
+            from simsites.util.embed import generate_embeddings
+            embed_function = generate_embeddings
+        else:
+            embed_function = openai.embeddings
+        print("{0:<28} {1:>6} {2:>12} {3:>12}".format('benchmark', 'size', 'min (s)', 'median (s)'))
+        results = list()
+        for size in sizes:
+            results.extend(run_stages(size, embed_function, repeat))
+        results.extend(run_end_to_end(mock.url, embed_function, repeat))
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'local_embed': local_embed,
+            'mock_latency_s': latency
+        },
+        'results': results
+    }
+    if output_fname:
+        with open(output_fname, 'w') as fidout:
+            json.dump(output, fidout, indent=2)
+        print("Results saved to '{0}'".format(output_fname))
+    if baseline_fname:
+        compare(results, baseline_fname)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='run.py',
+        description='Offline benchmark suite using the recorded corpus and the mock LLM server'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 25, 100], help='Corpus sizes in pages')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions per benchmark')
+    parser.add_argument('--latency_ms', type=float, default=0., help='Latency added to mock API responses (ms)')
+    parser.add_argument(
+        '--local_embed',
+        help='If specified, benchmarks the local embedding model rather than the (mock) LLM API.',
+        action='store_true'
+    )
+    parser.add_argument('-o', '--output', help='Specify an output file', required=False)
+    parser.add_argument('--compare', help='Compare with the results of a previous run', required=False)
+    args = parser.parse_args()
+    main(
+        sizes=args.sizes,
+        repeat=args.repeat,
+        latency=args.latency_ms / 1000.,
+        local_embed=args.local_embed,
+        output_fname=args.output,
+        baseline_fname=args.compare
+    )
@@ -0,0 +1,112 @@
+"""
+sanitize - checks that "sanitize_text_fast" returns the same text as "sanitize_text" and compares their speed, on the
+text of the recorded corpus and on generated text mixing clean ASCII with the characters cleaning changes.
+
+    python benchmarks/sanitize.py --pages 100
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from typing import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run import load_pages
+from simsites.util import text_cleaner
+
+TRICKY_FRAGMENTS = [
+    'Bath & Brush', '&amp;', '&#169;', 'caf\u00e9', 'na\u00efve', '\u201cquoted\u201d', 'it\u2019s', '`tick`',
+    ':thumbsup:', 'see :) and :D', '\u2014', '\u00a0', '\t', '\r', '\r\n', '\x0b', '\u2028', '\u00c3\u00a9', 'C:\\path',
+    '\\n', '<b>', '9:00 - 5:00', '\U0001F436', '\u00fcber', '\u00df', '\u0416\u0443\u043a', '\u4e2d\u6587', '  ', '\n\n'
+]
+
+
+def get_texts(num_pages: int) -> List[AnyStr]:
+    """
+    Extracts the raw (unsanitized) text of num_pages pages of the recorded corpus.
+    :param num_pages: number of pages
+    :return: list of texts
+    """
+    return [text_cleaner.strip_site(page, sanitize=False) for page in load_pages(num_pages)]
+
+
+def generate_texts(num_texts: int, seed: int = 0) -> List[AnyStr]:
+    """
+    Generates texts mixing plain words with fragments that sanitizing changes.
+    :param num_texts: number of texts
+    :param seed: random seed
+    :return: list of texts
+    """
+    rng = random.Random(seed)
+    words = ['dog', 'grooming', 'Book now', 'Prices', 'Reviews', '$25', 'Call (555) 010-2000', '.', '!']
+    texts = list()
+    for _ in range(num_texts):
+        parts = list()
+        for _ in range(rng.randint(5, 60)):
+            parts.append(rng.choice(TRICKY_FRAGMENTS) if rng.random() < 0.2 else rng.choice(words))
+            parts.append(rng.choice([' ', ' ', '\n', '  ', '\n\n']))
+        texts.append(''.join(parts))
+    return texts
+
+
+def check(texts: List[AnyStr]) -> int:
+    """
+    Compares the output of both functions.
+    :param texts: texts to sanitize
+    :return: number of texts with different output
+    """
+    mismatches = 0
+    for text in texts:
+        expected = text_cleaner.sanitize_text(text)
+        actual = text_cleaner.sanitize_text_fast(text)
+        if expected != actual:
+            mismatches += 1
+            print("Mismatch for {0!r}:\n  expected {1!r}\n  actual   {2!r}".format(text[:80], expected[:80], actual[:80]))
+    return mismatches
+
+
+def bench(func: Callable[[AnyStr], AnyStr], texts: List[AnyStr], repeat: int) -> float:
+    times = list()
+    for _ in range(repeat):
+        text_cleaner.sanitize_line.cache_clear()
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main(num_pages: int, num_generated: int, repeat: int) -> None:
+    """
+    Checks and benchmarks the fast sanitizer.
+    :param num_pages: number of corpus pages
+    :param num_generated: number of generated texts
+    :param repeat: number of repetitions of each timing
+    :return: None
+    """
+    corpus = get_texts(num_pages)
+    generated = generate_texts(num_generated)
+    mismatches = check(corpus) + check(generated)
+    print("{0} mismatch(es) in {1} text(s)".format(mismatches, len(corpus) + len(generated)))
+    print("{0:<12} {1:>16} {2:>20} {3:>8}".format('texts', 'sanitize_text (s)', 'sanitize_text_fast (s)', 'speedup'))
+    for name, texts in (('corpus', corpus), ('generated', generated)):
+        slow = bench(text_cleaner.sanitize_text, texts, repeat)
+        fast = bench(text_cleaner.sanitize_text_fast, texts, repeat)
+        print("{0:<12} {1:>16.4f} {2:>20.4f} {3:>7.1f}x".format(name, slow, fast, slow / fast if fast else float('nan')))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='sanitize.py',
+        description='Checks and benchmarks sanitize_text_fast against sanitize_text'
+    )
+    parser.add_argument('--pages', type=int, default=100, help='Number of corpus pages')
+    parser.add_argument('--generated', type=int, default=500, help='Number of generated texts')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions per timing')
+    args = parser.parse_args()
+    main(num_pages=args.pages, num_generated=args.generated, repeat=args.repeat)
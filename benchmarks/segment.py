@@ -0,0 +1,99 @@
+"""
+segment - checks that "segment_site" keeps every segment between min_chars and max_chars (no segment shorter than
+min_chars unless the whole text is), on the text of the recorded corpus and on generated text mixing menu-like short
+lines with long paragraphs.
+
+    python benchmarks/segment.py --pages 100
+"""
+import argparse
+import os
+import random
+import sys
+from typing import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run import load_pages
+from simsites.util import text_cleaner
+
+SHORT_LINES = ['Home', 'About', 'Contact', 'Book now', '$25', 'Prices', 'Reviews', 'x', 'Call (555) 010-2000']
+WORDS = ['dog', 'grooming', 'bath', 'nail', 'trim', 'our', 'team', 'loves', 'pets', 'and', 'the', 'salon', 'brush',
+         'supercalifragilisticexpialidocious']
+
+
+def generate_texts(num_texts: int, seed: int = 0) -> List[AnyStr]:
+    """
+    Generates texts mixing short lines with sentences and paragraphs of every length up to several windows.
+    :param num_texts: number of texts
+    :param seed: random seed
+    :return: list of texts
+    """
+    rng = random.Random(seed)
+    texts = ["Home\nAbout\nContact\n" + ' '.join(['Long paragraph about grooming.'] * 40) + "\nx"]
+    for _ in range(num_texts):
+        lines = list()
+        for _ in range(rng.randint(1, 30)):
+            if rng.random() < 0.6:
+                lines.append(rng.choice(SHORT_LINES))
+            else:
+                sentences = [
+                    ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 120))) + rng.choice(['.', '!', '?', ''])
+                    for _ in range(rng.randint(1, 8))
+                ]
+                lines.append(' '.join(sentences))
+        texts.append('\n'.join(lines))
+    return texts
+
+
+def check(texts: List[AnyStr], min_chars: int, max_chars: int) -> int:
+    """
+    Segments each text and checks the segment lengths.
+    :param texts: texts to segment
+    :param min_chars: minimum segment length
+    :param max_chars: maximum segment length
+    :return: number of texts with a segment out of bounds
+    """
+    failures = 0
+    for text in texts:
+        segments = text_cleaner.segment_site(text, min_chars=min_chars, max_chars=max_chars)
+        whole_text_short = len(segments) == 1 and len(segments[0]) < min_chars
+        bad = [
+            segment for segment in segments
+            if len(segment) > max_chars or (len(segment) < min_chars and not whole_text_short)
+        ]
+        if bad:
+            failures += 1
+            print("Segments out of [{0}, {1}] for {2!r}: {3}".format(
+                min_chars,
+                max_chars,
+                text[:60],
+                [(len(segment), segment[:40]) for segment in bad]
+            ))
+    return failures
+
+
+def main(num_pages: int, num_generated: int) -> None:
+    """
+    Checks segment lengths with the default and with smaller bounds.
+    :param num_pages: number of corpus pages
+    :param num_generated: number of generated texts
+    :return: None
+    """
+    texts = [text_cleaner.strip_site(page) for page in load_pages(num_pages)] + generate_texts(num_generated)
+    failures = 0
+    for min_chars, max_chars in ((text_cleaner.SEGMENT_MIN_CHARS, text_cleaner.SEGMENT_MAX_CHARS), (20, 100)):
+        failures += check(texts, min_chars, max_chars)
+    print("{0} failure(s) in {1} text(s)".format(failures, 2 * len(texts)))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='segment.py',
+        description='Checks the segment lengths of segment_site'
+    )
+    parser.add_argument('--pages', type=int, default=100, help='Number of corpus pages')
+    parser.add_argument('--generated', type=int, default=500, help='Number of generated texts')
+    args = parser.parse_args()
+    main(num_pages=args.pages, num_generated=args.generated)
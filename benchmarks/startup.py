@@ -0,0 +1,78 @@
+"""
+startup - benchmarks process startup: time to import the simsites modules and to run the example scripts' --help, and
+which heavy dependencies each one loads. Run with no API keys set to check that nothing requires them at import time.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import *
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['torch', 'sentence_transformers', 'sklearn', 'bs4', 'cleantext', 'duckduckgo_search']
+IMPORT_CASES = [
+    'simsites.cluster',
+    'simsites.pipeline',
+    'simsites.util.vector_store',
+    'simsites.util.serpapi',
+    'simsites.llm.openai',
+    'simsites.llm.mistral',
+]
+SCRIPT_CASES = [
+    os.path.join('examples', 'search_keywords.py'),
+    os.path.join('examples', 'check_seo_recs.py'),
+]
+
+
+def run(args: List[AnyStr], env: Dict[AnyStr, AnyStr]) -> Tuple[float, subprocess.CompletedProcess]:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, capture_output=True, text=True, cwd=ROOT_DIR, env=env)
+    return time.perf_counter() - start, result
+
+
+def main(repeat: int = 5, output_fname: AnyStr = None) -> None:
+    """
+    Times fresh interpreter startups.
+    :param repeat: number of runs per case; the median is reported
+    :param output_fname: if specified, saves the results to a JSON file.
+    :return: None
+    """
+    env = {k: v for k, v in os.environ.items() if k not in ('OPENAI_API_KEY', 'MISTRAL_API_KEY', 'SERPAPI_KEY')}
+    env['PYTHONPATH'] = os.pathsep.join([ROOT_DIR] + [p for p in [os.environ.get('PYTHONPATH')] if p])
+    cases = [('python -c pass', ['-c', 'pass'])]
+    probe = "import sys, {0}; print(','.join(m for m in {1} if m in sys.modules))"
+    cases.extend(('import ' + module, ['-c', probe.format(module, HEAVY_MODULES)]) for module in IMPORT_CASES)
+    cases.extend((script + ' --help', [script, '--help']) for script in SCRIPT_CASES)
+    results = list()
+    print("{0:<45} {1:>12}  {2}".format('case', 'median (s)', 'heavy modules loaded'))
+    for name, args in cases:
+        times = list()
+        output = None
+        for _ in range(repeat):
+            elapsed, output = run(args, env)
+            times.append(elapsed)
+        if output.returncode != 0:
+            print("{0:<45} failed: {1}".format(name, output.stderr.strip().splitlines()[-1:]))
+            results.append({'case': name, 'error': output.stderr})
+            continue
+        heavy = output.stdout.strip() if name.startswith('import') else ''
+        print("{0:<45} {1:>12.3f}  {2}".format(name, statistics.median(times), heavy or '-'))
+        results.append({'case': name, 'median_s': statistics.median(times), 'times_s': times, 'heavy_modules': heavy})
+    if output_fname:
+        with open(output_fname, 'w') as fidout:
+            json.dump(results, fidout, indent=2)
+        print("Results saved to '{0}'".format(output_fname))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='startup.py',
+        description='Benchmarks interpreter startup and import times'
+    )
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Runs per case')
+    parser.add_argument('-o', '--output', help='Specify an output file', required=False)
+    args = parser.parse_args()
+    main(repeat=args.repeat, output_fname=args.output)
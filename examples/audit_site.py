@@ -0,0 +1,169 @@
+"""
+audit_site - demonstrates checking a site against all the recommendations from a search_keywords.py run
+"""
+import argparse
+import json
+import os
+import sys
+from typing import *
+import time
+
+import requests
+
+# Uncomment this import to use Mistral AI
+# import simsites.llm.mistral as mistral
+# Uncomment this import to use OpenAI
+import simsites.llm.openai as openai
+from simsites import audit
+import logging
+
+from check_seo_recs import create_vector_store, crawl_vector_store, load_vector_store
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+def main(
+        search_results: Dict[AnyStr, Any],
+        site_src: AnyStr,
+        local_embed: bool = True,
+        output_fname: AnyStr = None,
+        index_dir: AnyStr = None,
+        site_url: AnyStr = None,
+        max_pages: int = 50,
+        k: int = 5,
+        batch_size: int = 5
+) -> None:
+    """
+    Checks a website's contents against every recommendation made for a web search.
+    :param search_results: output of search_keywords.py
+    :param site_src: HTML source of the site to audit. Ignored if a snapshot is loaded from index_dir.
+    :param local_embed: if True (default), uses local embeddings models. If False, uses LLM embeddings API.
+    :param output_fname: if specified, saves the results to a JSON file.
+    :param index_dir: if specified, loads the site's vector store from this folder if it exists, otherwise builds the
+    vector store and saves it there.
+    :param site_url: if specified, crawls the site at this URL instead of using site_src.
+    :param max_pages: maximum number of pages to crawl when site_url is specified, defaults to 50.
+    :param k: number of site excerpts retrieved per recommendation, defaults to 5.
+    :param batch_size: number of recommendations checked per LLM call, defaults to 5.
+    :return: None
+    """
+    start = time.time()
+    recommendations = audit.load_recommendations(search_results)
+    logging.info("Checking {0} recommendation(s)".format(len(recommendations)))
+    if index_dir and os.path.exists(index_dir):
+        logging.info("Loading site index from {0}".format(index_dir))
+        site_vector_store = load_vector_store(index_dir, local_embed=local_embed)
+    else:
+        if site_url:
+            site_vector_store = crawl_vector_store(site_url, local_embed=local_embed, max_pages=max_pages)
+        else:
+            site_vector_store = create_vector_store(site_src, local_embed=local_embed)
+        if index_dir:
+            site_vector_store.save(index_dir)
+            logging.info("Site index saved to {0}".format(index_dir))
+    final_results = audit.audit_site(
+        search=search_results['search'],
+        recommendations=recommendations,
+        site_vector_store=site_vector_store,
+        llm=openai,
+        k=k,
+        batch_size=batch_size
+    )
+    for result in final_results['results']:
+        print("Recommendation:")
+        print(result['recommendation'])
+        print("Implemented: {0}".format(result['implemented']))
+        print(result['assessment'])
+        if result['suggestions']:
+            print(result['suggestions'])
+        print('- - -' * 10)
+    elapsed = str(time.time() - start)
+    print("Audited {0} recommendation(s) with {1} LLM call(s)".format(
+        len(final_results['results']),
+        final_results['llm_calls']
+    ))
+    print("Total audit runtime {0}".format(elapsed))
+    final_results['runtime'] = elapsed
+    if output_fname:
+        with open(output_fname, 'w') as fidout:
+            json.dump(final_results, fidout, indent=2)
+        print("Results saved to '{0}'".format(output_fname))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='audit_site.py',
+        description='Demonstrates checking a site against all the recommendations for a search'
+    )
+    parser.add_argument(
+        '-i',
+        '--input',
+        help='Output of search_keywords.py with the recommendations to check',
+        required=True
+    )
+    parser.add_argument(
+        '-u',
+        '--url',
+        help='URL of the site to audit (include http[s]). Not needed if --index_dir already holds the site index.',
+        required=False
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        help='Specify an output file',
+        required=False
+    )
+    parser.add_argument(
+        '--local_embed',
+        help='If specified, uses local embedding model rather than LLM API call.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--index_dir',
+        help='If specified, reuses the site index saved in this folder, or saves the site index there if not found.',
+        required=False
+    )
+    parser.add_argument(
+        '--crawl',
+        help='If specified, crawls the site (sitemap and same-site links) rather than fetching only the URL.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--max_pages',
+        help='Maximum number of pages to crawl (defaults to 50)',
+        type=int,
+        default=50
+    )
+    parser.add_argument(
+        '--batch_size',
+        help='Number of recommendations checked per LLM call (defaults to 5)',
+        type=int,
+        default=5
+    )
+    args = parser.parse_args()
+    with open(args.input) as fidin:
+        search_keywords_results = json.load(fidin)
+    site_as_text = None
+    if not (args.index_dir and os.path.exists(args.index_dir)):
+        if not args.url:
+            logging.error("A site URL is required unless --index_dir holds a saved site index, aborting!")
+            sys.exit(1)
+        if not args.crawl:
+            logging.info("Fetching {0}...".format(args.url))
+            r = requests.get(args.url, timeout=60)
+            if r.status_code == 200:
+                site_as_text = r.text
+            else:
+                logging.error(f"Received status code {r.status_code}, aborting!")
+                sys.exit(1)
+    main(
+        search_results=search_keywords_results,
+        site_src=site_as_text,
+        local_embed=args.local_embed,
+        output_fname=args.output,
+        index_dir=args.index_dir,
+        site_url=args.url if args.crawl else None,
+        max_pages=args.max_pages,
+        batch_size=args.batch_size
+    )
@@ -0,0 +1,142 @@
+"""
+batch_recommendations - demonstrates making the recommendations for many searches at once with a batch of LLM requests
+"""
+import argparse
+import json
+from typing import *
+import time
+
+# Uncomment this import to use Mistral AI
+# import simsites.llm.mistral as mistral
+# Uncomment this import to use OpenAI
+import simsites.llm.openai as openai
+from simsites import workflow
+from simsites.config import get_config
+from simsites.llm import batch
+from simsites.util import embed
+from simsites.util.checkpoint import CheckpointStore
+import logging
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+def main(
+        searches: List[AnyStr],
+        client: Union[batch.BatchClient, batch.LocalBatchClient],
+        workdir: AnyStr,
+        local_embed: bool = True,
+        checkpoint_dir: AnyStr = None,
+        poll_interval: float = 60.,
+        output_fname: AnyStr = None
+) -> List[Dict[AnyStr, Any]]:
+    """
+    Clusters the top results of each search, then asks the LLM for recommendations on every cluster of every search
+    in a single batch.
+    :param searches: web searches to optimize
+    :param client: batch client
+    :param workdir: folder for the batch input and output files
+    :param local_embed: if True (default), use a local model to generate embeddings. If False, uses an LLM API call.
+    :param checkpoint_dir: if specified, reuses the fetched and clustered results saved in this folder.
+    :param poll_interval: seconds between two checks of the batch's status
+    :param output_fname: if specified, writes the results to this file.
+    :return: list with one result per search, in the same form as search_keywords.py output.
+    """
+    start = time.time()
+    checkpoints = CheckpointStore(checkpoint_dir) if checkpoint_dir else None
+    final_results = list()
+    requests = list()
+    for i, search in enumerate(searches):
+        logging.info("Clustering results for '{0}'".format(search))
+        search_results = workflow.run_search(
+            search=search,
+            llm=openai,
+            embed_function=embed.generate_embeddings if local_embed else openai.embeddings,
+            checkpoints=checkpoints,
+            recommend=False
+        )
+        for j, recommendation in enumerate(search_results['recommendations']):
+            requests.append(batch.make_request(
+                custom_id='{0}-{1}'.format(i, j),
+                messages=openai.seo_recommendations_messages(search=search, keywords=recommendation['cluster_keywords']),
+                model=openai.DEFAULT_MODEL
+            ))
+        final_results.append(search_results)
+    responses = batch.run_batch(requests, client=client, workdir=workdir, poll_interval=poll_interval)
+    for i, search_results in enumerate(final_results):
+        for j, recommendation in enumerate(search_results['recommendations']):
+            recommendation['llm_recommendations'] = responses.get('{0}-{1}'.format(i, j))
+    print("Received {0} of {1} recommendation(s) for {2} search(es)".format(
+        sum(1 for response in responses.values() if response is not None),
+        len(requests),
+        len(searches)
+    ))
+    print("Total batch runtime {0}".format(time.time() - start))
+    if output_fname:
+        with open(output_fname, 'w') as fidout:
+            json.dump(final_results, fidout, indent=2)
+        print("Results saved to '{0}'".format(output_fname))
+    return final_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='batch_recommendations.py',
+        description='Demonstrates batch recommendations for many searches'
+    )
+    parser.add_argument(
+        '-i',
+        '--input',
+        help='File with one search per line',
+        required=True
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        help='Specify an output file',
+        required=False
+    )
+    parser.add_argument(
+        '--workdir',
+        help='Folder for the batch input and output files (defaults to "batches")',
+        default='batches'
+    )
+    parser.add_argument(
+        '--local_batch',
+        help='If specified, runs the batch locally with regular LLM API calls instead of the batch endpoint.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--poll_interval',
+        help='Seconds between two checks of the batch status (defaults to 60)',
+        type=float,
+        default=60.
+    )
+    parser.add_argument(
+        '--local_embed',
+        help='If specified, uses local embedding model rather than LLM API call.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--checkpoint_dir',
+        help='If specified, saves the output of each stage to this folder and resumes from it on the next run.',
+        required=False
+    )
+    args = parser.parse_args()
+    with open(args.input) as fidin:
+        input_searches = [line.strip() for line in fidin if line.strip()]
+    if args.local_batch:
+        batch_client = batch.LocalBatchClient(
+            root=args.workdir,
+            completion_function=lambda body: openai.completions(**body)
+        )
+    else:
+        batch_client = batch.BatchClient(api_key=get_config().get('openai_api_key'))
+    main(
+        searches=input_searches,
+        client=batch_client,
+        workdir=args.workdir,
+        local_embed=args.local_embed,
+        checkpoint_dir=args.checkpoint_dir,
+        poll_interval=0. if args.local_batch else args.poll_interval,
+        output_fname=args.output
+    )
@@ -3,6 +3,7 @@ check_seo_recs - demonstrates checking a site against an SEO recommendation
 """
 import argparse
 import json
+import os
 import sys
 from typing import *
 import time
@@ -13,7 +14,7 @@ import requests
 # import simsites.llm.mistral as mistral
 # Uncomment this import to use OpenAI
 import simsites.llm.openai as openai
-from simsites.util import embed, vector_store
+from simsites.util import crawler, embed, vector_store
 import logging
 
 from simsites.util.text_cleaner import strip_site, split_site
@@ -35,26 +36,74 @@ def create_vector_store(
     site_text = strip_site(site_src)
     site_as_lines = split_site(site_text)
     vs = vector_store.NNVectorStore(
-        embed_function=embed.generate_embeddings if local_embed else openai.embeddings
+        embed_function=embed.generate_embeddings if local_embed else openai.embeddings,
+        index='numpy',
+        model_id=embed.MULTILINGUAL_EMBEDDING_MODEL if local_embed else openai.OPENAI_EMBEDDINGS
     )
     vs.add_texts(site_as_lines)
     return vs
 
 
+def crawl_vector_store(
+        site_url: AnyStr,
+        local_embed: bool = True,
+        max_pages: int = 50
+) -> vector_store.NNVectorStore:
+    """
+    Crawls a site and creates an in-memory vector store representation of the contents of its pages.
+    :param site_url: URL of the site (include http[s])
+    :param local_embed: if True (default), uses local embeddings models. Otherwise uses LLM API.
+    :param max_pages: maximum number of pages to crawl
+    :return: populated vector store
+    """
+    vs = vector_store.NNVectorStore(
+        embed_function=embed.generate_embeddings if local_embed else openai.embeddings,
+        index='numpy',
+        model_id=embed.MULTILINGUAL_EMBEDDING_MODEL if local_embed else openai.OPENAI_EMBEDDINGS
+    )
+    indexed = crawler.index_site(site_url, vs, max_pages=max_pages)
+    logging.info("Indexed {0} line(s) from {1} page(s)".format(len(vs.texts), len(indexed)))
+    return vs
+
+
+def load_vector_store(
+        index_dir: AnyStr,
+        local_embed: bool = True
+) -> vector_store.NNVectorStore:
+    """
+    Loads a vector store snapshot previously saved with "NNVectorStore.save".
+    :param index_dir: folder containing the snapshot
+    :param local_embed: if True (default), uses local embeddings models. Otherwise uses LLM API.
+    :return: populated vector store
+    """
+    return vector_store.NNVectorStore.load(
+        index_dir,
+        embed_function=embed.generate_embeddings if local_embed else openai.embeddings,
+        model_id=embed.MULTILINGUAL_EMBEDDING_MODEL if local_embed else openai.OPENAI_EMBEDDINGS
+    )
+
+
 def main(
         search_to_optimize: AnyStr,
         site_src: AnyStr,
         recommendation: AnyStr,
         local_embed: bool = True,
-        output_fname: AnyStr = None
+        output_fname: AnyStr = None,
+        index_dir: AnyStr = None,
+        site_url: AnyStr = None,
+        max_pages: int = 50
 ) -> None:
     """
     Checks a website's contents against an SEO recommendation for a particular web search.
     :param search_to_optimize: web search to optimize the site against
-    :param site_src: HTML source of the site to optimize
+    :param site_src: HTML source of the site to optimize. Ignored if a snapshot is loaded from index_dir.
     :param recommendation: SEO recommendation for the search in question (i.e. not specific to the site itself)
     :param local_embed: if True (default), uses local embeddings models. If False, uses LLM embeddings API.
     :param output_fname: if specified, saves the results to a JSON file.
+    :param index_dir: if specified, loads the site's vector store from this folder if it exists, otherwise builds the
+    vector store and saves it there.
+    :param site_url: if specified, crawls the site at this URL instead of using site_src.
+    :param max_pages: maximum number of pages to crawl when site_url is specified, defaults to 50.
     :return: None
     """
     start = time.time()
@@ -62,7 +111,17 @@ def main(
         'search': search_to_optimize,
         'recommendation': recommendation
     }
-    site_vector_store = create_vector_store(site_src, local_embed=local_embed)
+    if index_dir and os.path.exists(index_dir):
+        logging.info("Loading site index from {0}".format(index_dir))
+        site_vector_store = load_vector_store(index_dir, local_embed=local_embed)
+    else:
+        if site_url:
+            site_vector_store = crawl_vector_store(site_url, local_embed=local_embed, max_pages=max_pages)
+        else:
+            site_vector_store = create_vector_store(site_src, local_embed=local_embed)
+        if index_dir:
+            site_vector_store.save(index_dir)
+            logging.info("Site index saved to {0}".format(index_dir))
     most_relevant_site_contents = site_vector_store.get_relevant_texts(query=recommendation)
     final_results['most_relevant_site_contents'] = most_relevant_site_contents
     response = openai.check_seo_recommendation(
@@ -105,24 +164,47 @@ if __name__ == "__main__":
         help='If specified, uses local embedding model rather than LLM API call.',
         action='store_true'
     )
+    parser.add_argument(
+        '--index_dir',
+        help='If specified, reuses the site index saved in this folder, or saves the site index there if not found.',
+        required=False
+    )
+    parser.add_argument(
+        '--crawl',
+        help='If specified, crawls the site (sitemap and same-site links) rather than fetching only the URL entered.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--max_pages',
+        help='Maximum number of pages to crawl (defaults to 50)',
+        type=int,
+        default=50
+    )
     args = parser.parse_args()
     if not args.local_embed:
         logging.info("Using remote API embeddings")
     else:
         logging.info("Using local embeddings model")
     search = input("Enter a web search to optimize >> ")
-    url = input("Enter a URL to fetch (include http[s]) >> ")
-    logging.info("Fetching {0}...".format(url))
-    r = requests.get(url, timeout=60)
-    if r.status_code == 200:
-        site_as_text = r.text
-    else:
-        logging.error(f"Received status code {r.status_code}, aborting!")
-        sys.exit(1)
+    site_as_text = None
+    url = None
+    if not (args.index_dir and os.path.exists(args.index_dir)):
+        url = input("Enter a URL to fetch (include http[s]) >> ")
+    if url and not args.crawl:
+        logging.info("Fetching {0}...".format(url))
+        r = requests.get(url, timeout=60)
+        if r.status_code == 200:
+            site_as_text = r.text
+        else:
+            logging.error(f"Received status code {r.status_code}, aborting!")
+            sys.exit(1)
     main(
         search_to_optimize=search,
         site_src=site_as_text,
         recommendation=input("Enter an SEO recommendation to check the site against >> "),
         local_embed=args.local_embed,
-        output_fname=args.output
+        output_fname=args.output,
+        index_dir=args.index_dir,
+        site_url=url if args.crawl else None,
+        max_pages=args.max_pages
     )
@@ -0,0 +1,119 @@
+"""
+portfolio - demonstrates clustering the top sites of several related searches together, to find the themes they share
+and the themes specific to each search.
+"""
+import argparse
+import json
+from typing import *
+import time
+
+import simsites.llm.openai as openai
+from simsites import cluster
+from simsites.util import embed, serpapi
+import logging
+logging.basicConfig()
+logging.getLogger().setLevel(logging.INFO)
+
+
+def main(
+        searches: List[AnyStr],
+        local_embed: bool = True,
+        num_clusters: int = 5,
+        output_fname: AnyStr = None
+) -> None:
+    """
+    Performs each search, clusters the top results of all the searches in one pass and prints the keywords of the
+    largest shared and search-specific clusters.
+    :param searches: related web searches
+    :param local_embed: if True (default), use a local model to generate embeddings. If False, uses an LLM API call.
+    :param num_clusters: number of clusters shown per theme
+    :param output_fname: if specified, writes the results to this file.
+    :return: None
+    """
+    start = time.time()
+    search_sites = {search: serpapi.fetch_sites(search=search) for search in searches}
+    portfolio = cluster.cluster_portfolio(
+        search_sites=search_sites,
+        embed_function=embed.generate_embeddings if local_embed else openai.embeddings
+    )
+    if portfolio is None:
+        return
+    print("Clustered {0} line(s) from {1} distinct site(s) in {2} cluster(s)".format(
+        len(portfolio['lines']),
+        len(portfolio['sites']),
+        len(portfolio['clusters'])
+    ))
+    themes = cluster.portfolio_themes(portfolio)
+    final_results = {
+        'searches': searches,
+        'embedding_model': portfolio['embedding_model'],
+        'shared': list(),
+        'specific': {search: list() for search in searches}
+    }
+    sections = [(None, themes['shared'])]
+    sections.extend((search, themes['specific'].get(search, list())) for search in searches)
+    for search, cluster_idxs in sections:
+        print("Themes shared by several searches:" if search is None else "Themes specific to '{0}':".format(search))
+        top_sets = cluster.top_keywords(
+            clusters=[portfolio['clusters'][i] for i in cluster_idxs],
+            sentences=portfolio['lines'],
+            num_clusters=num_clusters
+        )
+        for i, top_set in zip(cluster_idxs, top_sets):
+            print(','.join([line[:25] for line in top_set]))
+            entry = {
+                'cluster_keywords': top_set,
+                'size': len(portfolio['clusters'][i]),
+                'searches': portfolio['attribution'][i]['searches']
+            }
+            if search is None:
+                final_results['shared'].append(entry)
+            else:
+                final_results['specific'][search].append(entry)
+        print('- - -' * 10)
+    elapsed = str(time.time() - start)
+    print("Total runtime {0}".format(elapsed))
+    final_results['runtime'] = elapsed
+    if output_fname:
+        with open(output_fname, 'w') as fidout:
+            json.dump(final_results, fidout, indent=2)
+        print("Results saved to '{0}'".format(output_fname))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='portfolio.py',
+        description='Demonstrates clustering a portfolio of related searches'
+    )
+    parser.add_argument(
+        '-i',
+        '--input',
+        help='File with one search per line',
+        required=True
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        help='Specify an output file',
+        required=False
+    )
+    parser.add_argument(
+        '--local_embed',
+        help='If specified, uses local embedding model rather than LLM API call.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--num_clusters',
+        help='Number of clusters shown per theme (defaults to 5)',
+        type=int,
+        default=5
+    )
+    args = parser.parse_args()
+    with open(args.input) as fidin:
+        input_searches = [line.strip() for line in fidin if line.strip()]
+    main(
+        searches=input_searches,
+        local_embed=args.local_embed,
+        num_clusters=args.num_clusters,
+        output_fname=args.output
+    )
@@ -5,9 +5,14 @@ import argparse
 import json
 from typing import *
 import time
-from simsites import cluster
+
+import requests
+
+from simsites import cluster, coverage, pipeline, workflow
 import simsites.llm.openai as openai
-from simsites.util import serpapi, embed
+from simsites.util import serpapi, embed, metrics, vector_store
+from simsites.util.checkpoint import CheckpointStore
+from simsites.util.columnar import ColumnarWriter
 import logging
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
@@ -17,7 +22,13 @@ def main(
         search_to_optimize: AnyStr,
         site_sources: List[AnyStr],
         local_embed: bool = True,
-        output_fname: AnyStr = None):
+        output_fname: AnyStr = None,
+        clustered_site_contents: Dict[AnyStr, Any] = None,
+        route_language: bool = False,
+        segment: bool = False,
+        client_site_src: AnyStr = None,
+        coverage_threshold: float = 0.75,
+        columnar_dir: AnyStr = None):
     """
     Runs a demo of the process - given a search, perform the search to retrieve the top 10 search results. Cluster
     the text contents of the sites and return both the most common keywords found in these sites, plus LLM
@@ -26,43 +37,88 @@ def main(
     :param site_sources: source of e.g. the top 10 search results for the site.
     :param local_embed: if True (default), use a local model to generate embeddings. If False, uses an LLM API call.
     :param output_fname: if specified, writes the results to this file.
+    :param clustered_site_contents: if specified, results of clustering the site sources (e.g. from a pipeline run), in
+    which case site_sources is ignored.
+    :param route_language: if True, picks the local embedding model from the language of the sites.
+    :param segment: if True, clusters size-balanced segments of the sites' text rather than individual lines.
+    :param client_site_src: if specified, HTML source of the client's site: clusters the site already covers are
+    reported but not sent to the LLM.
+    :param coverage_threshold: similarity at or above which the client's site covers a cluster, defaults to 0.75.
+    :param columnar_dir: if specified, appends the lines, embeddings, clusters, keywords and LLM responses to the
+    columnar store in this folder.
     :return:
     """
     start = time.time()
-    clustered_site_contents = cluster.cluster_sites(
-        site_sources=site_sources,
-        embed_function=embed.generate_embeddings if local_embed else openai.embeddings
-    )
+    if clustered_site_contents is None:
+        clustered_site_contents = cluster.cluster_sites(
+            site_sources=site_sources,
+            embed_function=embed.generate_embeddings if local_embed else openai.embeddings,
+            route_language=route_language,
+            segment=segment
+        )
     top_5 = cluster.top_keywords(
         clusters=clustered_site_contents['clusters'],
         sentences=clustered_site_contents['lines']
     )
     final_results = {
         'search': search_to_optimize,
+        'embedding_model': clustered_site_contents.get('embedding_model'),
         'recommendations': list()
     }
+    report = None
+    if client_site_src:
+        site_vector_store = vector_store.NNVectorStore(
+            embed_function=embed.local_embed_function(
+                clustered_site_contents['embedding_model']
+            ) if local_embed else openai.embeddings,
+            index='numpy'
+        )
+        site_vector_store.add_texts(cluster.site_lines(client_site_src, segment=segment))
+        report = coverage.coverage_report(
+            clustered=clustered_site_contents,
+            site_vector_store=site_vector_store,
+            num_clusters=len(top_5),
+            coverage_threshold=coverage_threshold
+        )
+        final_results['coverage_report'] = coverage.rank_gaps(report)
     print('Clustering sites complete!')
     print("Here are the Top 5 most common sets of keywords (ordered most common first):\n\n")
-    for top_set in top_5:
+    for i, top_set in enumerate(top_5):
         print("Keywords:")
         print(','.join([line[:25] for line in top_set]))
         print('\n')
-        response = openai.make_seo_recommendations(
-            keywords=top_set,
-            search=search_to_optimize
-        )
-        print("Recommendations from the LLM:")
-        print(response)
+        if report and report[i]['covered']:
+            print("Already covered by the site ({0:.2f} similarity): {1}".format(
+                report[i]['max_similarity'],
+                report[i]['best_match']
+            ))
+            response = None
+        else:
+            response = openai.make_seo_recommendations(
+                keywords=top_set,
+                search=search_to_optimize
+            )
+            print("Recommendations from the LLM:")
+            print(response)
         print('- - -' * 10)
         final_results['recommendations'].append({
             'cluster_keywords': top_set,
-            'llm_recommendations': response
+            'llm_recommendations': response,
+            'coverage': report[i] if report else None
         })
     end = time.time()
     elapsed = str(end - start)
     print("Total recommendation runtime {0}".format(elapsed))
     print()
     final_results['runtime'] = elapsed
+    if columnar_dir:
+        group = ColumnarWriter(columnar_dir).write_clusters(
+            search=search_to_optimize,
+            clustered=clustered_site_contents,
+            keywords=top_5,
+            responses=[recommendation['llm_recommendations'] for recommendation in final_results['recommendations']]
+        )
+        print("Results added to '{0}' as group {1}".format(columnar_dir, group))
     if output_fname:
         with open(output_fname, 'w') as fidout:
             json.dump(final_results, fidout, indent=2)
@@ -91,7 +147,61 @@ if __name__ == "__main__":
         help='If specified, uses local embedding model rather than LLM API call.',
         action='store_true'
     )
+    parser.add_argument(
+        '--route_language',
+        help='If specified with --local_embed, uses a faster English-only model when every site is in English.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--segment',
+        help='If specified, merges short lines and splits long ones into evenly sized segments before clustering.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--site',
+        help='URL of the client site (include http[s]): only clusters the site does not already cover are sent to '
+             'the LLM.',
+        required=False
+    )
+    parser.add_argument(
+        '--coverage_threshold',
+        help='Similarity at or above which the client site covers a cluster (defaults to 0.75)',
+        type=float,
+        default=0.75
+    )
+    parser.add_argument(
+        '--columnar_dir',
+        help='If specified, appends the clusters, embeddings and recommendations to the columnar store in this folder.',
+        required=False
+    )
+    parser.add_argument(
+        '--pipeline',
+        help='If specified, cleans and embeds sites while the remaining search results are still downloading.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--embed_batch_size',
+        help='With --pipeline, embeds lines in batches of this size as sites arrive rather than all at once. Faster, '
+             'but embeddings may differ from a single call by floating point noise.',
+        type=int,
+        required=False
+    )
+    parser.add_argument(
+        '--metrics',
+        help='If specified, records per-stage metrics and saves them to this JSON file.',
+        required=False
+    )
+    parser.add_argument(
+        '--checkpoint_dir',
+        help='If specified, saves the output of each stage to this folder and resumes from it on the next run.',
+        required=False
+    )
     args = parser.parse_args()
+    if args.pipeline and args.route_language:
+        # The pipeline embeds sites as they arrive, before the language of every site is known
+        parser.error("--route_language is not supported with --pipeline")
+    if args.metrics:
+        metrics.enable()
     if not args.local_embed:
         logging.info("Using remote API embeddings")
     else:
@@ -101,16 +211,86 @@ if __name__ == "__main__":
     else:
         search = args.search
     print("Performing search: '{0}'".format(search))
-    sites = serpapi.fetch_results(
-        search=search
-    )
-    print("Clustering {0} site(s) found for search '{1}'".format(
-        len(sites),
-        search
-    ))
-    main(
-        site_sources=sites,
-        search_to_optimize=search,
-        local_embed=args.local_embed,
-        output_fname=args.output
-    )
+    client_site = None
+    if args.site:
+        logging.info("Fetching {0}...".format(args.site))
+        r = requests.get(args.site, timeout=60)
+        if r.status_code == 200:
+            client_site = r.text
+        else:
+            logging.error(f"Received status code {r.status_code} for {args.site}, not scoring coverage")
+    if args.checkpoint_dir:
+        start = time.time()
+        final_results = workflow.run_search(
+            search=search,
+            llm=openai,
+            embed_function=embed.generate_embeddings if args.local_embed else openai.embeddings,
+            checkpoints=CheckpointStore(args.checkpoint_dir),
+            route_language=args.route_language,
+            segment=args.segment,
+            client_site_src=client_site,
+            coverage_threshold=args.coverage_threshold
+        )
+        for recommendation in final_results['recommendations']:
+            print("Keywords:")
+            print(','.join([line[:25] for line in recommendation['cluster_keywords']]))
+            print('\n')
+            if recommendation['coverage'] and recommendation['coverage']['covered']:
+                print("Already covered by the site: {0}".format(recommendation['coverage']['best_match']))
+            else:
+                print("Recommendations from the LLM:")
+                print(recommendation['llm_recommendations'])
+            print('- - -' * 10)
+        final_results['runtime'] = str(time.time() - start)
+        print("Total recommendation runtime {0}".format(final_results['runtime']))
+        if args.output:
+            with open(args.output, 'w') as fidout:
+                json.dump(final_results, fidout, indent=2)
+            print("Results saved to '{0}'".format(args.output))
+    elif args.pipeline:
+        clustered, stats = pipeline.cluster_search(
+            search=search,
+            embed_function=embed.generate_embeddings if args.local_embed else openai.embeddings,
+            segment=args.segment,
+            embed_batch_size=args.embed_batch_size
+        )
+        for stage, stage_stats in stats['stages'].items():
+            logging.info("{0}: {1} item(s), {2:.0%} utilization".format(
+                stage,
+                stage_stats['items'],
+                stage_stats['utilization']
+            ))
+        main(
+            site_sources=list(),
+            search_to_optimize=search,
+            local_embed=args.local_embed,
+            output_fname=args.output,
+            clustered_site_contents=clustered,
+            segment=args.segment,
+            client_site_src=client_site,
+            coverage_threshold=args.coverage_threshold,
+            columnar_dir=args.columnar_dir
+        )
+    else:
+        sites = serpapi.fetch_results(
+            search=search
+        )
+        print("Clustering {0} site(s) found for search '{1}'".format(
+            len(sites),
+            search
+        ))
+        main(
+            site_sources=sites,
+            search_to_optimize=search,
+            local_embed=args.local_embed,
+            output_fname=args.output,
+            route_language=args.route_language,
+            segment=args.segment,
+            client_site_src=client_site,
+            coverage_threshold=args.coverage_threshold,
+            columnar_dir=args.columnar_dir
+        )
+    if args.metrics:
+        with open(args.metrics, 'w') as fidout:
+            fidout.write(metrics.to_json(indent=2))
+        print("Metrics saved to '{0}'".format(args.metrics))
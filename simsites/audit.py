@@ -0,0 +1,153 @@
+"""
+audit - checks a site against every recommendation from a search_keywords.py run in one pass: the site is indexed
+once, excerpts for all recommendations are retrieved in a single batched search, and several recommendations are
+evaluated per LLM call.
+"""
+import json
+import logging
+import re
+from typing import *
+
+from simsites.util import metrics
+
+RECOMMENDATION_ITEM_REGEX = re.compile(r"^(?:\d+[.)]|[-*•])\s+")
+JSON_FENCE_REGEX = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def split_recommendations(text: AnyStr) -> List[AnyStr]:
+    """
+    Splits an LLM answer into its individual recommendations: top-level numbered or bulleted items, each with any
+    indented or continuation lines that follow it. Text before the first item (e.g. an introduction) is dropped.
+    :param text: LLM answer
+    :return: list of recommendations, or the whole answer if it isn't a list.
+    """
+    items = list()
+    for line in text.split('\n'):
+        if RECOMMENDATION_ITEM_REGEX.match(line):
+            items.append(RECOMMENDATION_ITEM_REGEX.sub('', line, count=1).strip())
+        elif items and line.strip():
+            items[-1] += '\n' + line.strip()
+    return items if items else [text.strip()]
+
+
+def load_recommendations(search_results: Dict[AnyStr, Any], split: bool = True) -> List[AnyStr]:
+    """
+    Extracts the recommendations from the output of search_keywords.py.
+    :param search_results: dict of the form {'search': ..., 'recommendations': [{'llm_recommendations': ...}]}
+    :param split: if True (default), splits each LLM answer into its individual recommendations.
+    :return: list of recommendations without duplicates, in order.
+    """
+    recommendations = list()
+    for cluster_recommendations in search_results.get('recommendations', list()):
+        answer = cluster_recommendations.get('llm_recommendations')
+        if not answer:
+            continue
+        for recommendation in split_recommendations(answer) if split else [answer.strip()]:
+            if recommendation and recommendation not in recommendations:
+                recommendations.append(recommendation)
+    return recommendations
+
+
+def parse_check_response(response: AnyStr, count: int) -> List[Union[Dict[AnyStr, Any], None]]:
+    """
+    Parses the JSON answer to "check_seo_recommendations".
+    :param response: LLM answer
+    :param count: number of recommendations that were checked
+    :return: list with one dict {'implemented': ..., 'assessment': ..., 'suggestions': ...} per recommendation, or None
+    for recommendations missing from the answer.
+    """
+    checks = [None] * count
+    try:
+        payload = json.loads(JSON_FENCE_REGEX.sub('', response.strip()))
+        results = payload.get('results', list()) if isinstance(payload, dict) else payload
+    except Exception as err:
+        logging.warning("Couldn't parse recommendations check: {0}".format(err))
+        return checks
+    if not isinstance(results, list):
+        logging.warning("Couldn't parse recommendations check: 'results' is not a list")
+        return checks
+    for result in results:
+        # A malformed item only loses that recommendation's check, not the rest of the answer
+        try:
+            idx = int(result.get('id')) - 1
+        except (AttributeError, TypeError, ValueError):
+            logging.warning("Skipping recommendations check item without a valid id: {0!r}".format(result))
+            continue
+        if 0 <= idx < count:
+            checks[idx] = {
+                'implemented': result.get('implemented'),
+                'assessment': result.get('assessment'),
+                'suggestions': result.get('suggestions')
+            }
+    return checks
+
+
+def audit_site(
+        search: AnyStr,
+        recommendations: List[AnyStr],
+        site_vector_store: Any,
+        llm: Any = None,
+        k: int = 5,
+        batch_size: int = 5
+) -> Dict[AnyStr, Any]:
+    """
+    Checks a site against a list of recommendations. Recommendations missing from a batched answer are checked again
+    individually with "check_seo_recommendation".
+    :param search: search the recommendations were made for
+    :param recommendations: recommendations to check e.g. from "load_recommendations"
+    :param site_vector_store: NNVectorStore of the site's contents
+    :param llm: LLM module e.g. simsites.llm.openai (the default) or simsites.llm.mistral
+    :param k: number of excerpts retrieved per recommendation
+    :param batch_size: number of recommendations checked per LLM call
+    :return: dict of the form
+    {
+        'search': ...,
+        'results': [{'recommendation': ..., 'most_relevant_site_contents': [...], 'implemented': True/False/None,
+        'assessment': ..., 'suggestions': ...}],
+        'llm_calls': number of LLM calls made
+    }
+    """
+    if llm is None:
+        import simsites.llm.openai as llm
+    audit = {
+        'search': search,
+        'results': list(),
+        'llm_calls': 0
+    }
+    if not recommendations:
+        logging.warning("No recommendations to check")
+        return audit
+    with metrics.timer('audit_retrieval'):
+        retrieved = site_vector_store.get_relevant_texts_batch(queries=recommendations, k=k)
+    excerpts = [result['texts'] for result in retrieved]
+    for start in range(0, len(recommendations), batch_size):
+        batch = recommendations[start: start + batch_size]
+        batch_excerpts = excerpts[start: start + batch_size]
+        response = llm.check_seo_recommendations(
+            search=search,
+            recommendations=batch,
+            most_relevant_excerpts=batch_excerpts
+        )
+        audit['llm_calls'] += 1
+        checks = parse_check_response(response, len(batch)) if response else [None] * len(batch)
+        for recommendation, recommendation_excerpts, check in zip(batch, batch_excerpts, checks):
+            if check is None:
+                logging.info("Checking '{0}' individually".format(recommendation[:50]))
+                check = {
+                    'implemented': None,
+                    'assessment': llm.check_seo_recommendation(
+                        search=search,
+                        recommendation=recommendation,
+                        most_relevant_excerpts=recommendation_excerpts
+                    ),
+                    'suggestions': None
+                }
+                audit['llm_calls'] += 1
+            audit['results'].append({
+                'recommendation': recommendation,
+                'most_relevant_site_contents': recommendation_excerpts,
+                **check
+            })
+    metrics.incr('audit_recommendations', len(recommendations))
+    metrics.incr('audit_llm_calls', audit['llm_calls'])
+    return audit
@@ -2,10 +2,13 @@
 cluster - clusters websites
 """
 from typing import *
+import hashlib
 import logging
-from sentence_transformers import util
+from urllib.parse import urldefrag
 
-from simsites.util.embed import generate_embeddings
+from simsites.util import metrics
+from simsites.util.embed import embedding_model_id, generate_embeddings, local_embed_function, local_model_name, \
+    select_embedding_model
 from simsites.util.text_cleaner import strip_site, split_site
 
 
@@ -13,7 +16,9 @@ def cluster_sites(
         site_sources: List[AnyStr],
         embed_function: Any = generate_embeddings,
         min_cluster_size: int = 5,
-        threshold: float = 0.75
+        threshold: float = 0.75,
+        route_language: bool = False,
+        segment: bool = False
 ) -> Dict[AnyStr, Any]:
     """
     Clusters the text from one or more websites.
@@ -25,31 +30,224 @@ def cluster_sites(
     returned.
     :param threshold: clustering (similarity) threshold to consider two strings as members of the same cluster.
     Defaults to 0.75.
+    :param route_language: if True and embed_function is a local model, detects the language of each site and embeds
+    all of them with the fastest model suited to every site (see "select_embedding_model"). Ignored for other embed
+    functions.
+    :param segment: if True, clusters size-balanced segments of the sites' text rather than individual lines, see
+    "segment_site".
     :return: dict of the form
     {
         'lines': [text from the sites],
         'embeddings': [tensor embeddings of the site text],
         'clusters': clusters identified. Clusters are ordered from largest to smallest; first element of each cluster
         is the cluster centroid (~ most common string in the cluster).
+        'embedding_model': identifier of the model that generated the embeddings
     }
 
     """
-    lines = list()
-    for src in site_sources:
-        site_text = strip_site(src)
-        site_as_lines = split_site(site_text)
-        if len(site_as_lines) > 0:
-            lines.extend(site_as_lines)
-    if len(lines) > 0:
-        site_embeddings = embed_function(lines)
-        clusters = util.community_detection(site_embeddings, min_community_size=min_cluster_size, threshold=threshold)
-        return {
-            'lines': lines,
-            'embeddings': site_embeddings,
-            'clusters': clusters
-        }
-    else:
-        logging.warning("No text received returning None")
+    with metrics.timer('cluster_sites'):
+        per_site = [site_lines(src, segment=segment) for src in site_sources]
+        lines = [line for site_as_lines in per_site for line in site_as_lines]
+        if len(lines) > 0:
+            if route_language:
+                embed_function = route_embed_function(embed_function, per_site)
+            return cluster_lines(
+                lines=lines,
+                embeddings=embed_function(lines),
+                min_cluster_size=min_cluster_size,
+                threshold=threshold,
+                embedding_model=embedding_model_id(embed_function)
+            )
+        else:
+            logging.warning("No text received returning None")
+
+
+def route_embed_function(embed_function: Any, per_site: List[List[AnyStr]]) -> Any:
+    """
+    Returns the embed function of the fastest local model suited to every site, see "select_embedding_model".
+    :param embed_function: embed function, must use a local model for routing to apply.
+    :param per_site: lines of each site
+    :return: embed function for the selected model, or embed_function if it doesn't use a local model.
+    """
+    if not local_model_name(embed_function):
+        logging.warning("Language routing needs a local embed function, ignoring")
+        return embed_function
+    return local_embed_function(select_embedding_model(['\n'.join(site_as_lines) for site_as_lines in per_site]))
+
+
+def site_key(site: Union[AnyStr, Tuple[AnyStr, AnyStr]]) -> Tuple[AnyStr, AnyStr]:
+    """
+    Identifies a site of a portfolio.
+    :param site: (URL, HTML source) pair or HTML source
+    :return: (site ID, HTML source), the ID being the URL without fragment or trailing slash, or a hash of the source if
+    there is no URL.
+    """
+    if isinstance(site, str):
+        return hashlib.sha1(site.encode('utf-8', errors='replace')).hexdigest(), site
+    url, src = site
+    return urldefrag(url)[0].rstrip('/'), src
+
+
+def cluster_portfolio(
+        search_sites: Dict[AnyStr, List[Union[AnyStr, Tuple[AnyStr, AnyStr]]]],
+        embed_function: Any = generate_embeddings,
+        min_cluster_size: int = 5,
+        threshold: float = 0.75,
+        route_language: bool = False,
+        segment: bool = False
+) -> Dict[AnyStr, Any]:
+    """
+    Clusters the sites found for several related searches together. Sites found by more than one search are cleaned
+    and clustered once, distinct lines are embedded once, and all lines are clustered in a single pass; each cluster is
+    then attributed to the searches and sites its lines come from.
+    :param search_sites: dict of search -> sites found for that search, each a (URL, HTML source) pair as returned by
+    "serpapi.fetch_sites" or just the HTML source. Sites with a URL are identified by it (without fragment or trailing
+    slash), so the same page fetched by two searches is clustered once even if its markup differs; sites without one
+    are identified by a hash of their source.
+    :param embed_function: function to generate embeddings, see "cluster_sites".
+    :param min_cluster_size: minimum cluster size in lines, see "cluster_sites".
+    :param threshold: clustering (similarity) threshold, see "cluster_sites".
+    :param route_language: if True, picks the local embedding model from the language of all sites, see
+    "cluster_sites".
+    :param segment: if True, clusters size-balanced segments rather than lines, see "cluster_sites".
+    :return: dict of the same form as "cluster_sites", with lines from each distinct site, plus
+    {
+        'sites': [ID of each distinct site (its URL, or a hash of its source)],
+        'line_sites': [index in 'sites' of the site each line comes from],
+        'site_searches': [searches that found each site],
+        'attribution': one dict per cluster {'searches': {search: number of lines}, 'sites': {site ID: number of
+        lines}, 'shared': True if the cluster appears in more than one search's sites}
+    }
+    or None if no text was found.
+    """
+    with metrics.timer('cluster_portfolio'):
+        sites = list()
+        site_idxs = dict()
+        site_searches = list()
+        per_site = list()
+        for search, site_sources in search_sites.items():
+            for site in site_sources:
+                site_id, src = site_key(site)
+                if site_id not in site_idxs:
+                    site_idxs[site_id] = len(sites)
+                    sites.append(site_id)
+                    site_searches.append(list())
+                    per_site.append(site_lines(src, segment=segment))
+                if search not in site_searches[site_idxs[site_id]]:
+                    site_searches[site_idxs[site_id]].append(search)
+        lines = [line for site_as_lines in per_site for line in site_as_lines]
+        line_sites = [i for i, site_as_lines in enumerate(per_site) for _ in site_as_lines]
+        if len(lines) == 0:
+            logging.warning("No text received returning None")
+            return None
+        if route_language:
+            embed_function = route_embed_function(embed_function, per_site)
+        distinct_idxs = dict()
+        occurrences = [distinct_idxs.setdefault(line, len(distinct_idxs)) for line in lines]
+        distinct_embeddings = embed_function(list(distinct_idxs))
+        metrics.incr('portfolio_lines', len(lines))
+        metrics.incr('portfolio_distinct_lines', len(distinct_idxs))
+        clustered = cluster_lines(
+            lines=lines,
+            embeddings=take_rows(distinct_embeddings, occurrences),
+            min_cluster_size=min_cluster_size,
+            threshold=threshold,
+            embedding_model=embedding_model_id(embed_function)
+        )
+        attribution = list()
+        for cluster in clustered['clusters']:
+            search_counts = dict()
+            site_counts = dict()
+            for line_idx in cluster:
+                site_idx = line_sites[line_idx]
+                site_counts[sites[site_idx]] = site_counts.get(sites[site_idx], 0) + 1
+                for search in site_searches[site_idx]:
+                    search_counts[search] = search_counts.get(search, 0) + 1
+            attribution.append({
+                'searches': search_counts,
+                'sites': site_counts,
+                'shared': len(search_counts) > 1
+            })
+        clustered.update({
+            'sites': sites,
+            'line_sites': line_sites,
+            'site_searches': site_searches,
+            'attribution': attribution
+        })
+        return clustered
+
+
+def portfolio_themes(portfolio: Dict[AnyStr, Any]) -> Dict[AnyStr, Any]:
+    """
+    Splits the clusters of a portfolio into themes shared by several searches and themes specific to one search.
+    :param portfolio: results of "cluster_portfolio"
+    :return: dict of the form {'shared': [cluster indices], 'specific': {search: [cluster indices]}}, largest clusters
+    first.
+    """
+    themes = {
+        'shared': list(),
+        'specific': dict()
+    }
+    for i, cluster_attribution in enumerate(portfolio['attribution']):
+        if cluster_attribution['shared']:
+            themes['shared'].append(i)
+        else:
+            for search in cluster_attribution['searches']:
+                themes['specific'].setdefault(search, list()).append(i)
+    return themes
+
+
+def take_rows(embeddings: Any, idxs: List[int]) -> Any:
+    """
+    Selects embeddings by index, keeping the type returned by the embed function.
+    :param embeddings: tensor, array or list of embeddings
+    :param idxs: indices of the embeddings to select, may repeat.
+    :return: selected embeddings
+    """
+    if hasattr(embeddings, 'shape'):
+        return embeddings[idxs]
+    return [embeddings[i] for i in idxs]
+
+
+def site_lines(site_src: AnyStr, segment: bool = False) -> List[AnyStr]:
+    """
+    Extracts the non-empty lines of text from a website.
+    :param site_src: HTML source of the site
+    :param segment: if True, returns size-balanced segments rather than lines, see "split_site".
+    :return: list of lines, may be empty.
+    """
+    return split_site(strip_site(site_src), segment=segment)
+
+
+def cluster_lines(
+        lines: List[AnyStr],
+        embeddings: Any,
+        min_cluster_size: int = 5,
+        threshold: float = 0.75,
+        embedding_model: AnyStr = None
+) -> Dict[AnyStr, Any]:
+    """
+    Clusters lines of text that have already been embedded.
+    :param lines: lines of text
+    :param embeddings: embeddings of the lines, in the same order.
+    :param min_cluster_size: minimum cluster size in lines: groupings below this are considered outliers and not
+    returned.
+    :param threshold: clustering (similarity) threshold to consider two strings as members of the same cluster.
+    Defaults to 0.75.
+    :param embedding_model: identifier of the model that generated the embeddings, recorded in the result.
+    :return: dict of the same form as "cluster_sites".
+    """
+    from sentence_transformers import util
+    with metrics.timer('community_detection'):
+        clusters = util.community_detection(embeddings, min_community_size=min_cluster_size, threshold=threshold)
+    metrics.incr('clustered_lines', len(lines))
+    metrics.incr('clusters', len(clusters))
+    return {
+        'lines': lines,
+        'embeddings': embeddings,
+        'clusters': clusters,
+        'embedding_model': embedding_model
+    }
 
 
 def top_keywords(clusters, sentences, num_clusters: int = 5, num_terms: int = 5) -> List[List[AnyStr]]:
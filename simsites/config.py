@@ -0,0 +1,90 @@
+"""
+config - API keys and other settings, resolved when first needed rather than at import time.
+"""
+import os
+from typing import *
+
+# Setting name -> environment variable it falls back to
+ENV_VARS = {
+    'openai_api_key': 'OPENAI_API_KEY',
+    'mistral_api_key': 'MISTRAL_API_KEY',
+    'serpapi_key': 'SERPAPI_KEY'
+}
+
+
+class ConfigError(Exception):
+    """
+    Raised when a required setting is neither configured nor available from the environment.
+    """
+    pass
+
+
+class Config:
+    """
+    Settings for simsites. Values passed explicitly take precedence; anything else is read from the environment (see
+    "ENV_VARS") the first time it's requested, so that modules can be imported without every key being set.
+    """
+
+    def __init__(self, **values):
+        """
+        :param values: explicit settings e.g. openai_api_key='...'
+        """
+        self._values = dict(values)
+
+    def set(self, **values):
+        """
+        Sets one or more settings.
+        :param values: settings e.g. serpapi_key='...'
+        :return: None
+        """
+        self._values.update(values)
+
+    def get(self, name: AnyStr, default: Any = None, required: bool = True) -> Any:
+        """
+        Returns a setting.
+        :param name: setting name e.g. "openai_api_key"
+        :param default: value returned if the setting isn't found and isn't required.
+        :param required: if True (default), raises ConfigError if the setting isn't found.
+        :return: value of the setting
+        """
+        if self._values.get(name) is not None:
+            return self._values[name]
+        value = os.environ.get(ENV_VARS.get(name, name.upper()))
+        if value is not None:
+            return value
+        if required:
+            raise ConfigError("'{0}' is not configured: set {1} or call configure({0}=...)".format(
+                name,
+                ENV_VARS.get(name, name.upper())
+            ))
+        return default
+
+
+_config = Config()
+
+
+def get_config() -> Config:
+    """
+    Returns the active configuration.
+    :return: Config
+    """
+    return _config
+
+
+def set_config(config: Config):
+    """
+    Replaces the active configuration.
+    :param config: new configuration
+    :return: None
+    """
+    global _config
+    _config = config
+
+
+def configure(**values):
+    """
+    Sets values in the active configuration, e.g. configure(openai_api_key='...').
+    :param values: settings
+    :return: None
+    """
+    _config.set(**values)
@@ -0,0 +1,87 @@
+"""
+coverage - scores how well a client site already covers each cluster found in the competitors' sites, so that LLM
+calls are only made for the gaps.
+"""
+import logging
+from typing import *
+
+import numpy as np
+
+from simsites.util import metrics
+from simsites.util.nn_index import normalize, to_matrix
+
+
+def coverage_report(
+        clustered: Dict[AnyStr, Any],
+        site_vector_store: Any,
+        num_clusters: int = 5,
+        coverage_threshold: float = 0.75,
+        top_n: int = 5
+) -> List[Dict[AnyStr, Any]]:
+    """
+    Compares the centroid of each of the largest clusters with every line of the client site in a single matrix
+    product.
+    :param clustered: results of "cluster_sites"
+    :param site_vector_store: NNVectorStore of the client site, populated with the same embedding model as the clusters.
+    :param num_clusters: number of clusters to score, largest first.
+    :param coverage_threshold: cosine similarity at or above which a site line matches a cluster: a cluster is covered
+    if its best match reaches this similarity.
+    :param top_n: number of best matching site lines averaged into "mean_similarity".
+    :return: list with one dict per cluster, in cluster order (largest first), of the form
+    {
+        'cluster': index of the cluster,
+        'size': number of lines in the cluster,
+        'centroid': text of the cluster centroid,
+        'max_similarity': similarity of the best matching site line,
+        'mean_similarity': mean similarity of the top_n best matching site lines,
+        'matching_lines': number of site lines at or above coverage_threshold,
+        'best_match': text of the best matching site line,
+        'covered': True if max_similarity reaches coverage_threshold
+    }
+    """
+    model_id = getattr(site_vector_store, 'model_id', None)
+    if clustered.get('embedding_model') and model_id and clustered['embedding_model'] != model_id:
+        raise ValueError("Clusters were embedded with '{0}' but the site with '{1}'".format(
+            clustered['embedding_model'],
+            model_id
+        ))
+    clusters = clustered['clusters'][:num_clusters]
+    report = list()
+    if not clusters:
+        return report
+    with metrics.timer('coverage_report'):
+        embeddings = to_matrix(clustered['embeddings'])
+        centroids = normalize(embeddings[[cluster[0] for cluster in clusters]])
+        site = to_matrix(site_vector_store.embeddings) if len(site_vector_store.texts) > 0 else None
+        if site is None:
+            logging.warning("Site vector store is empty, no cluster is covered")
+            similarities = np.zeros((len(clusters), 0), dtype=np.float32)
+        else:
+            similarities = centroids @ normalize(site).T
+        n = min(top_n, similarities.shape[1])
+        top_similarities = -np.sort(-similarities, axis=1)[:, :n]
+        for i, cluster in enumerate(clusters):
+            best = int(np.argmax(similarities[i])) if similarities.shape[1] else None
+            max_similarity = float(similarities[i, best]) if best is not None else 0.
+            report.append({
+                'cluster': i,
+                'size': len(cluster),
+                'centroid': clustered['lines'][cluster[0]],
+                'max_similarity': max_similarity,
+                'mean_similarity': float(top_similarities[i].mean()) if n else 0.,
+                'matching_lines': int((similarities[i] >= coverage_threshold).sum()),
+                'best_match': site_vector_store.texts[best] if best is not None else None,
+                'covered': max_similarity >= coverage_threshold
+            })
+    metrics.incr('coverage_clusters', len(report))
+    metrics.incr('coverage_gaps', sum(1 for cluster in report if not cluster['covered']))
+    return report
+
+
+def rank_gaps(report: List[Dict[AnyStr, Any]]) -> List[Dict[AnyStr, Any]]:
+    """
+    Orders a coverage report from the least to the best covered cluster, larger clusters first among ties.
+    :param report: results of "coverage_report"
+    :return: sorted copy of the report
+    """
+    return sorted(report, key=lambda cluster: (cluster['max_similarity'], cluster['mean_similarity'], -cluster['size']))
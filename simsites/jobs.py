@@ -0,0 +1,634 @@
+"""
+jobs - durable SQLite job queue for spreading searches across worker processes and hosts that share a filesystem.
+
+Each job is a search and the options for "workflow.run_search". Workers claim jobs under a lease that they renew with
+heartbeats while the search runs; a job whose worker dies is claimed again once its lease expires. Failed jobs are
+retried with exponential backoff up to a maximum number of attempts. Results are written atomically to a results folder
+before the job is marked done.
+
+    python -m simsites.jobs enqueue --db jobs.db -i searches.txt
+    python -m simsites.jobs work --db jobs.db --results_dir results --processes 4 --exit_when_empty
+    python -m simsites.jobs stats --db jobs.db
+
+SQLite locking relies on the filesystem's locks: the database works on local disks and on network filesystems with
+working POSIX locks (e.g. NFSv4). The rollback journal is used rather than WAL, which doesn't work across hosts.
+"""
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import *
+
+from simsites.util import metrics
+
+# Default seconds a claimed job stays leased without a heartbeat
+DEFAULT_LEASE = 300.
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds before the first retry of a failed job, doubled for each further attempt
+DEFAULT_RETRY_DELAY = 30.
+# Job statuses
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATUSES = (QUEUED, RUNNING, DONE, FAILED)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    search TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    enqueued REAL NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    started REAL,
+    finished REAL,
+    result_path TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    started REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    busy_seconds REAL NOT NULL DEFAULT 0
+);
+'''
+
+
+class JobError(Exception):
+    """
+    Raised when a search ran without error but its results are unusable (no text fetched, or LLM recommendations
+    missing), so that the job is retried.
+    """
+    pass
+
+
+def check_results(results: Dict[AnyStr, Any], recommend: bool = True):
+    """
+    Checks the results of "workflow.run_search" before a job is marked done.
+    :param results: results of "workflow.run_search"
+    :param recommend: True if the job asked for LLM recommendations
+    :return: None
+    :raises JobError: if no text was fetched, or a cluster that needed a recommendation didn't get one.
+    """
+    if 'embedding_model' not in results:
+        raise JobError("No text fetched for '{0}'".format(results['search']))
+    if recommend:
+        missing = [
+            recommendation for recommendation in results['recommendations']
+            if recommendation['llm_recommendations'] is None and
+            not (recommendation['coverage'] and recommendation['coverage']['covered'])
+        ]
+        if missing:
+            raise JobError("No LLM recommendations for {0} of {1} cluster(s)".format(
+                len(missing),
+                len(results['recommendations'])
+            ))
+
+
+def worker_name() -> AnyStr:
+    """
+    :return: name identifying this process across hosts e.g. "box1-12345"
+    """
+    return '{0}-{1}'.format(socket.gethostname(), os.getpid())
+
+
+def write_json_atomic(value: Any, fname: AnyStr):
+    """
+    Writes a JSON file atomically: it's written to a temporary file then renamed, so readers never see a partial file.
+    :param value: JSON-serializable value
+    :param fname: file to write
+    :return: None
+    """
+    os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+    fd, tmp_fname = tempfile.mkstemp(dir=os.path.dirname(fname) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fidout:
+            json.dump(value, fidout, indent=2)
+        os.replace(tmp_fname, fname)
+    except BaseException:
+        os.remove(tmp_fname)
+        raise
+
+
+class JobQueue:
+    """
+    Job queue stored in a SQLite database. Every state change is a single transaction, and claims take the database's
+    write lock first (BEGIN IMMEDIATE) so that two workers never claim the same job. Thread-safe.
+    """
+
+    def __init__(self, path: AnyStr, lease: float = DEFAULT_LEASE, retry_delay: float = DEFAULT_RETRY_DELAY):
+        """
+        :param path: database file, created if it doesn't exist.
+        :param lease: seconds a claimed job stays leased to its worker without a heartbeat
+        :param retry_delay: seconds before the first retry of a failed job, doubled for each further attempt.
+        """
+        self.path = path
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60., isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _transaction(self, statements: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    def enqueue(self, searches: List[AnyStr], max_attempts: int = DEFAULT_MAX_ATTEMPTS, **params) -> List[int]:
+        """
+        Adds a job for each search.
+        :param searches: searches to run
+        :param max_attempts: number of times a job is tried before it's marked failed
+        :param params: options passed on to "workflow.run_search" e.g. num_clusters=5, must be JSON-serializable.
+        :return: IDs of the new jobs
+        """
+        now = time.time()
+        encoded = json.dumps(params, sort_keys=True)
+
+        def insert(conn):
+            return [
+                conn.execute(
+                    'INSERT INTO jobs (search, params, status, max_attempts, available_at, enqueued) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (search, encoded, QUEUED, max_attempts, now, now)
+                ).lastrowid
+                for search in searches
+            ]
+
+        job_ids = self._transaction(insert)
+        metrics.incr('jobs_enqueued', len(job_ids))
+        return job_ids
+
+    def register(self, worker: AnyStr):
+        """
+        Records a worker, so its throughput is reported by "stats".
+        :param worker: worker name
+        :return: None
+        """
+        now = time.time()
+        host, _, pid = worker.rpartition('-')
+        self._transaction(lambda conn: conn.execute(
+            'INSERT OR REPLACE INTO workers (worker, host, pid, started, last_seen) VALUES (?, ?, ?, ?, ?)',
+            (worker, host, int(pid) if pid.isdigit() else None, now, now)
+        ))
+
+    def claim(self, worker: AnyStr) -> Union[Dict[AnyStr, Any], None]:
+        """
+        Claims the oldest job that's ready: queued and past its retry delay, or running under an expired lease. Jobs
+        whose lease expired on their last attempt are marked failed.
+        :param worker: worker name
+        :return: dict with the job's 'id', 'search', 'params' and 'attempt' (1 for the first), or None if no job is
+        ready.
+        """
+        def claim_job(conn):
+            now = time.time()
+            conn.execute(
+                'UPDATE jobs SET status = ?, finished = ?, error = ? '
+                'WHERE status = ? AND lease_until < ? AND attempts >= max_attempts',
+                (FAILED, now, 'Lease expired on the last attempt', RUNNING, now)
+            )
+            row = conn.execute(
+                'SELECT id, search, params, attempts FROM jobs '
+                'WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?) '
+                'ORDER BY id LIMIT 1',
+                (QUEUED, now, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, lease_until = ?, started = ? '
+                'WHERE id = ?',
+                (RUNNING, worker, now + self.lease, now, row['id'])
+            )
+            conn.execute('UPDATE workers SET last_seen = ? WHERE worker = ?', (now, worker))
+            return {
+                'id': row['id'],
+                'search': row['search'],
+                'params': json.loads(row['params']),
+                'attempt': row['attempts'] + 1
+            }
+
+        job = self._transaction(claim_job)
+        if job is not None:
+            metrics.incr('jobs_claimed')
+        return job
+
+    def next_ready(self) -> Union[float, None]:
+        """
+        Reports when a job may next be ready to claim: the earliest retry time of the queued jobs, or lease expiry of
+        the running ones.
+        :return: seconds until then (0 if a job is ready now), or None if no job is queued or running.
+        """
+        with self._lock:
+            earliest = self._conn.execute(
+                'SELECT MIN(CASE WHEN status = ? THEN available_at ELSE lease_until END) FROM jobs '
+                'WHERE status IN (?, ?)',
+                (QUEUED, QUEUED, RUNNING)
+            ).fetchone()[0]
+        return None if earliest is None else max(earliest - time.time(), 0.)
+
+    def heartbeat(self, job_id: int, worker: AnyStr) -> bool:
+        """
+        Renews a job's lease.
+        :param job_id: job ID
+        :param worker: name of the worker running the job
+        :return: False if the worker no longer holds the job (its lease expired and another worker claimed it).
+        """
+        def renew(conn):
+            now = time.time()
+            conn.execute('UPDATE workers SET last_seen = ? WHERE worker = ?', (now, worker))
+            return conn.execute(
+                'UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?',
+                (now + self.lease, job_id, worker, RUNNING)
+            ).rowcount == 1
+
+        return self._transaction(renew)
+
+    def complete(self, job_id: int, worker: AnyStr, result_path: AnyStr, elapsed: float = 0.) -> bool:
+        """
+        Marks a job done.
+        :param job_id: job ID
+        :param worker: name of the worker that ran the job
+        :param result_path: file the results were written to
+        :param elapsed: seconds the worker spent on the job
+        :return: False if the worker no longer held the job, in which case it isn't changed.
+        """
+        def finish(conn):
+            now = time.time()
+            done = conn.execute(
+                'UPDATE jobs SET status = ?, finished = ?, result_path = ?, error = NULL '
+                'WHERE id = ? AND worker = ? AND status = ?',
+                (DONE, now, result_path, job_id, worker, RUNNING)
+            ).rowcount == 1
+            conn.execute(
+                'UPDATE workers SET last_seen = ?, completed = completed + ?, busy_seconds = busy_seconds + ? '
+                'WHERE worker = ?',
+                (now, int(done), elapsed, worker)
+            )
+            return done
+
+        done = self._transaction(finish)
+        metrics.incr('jobs_completed' if done else 'jobs_lease_lost')
+        return done
+
+    def fail(self, job_id: int, worker: AnyStr, error: AnyStr, elapsed: float = 0.) -> Union[AnyStr, None]:
+        """
+        Records a failed attempt: the job is queued again after its retry delay, or marked failed if it was its last
+        attempt.
+        :param job_id: job ID
+        :param worker: name of the worker that ran the job
+        :param error: error message
+        :param elapsed: seconds the worker spent on the job
+        :return: new status of the job ("queued" or "failed"), or None if the worker no longer held the job.
+        """
+        def record(conn):
+            now = time.time()
+            row = conn.execute(
+                'SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND status = ?',
+                (job_id, worker, RUNNING)
+            ).fetchone()
+            conn.execute(
+                'UPDATE workers SET last_seen = ?, failed = failed + 1, busy_seconds = busy_seconds + ? '
+                'WHERE worker = ?',
+                (now, elapsed, worker)
+            )
+            if row is None:
+                return None
+            if row['attempts'] >= row['max_attempts']:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?',
+                    (FAILED, now, error, job_id)
+                )
+                return FAILED
+            conn.execute(
+                'UPDATE jobs SET status = ?, available_at = ?, lease_until = NULL, error = ? WHERE id = ?',
+                (QUEUED, now + self.retry_delay * 2 ** (row['attempts'] - 1), error, job_id)
+            )
+            return QUEUED
+
+        status = self._transaction(record)
+        metrics.incr('jobs_failed', status=status or 'lease_lost')
+        return status
+
+    def jobs(self, status: AnyStr = None) -> List[Dict[AnyStr, Any]]:
+        """
+        Lists jobs.
+        :param status: if specified, only jobs with this status are listed.
+        :return: list of dicts, one per job, with every column of the jobs table.
+        """
+        with self._lock:
+            if status is None:
+                rows = self._conn.execute('SELECT * FROM jobs ORDER BY id').fetchall()
+            else:
+                rows = self._conn.execute('SELECT * FROM jobs WHERE status = ? ORDER BY id', (status,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self, window: float = 300.) -> Dict[AnyStr, Any]:
+        """
+        Reports the queue depth and the throughput of the queue and of each worker.
+        :param window: seconds over which the recent throughput is measured
+        :return: dict with the number of jobs in each status ('queued', 'running', 'done', 'failed'), 'ready' (queued
+        jobs past their retry delay), 'jobs_per_minute' (completed over the last window seconds), and 'workers': a dict
+        of worker name -> {'completed', 'failed', 'busy_seconds', 'jobs_per_minute' (since the worker started),
+        'utilization' (fraction of that time spent running jobs), 'active' (seen within the lease)}.
+        """
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+            ready = self._conn.execute(
+                'SELECT COUNT(*) FROM jobs WHERE status = ? AND available_at <= ?',
+                (QUEUED, now)
+            ).fetchone()[0]
+            recent = self._conn.execute(
+                'SELECT COUNT(*) FROM jobs WHERE status = ? AND finished >= ?',
+                (DONE, now - window)
+            ).fetchone()[0]
+            workers = self._conn.execute('SELECT * FROM workers ORDER BY started').fetchall()
+        stats = {status: counts.get(status, 0) for status in STATUSES}
+        stats['ready'] = ready
+        stats['jobs_per_minute'] = recent * 60. / window
+        stats['workers'] = dict()
+        for row in workers:
+            uptime = max(row['last_seen'] - row['started'], 1e-9)
+            stats['workers'][row['worker']] = {
+                'completed': row['completed'],
+                'failed': row['failed'],
+                'busy_seconds': row['busy_seconds'],
+                'jobs_per_minute': row['completed'] * 60. / uptime,
+                'utilization': min(row['busy_seconds'] / uptime, 1.),
+                'active': now - row['last_seen'] <= self.lease
+            }
+        return stats
+
+
+class Worker:
+    """
+    Claims jobs from a queue and runs them with "workflow.run_search", renewing each job's lease from a background
+    thread while it runs.
+    """
+
+    def __init__(
+            self,
+            queue: JobQueue,
+            results_dir: AnyStr,
+            llm: Any = None,
+            embed_function: Callable = None,
+            checkpoints: Any = None,
+            heartbeat_interval: float = None,
+            name: AnyStr = None
+    ):
+        """
+        :param queue: job queue
+        :param results_dir: folder the results of each job are written to, as <job ID>.json
+        :param llm: LLM module e.g. simsites.llm.openai (the default), see "workflow.run_search".
+        :param embed_function: function to generate embeddings, defaults to local embeddings.
+        :param checkpoints: optional CheckpointStore, shared by workers to reuse each other's stages.
+        :param heartbeat_interval: seconds between lease renewals, defaults to a third of the lease.
+        :param name: worker name, defaults to "<host>-<pid>".
+        """
+        self.queue = queue
+        self.results_dir = results_dir
+        self.llm = llm
+        self.embed_function = embed_function
+        self.checkpoints = checkpoints
+        self.heartbeat_interval = heartbeat_interval or queue.lease / 3.
+        self.name = name or worker_name()
+        self.completed = 0
+        self.failed = 0
+        os.makedirs(results_dir, exist_ok=True)
+        queue.register(self.name)
+
+    def _heartbeat(self, job_id: int, stop: threading.Event):
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                if not self.queue.heartbeat(job_id, self.name):
+                    logging.warning("Worker {0} lost the lease on job {1}".format(self.name, job_id))
+                    return
+            except sqlite3.Error as err:
+                logging.warning("Heartbeat for job {0} failed: {1}".format(job_id, err))
+
+    def run_job(self, job: Dict[AnyStr, Any]) -> bool:
+        """
+        Runs a claimed job and records its outcome.
+        :param job: job returned by "JobQueue.claim"
+        :return: True if the job completed
+        """
+        from simsites import workflow
+
+        logging.info("Worker {0} running job {1} '{2}' (attempt {3})".format(
+            self.name,
+            job['id'],
+            job['search'],
+            job['attempt']
+        ))
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], stop), daemon=True)
+        heartbeat.start()
+        start = time.monotonic()
+        try:
+            kwargs = dict(job['params'])
+            if self.embed_function is not None:
+                kwargs['embed_function'] = self.embed_function
+            with metrics.timer('job'):
+                results = workflow.run_search(
+                    search=job['search'],
+                    llm=self.llm,
+                    checkpoints=self.checkpoints,
+                    **kwargs
+                )
+            check_results(results, recommend=kwargs.get('recommend', True))
+            result_path = os.path.join(self.results_dir, '{0:08d}.json'.format(job['id']))
+            write_json_atomic(results, result_path)
+        except Exception as err:
+            stop.set()
+            logging.exception(err)
+            status = self.queue.fail(job['id'], self.name, repr(err), elapsed=time.monotonic() - start)
+            logging.warning("Job {0} failed, {1}".format(job['id'], status or 'lease lost'))
+            self.failed += 1
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+        done = self.queue.complete(job['id'], self.name, result_path, elapsed=time.monotonic() - start)
+        if done:
+            self.completed += 1
+        else:
+            logging.warning("Job {0} finished after its lease was lost, result left to the current holder".format(
+                job['id']
+            ))
+        return done
+
+    def run(self, max_jobs: int = None, exit_when_empty: bool = False, poll_interval: float = 5.) -> int:
+        """
+        Claims and runs jobs until stopped. When no job is ready, waits until the next retry or lease expiry, checking
+        at least every poll_interval seconds for new jobs.
+        :param max_jobs: if specified, stops after running this many jobs.
+        :param exit_when_empty: if True, stops once no job is left queued or running, rather than waiting for new jobs.
+        Jobs waiting to be retried, or running on other workers (whose lease may expire), keep the worker running.
+        :param poll_interval: maximum seconds to wait before checking again when no job is ready
+        :return: number of jobs completed
+        """
+        ran = 0
+        while max_jobs is None or ran < max_jobs:
+            job = self.queue.claim(self.name)
+            if job is None:
+                wait = self.queue.next_ready()
+                if wait is None and exit_when_empty:
+                    break
+                # Never less than a short pause, so workers racing for the same job don't spin
+                time.sleep(poll_interval if wait is None else min(max(wait, 0.05), poll_interval))
+                continue
+            self.run_job(job)
+            ran += 1
+        logging.info("Worker {0} stopping: {1} job(s) completed, {2} failed".format(
+            self.name,
+            self.completed,
+            self.failed
+        ))
+        return self.completed
+
+
+def work(
+        db: AnyStr,
+        results_dir: AnyStr,
+        llm: AnyStr = 'openai',
+        local_embed: bool = True,
+        checkpoint_dir: AnyStr = None,
+        lease: float = DEFAULT_LEASE,
+        max_jobs: int = None,
+        exit_when_empty: bool = False,
+        poll_interval: float = 5.
+) -> int:
+    """
+    Runs a worker process, see "Worker". Arguments are plain values so that it can be the target of a new process.
+    :param db: queue database file
+    :param results_dir: folder the results of each job are written to
+    :param llm: name of the LLM module e.g. "openai", "mistral" or "router"
+    :param local_embed: if True (default), use a local model to generate embeddings. If False, uses the LLM module's
+    embeddings.
+    :param checkpoint_dir: if specified, folder of a CheckpointStore shared by the workers.
+    :param lease: seconds a claimed job stays leased without a heartbeat
+    :param max_jobs: if specified, stops after running this many jobs.
+    :param exit_when_empty: if True, stops once no job is left queued or running.
+    :param poll_interval: seconds to wait before checking again when no job is ready
+    :return: number of jobs completed
+    """
+    from simsites.util.checkpoint import CheckpointStore
+
+    llm_module = importlib.import_module('simsites.llm.' + llm)
+    queue = JobQueue(db, lease=lease)
+    try:
+        return Worker(
+            queue,
+            results_dir=results_dir,
+            llm=llm_module,
+            embed_function=None if local_embed else llm_module.embeddings,
+            checkpoints=CheckpointStore(checkpoint_dir) if checkpoint_dir else None
+        ).run(max_jobs=max_jobs, exit_when_empty=exit_when_empty, poll_interval=poll_interval)
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(
+        prog='simsites.jobs',
+        description='Distributes searches across worker processes and hosts with a shared job queue'
+    )
+    parser.add_argument('--db', help='Queue database file (defaults to jobs.db)', default='jobs.db')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    enqueue_parser = subparsers.add_parser('enqueue', help='Adds a job per search')
+    enqueue_parser.add_argument('-i', '--input', help='File with one search per line', required=True)
+    enqueue_parser.add_argument('--max_attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help='Attempts per job')
+    enqueue_parser.add_argument('--max_results', type=int, default=10, help='Number of search results to cluster')
+    enqueue_parser.add_argument('--num_clusters', type=int, default=5, help='Number of clusters to recommend on')
+    enqueue_parser.add_argument('--segment', help='If specified, clusters segments', action='store_true')
+    enqueue_parser.add_argument('--route_language', help='If specified, routes embeddings', action='store_true')
+    enqueue_parser.add_argument(
+        '--no_recommend',
+        help='If specified, skips the LLM recommendations',
+        action='store_true'
+    )
+    work_parser = subparsers.add_parser('work', help='Runs workers that claim and run jobs')
+    work_parser.add_argument('--results_dir', help='Folder for the results (defaults to results)', default='results')
+    work_parser.add_argument('--llm', choices=['openai', 'mistral', 'router'], default='openai', help='LLM API to use')
+    work_parser.add_argument(
+        '--local_embed',
+        help='If specified, uses local embedding model rather than LLM API call.',
+        action='store_true'
+    )
+    work_parser.add_argument('--checkpoint_dir', help='If specified, checkpoint folder shared by the workers')
+    work_parser.add_argument('--processes', type=int, default=1, help='Number of worker processes (defaults to 1)')
+    work_parser.add_argument('--lease', type=float, default=DEFAULT_LEASE, help='Job lease in seconds')
+    work_parser.add_argument('--max_jobs', type=int, help='If specified, each worker stops after this many jobs')
+    work_parser.add_argument(
+        '--exit_when_empty',
+        help='If specified, stops once no job is left queued or running',
+        action='store_true'
+    )
+    stats_parser = subparsers.add_parser('stats', help='Prints queue depth and worker throughput')
+    stats_parser.add_argument('--window', type=float, default=300., help='Seconds of recent throughput')
+    args = parser.parse_args()
+    if args.command == 'enqueue':
+        with open(args.input) as fidin:
+            input_searches = [line.strip() for line in fidin if line.strip()]
+        job_queue = JobQueue(args.db)
+        ids = job_queue.enqueue(
+            input_searches,
+            max_attempts=args.max_attempts,
+            max_results=args.max_results,
+            num_clusters=args.num_clusters,
+            segment=args.segment,
+            route_language=args.route_language,
+            recommend=not args.no_recommend
+        )
+        print("Enqueued {0} job(s)".format(len(ids)))
+    elif args.command == 'work':
+        work_kwargs = {
+            'db': args.db,
+            'results_dir': args.results_dir,
+            'llm': args.llm,
+            'local_embed': args.local_embed,
+            'checkpoint_dir': args.checkpoint_dir,
+            'lease': args.lease,
+            'max_jobs': args.max_jobs,
+            'exit_when_empty': args.exit_when_empty
+        }
+        if args.processes == 1:
+            work(**work_kwargs)
+        else:
+            processes = [multiprocessing.Process(target=work, kwargs=work_kwargs) for _ in range(args.processes)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+    else:
+        print(json.dumps(JobQueue(args.db).stats(window=args.window), indent=2))
@@ -7,10 +7,26 @@ import logging
 
 import requests
 
+from simsites.util import metrics
+
 USER_ROLE = 'user'
 SYSTEM_ROLE = 'system'
 AVAILABLE_ROLES = [USER_ROLE, SYSTEM_ROLE]
 
+_session = None
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the requests Session shared by all calls to the LLM APIs, so that connections are kept alive and reused
+    between requests.
+    :return: requests Session
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
 
 def get_headers(api_key: str) -> dict[str, str]:
     """
@@ -62,73 +78,158 @@ def system_message(content: AnyStr) -> Dict:
     return gen_chat_message(role=SYSTEM_ROLE, content=content)
 
 
-def request(
+def format_recommendations(recommendations: List[AnyStr], most_relevant_excerpts: List[List[AnyStr]]) -> AnyStr:
+    """
+    Formats numbered recommendations, each followed by its excerpts, for prompts that check several recommendations at
+    once.
+    :param recommendations: recommendations
+    :param most_relevant_excerpts: list of excerpts for each recommendation
+    :return: str
+    """
+    sections = list()
+    for i, (recommendation, excerpts) in enumerate(zip(recommendations, most_relevant_excerpts), start=1):
+        sections.append("Recommendation {0}: {1}\nExcerpts: {2}".format(i, recommendation, excerpts))
+    return '\n\n'.join(sections)
+
+
+def request_status(
     url: AnyStr,
     data: Dict[AnyStr, Any],
     headers: Dict[AnyStr, AnyStr] = None,
     timeout: int = 30
-) -> Any:
+) -> Tuple[Union[AnyStr, None], Union[int, None]]:
     """
-    Makes a request to the LLM API.
+    Makes a request to the LLM API and reports its HTTP status, so that callers can tell rate limits and server errors
+    apart from other failures.
     :param url: URL to hit
     :param data: data to be sent w. the request
     :param headers: request headers (if any)
     :param timeout: request timeout in seconds
-    :return: JSON string response from the API if successful, otherwise None
+    :return: tuple of (JSON string response from the API if successful otherwise None, HTTP status code or None if
+    no response was received e.g. on a timeout).
     """
-    result = None
     try:
-        r = requests.post(
+        r = get_session().post(
             url=url,
             headers=headers,
             json=data,
             timeout=timeout
         )
-        if r.status_code == 200:
-            result = r.text
-        else:
-            logging.error("LLM API returned {0}".format(r.status_code))
-    finally:
-        return result
+    except Exception as err:
+        logging.warning("LLM API request to {0} failed: {1}".format(url, err))
+        return None, None
+    if r.status_code == 200:
+        return r.text, r.status_code
+    logging.error("LLM API returned {0}".format(r.status_code))
+    return None, r.status_code
 
 
-def get_completions(
+def request(
+    url: AnyStr,
+    data: Dict[AnyStr, Any],
+    headers: Dict[AnyStr, AnyStr] = None,
+    timeout: int = 30
+) -> Any:
+    """
+    Makes a request to the LLM API.
+    :param url: URL to hit
+    :param data: data to be sent w. the request
+    :param headers: request headers (if any)
+    :param timeout: request timeout in seconds
+    :return: JSON string response from the API if successful, otherwise None
+    """
+    return request_status(url=url, data=data, headers=headers, timeout=timeout)[0]
+
+
+def record_usage(payload: Dict, model: AnyStr):
+    """
+    Records the token usage reported in an LLM API response, if metrics are enabled.
+    :param payload: decoded API response
+    :param model: model the request targeted
+    :return: None
+    """
+    if metrics.enabled():
+        for token_type, tokens in (payload.get('usage') or dict()).items():
+            if isinstance(tokens, int):
+                metrics.incr('llm_tokens', tokens, model=model, type=token_type)
+
+
+def get_completions_status(
         messages: List[Dict],
         api_key: AnyStr,
         completions_url: AnyStr,
         model: AnyStr,
-        timeout: int = 30
-) -> AnyStr:
+        timeout: int = 30,
+        response_format: Dict = None
+) -> Tuple[Union[AnyStr, None], Union[int, None]]:
     """
-    Makes a chat completion request to the LLM API.
+    Makes a chat completion request to the LLM API, see "get_completions", and reports its HTTP status.
     :param api_key: LLM API key
     :param messages: list of messages to send w. the request
     :param completions_url: Completions URL
     :param model: model to target
     :param timeout: request timeout in seconds
-    :return: model's response, or None if an error occurred.
+    :param response_format: if specified, the response format to request e.g. {'type': 'json_object'}
+    :return: tuple of (model's response or None if an error occurred, HTTP status code or None if no response was
+    received).
     """
     assistant_response = None
+    status = None
+    data = {
+        'model': model,
+        'messages': messages
+    }
+    if response_format:
+        data['response_format'] = response_format
     try:
-        response = request(
-            url=completions_url,
-            headers=get_headers(api_key=api_key),
-            data={
-                'model': model,
-                'messages': messages
-            },
-            timeout=timeout
-        )
-        if get_completions:
+        with metrics.timer('llm_completions', model=model):
+            response, status = request_status(
+                url=completions_url,
+                headers=get_headers(api_key=api_key),
+                data=data,
+                timeout=timeout
+            )
+        if response:
             payload = json.loads(response)
             choices = payload['choices']
             assistant_response = choices[0]['message']['content']
+            record_usage(payload, model=model)
         else:
-            logging.error("No Mistral completion request received returning None")
+            metrics.incr('llm_errors', model=model)
+            logging.error("No completion response received returning None")
     except Exception as err:
+        metrics.incr('llm_errors', model=model)
         logging.exception(err)
     finally:
-        return assistant_response
+        return assistant_response, status
+
+
+def get_completions(
+        messages: List[Dict],
+        api_key: AnyStr,
+        completions_url: AnyStr,
+        model: AnyStr,
+        timeout: int = 30,
+        response_format: Dict = None
+) -> AnyStr:
+    """
+    Makes a chat completion request to the LLM API.
+    :param api_key: LLM API key
+    :param messages: list of messages to send w. the request
+    :param completions_url: Completions URL
+    :param model: model to target
+    :param timeout: request timeout in seconds
+    :param response_format: if specified, the response format to request e.g. {'type': 'json_object'}
+    :return: model's response, or None if an error occurred.
+    """
+    return get_completions_status(
+        messages=messages,
+        api_key=api_key,
+        completions_url=completions_url,
+        model=model,
+        timeout=timeout,
+        response_format=response_format
+    )[0]
 
 
 def get_embeddings(
@@ -150,17 +251,22 @@ def get_embeddings(
     embeddings = list()
     try:
         for chunk in [lines[i: i + chunk_size] for i in range(0, len(lines), chunk_size)]:
-            embeddings_response = request(
-                url=embeddings_url,
-                headers=get_headers(api_key=api_key),
-                data={
-                    'model': model,
-                    'input': chunk
-                }
-            )
+            with metrics.timer('llm_embeddings', model=model):
+                embeddings_response = request(
+                    url=embeddings_url,
+                    headers=get_headers(api_key=api_key),
+                    data={
+                        'model': model,
+                        'input': chunk
+                    }
+                )
             if embeddings_response:
                 payload = json.loads(embeddings_response)
                 embeddings.extend([embedding['embedding'] for embedding in payload['data']])
+                metrics.incr('embedded_lines', len(chunk), backend=model)
+                record_usage(payload, model=model)
+            else:
+                metrics.incr('llm_errors', model=model)
     except Exception as err:
         logging.exception(err)
     finally:
@@ -0,0 +1,318 @@
+"""
+batch - submits many chat completion requests at once through a provider's batch endpoint (OpenAI-style Batch API),
+for offline runs where throughput and cost matter more than latency.
+
+    requests = [make_request('0-0', openai.seo_recommendations_messages(search, keywords), openai.DEFAULT_MODEL)]
+    results = run_batch(requests, client=BatchClient(api_key), workdir='batches')
+"""
+import concurrent.futures
+import json
+import logging
+import os
+import time
+import uuid
+from typing import *
+
+from simsites.llm.backend import get_session
+from simsites.util import metrics
+
+OPENAI_API_URL = "https://api.openai.com/v1"
+COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+# Statuses after which a batch won't change anymore
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+def make_request(
+        custom_id: AnyStr,
+        messages: List[Dict],
+        model: AnyStr,
+        endpoint: AnyStr = COMPLETIONS_ENDPOINT,
+        **params
+) -> Dict[AnyStr, Any]:
+    """
+    Builds one line of a batch input file.
+    :param custom_id: identifier used to match the result to the request, must be unique within the batch.
+    :param messages: chat messages e.g. from "openai.seo_recommendations_messages"
+    :param model: model to target
+    :param endpoint: API endpoint the request is for, defaults to chat completions.
+    :param params: other request parameters e.g. response_format={'type': 'json_object'}
+    :return: dict
+    """
+    return {
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': endpoint,
+        'body': {'model': model, 'messages': messages, **params}
+    }
+
+
+def write_batch_file(requests: List[Dict[AnyStr, Any]], fname: AnyStr) -> AnyStr:
+    """
+    Writes requests to a batch input file, one JSON object per line.
+    :param requests: requests from "make_request"
+    :param fname: file to write
+    :return: fname
+    """
+    custom_ids = set()
+    with open(fname, 'w', encoding='utf-8') as fidout:
+        for request in requests:
+            if request['custom_id'] in custom_ids:
+                raise ValueError("Duplicate custom_id '{0}'".format(request['custom_id']))
+            custom_ids.add(request['custom_id'])
+            fidout.write(json.dumps(request) + '\n')
+    return fname
+
+
+def read_batch_results(fname: AnyStr) -> Dict[AnyStr, Union[AnyStr, None]]:
+    """
+    Reads a batch output (or error) file.
+    :param fname: file to read
+    :return: dict of custom_id -> model's response, or None if the request failed.
+    """
+    results = dict()
+    with open(fname, encoding='utf-8') as fidin:
+        for line in fidin:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            content = None
+            response = record.get('response') or dict()
+            if response.get('status_code') == 200:
+                try:
+                    content = response['body']['choices'][0]['message']['content']
+                except (KeyError, IndexError, TypeError) as err:
+                    logging.warning("Unexpected response for '{0}': {1}".format(record.get('custom_id'), err))
+            else:
+                logging.warning("Request '{0}' failed: {1}".format(
+                    record.get('custom_id'),
+                    record.get('error') or response.get('status_code')
+                ))
+            results[record['custom_id']] = content
+    return results
+
+
+class BatchClient:
+    """
+    Client for an OpenAI-style Batch API: upload an input file, create a batch, poll it and download its output.
+    Methods return None if the API call fails.
+    """
+
+    def __init__(self, api_key: AnyStr, api_url: AnyStr = OPENAI_API_URL, timeout: int = 60):
+        """
+        :param api_key: API key
+        :param api_url: base URL of the API, defaults to OpenAI's.
+        :param timeout: request timeout in seconds
+        """
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self._headers = {'Authorization': 'Bearer {0}'.format(api_key)}
+
+    def _call(self, method: AnyStr, path: AnyStr, **kwargs) -> Any:
+        try:
+            r = get_session().request(
+                method,
+                self.api_url + path,
+                headers=self._headers,
+                timeout=self.timeout,
+                **kwargs
+            )
+            if r.status_code == 200:
+                return r
+            logging.error("Batch API returned {0} for {1}".format(r.status_code, path))
+        except Exception as err:
+            logging.exception(err)
+
+    def upload(self, fname: AnyStr) -> Union[AnyStr, None]:
+        """
+        Uploads a batch input file.
+        :param fname: file to upload
+        :return: file ID
+        """
+        with open(fname, 'rb') as fidin:
+            r = self._call('POST', '/files', data={'purpose': 'batch'}, files={'file': fidin})
+        return r.json()['id'] if r else None
+
+    def create(self, file_id: AnyStr, endpoint: AnyStr = COMPLETIONS_ENDPOINT) -> Union[Dict, None]:
+        """
+        Creates a batch from an uploaded input file.
+        :param file_id: ID of the input file
+        :param endpoint: endpoint of the requests in the file
+        :return: batch, a dict with (at least) 'id' and 'status'
+        """
+        r = self._call(
+            'POST',
+            '/batches',
+            json={'input_file_id': file_id, 'endpoint': endpoint, 'completion_window': '24h'}
+        )
+        return r.json() if r else None
+
+    def retrieve(self, batch_id: AnyStr) -> Union[Dict, None]:
+        """
+        Returns a batch's current state.
+        :param batch_id: batch ID
+        :return: batch, with 'output_file_id' and 'error_file_id' once it has completed.
+        """
+        r = self._call('GET', '/batches/{0}'.format(batch_id))
+        return r.json() if r else None
+
+    def download(self, file_id: AnyStr, fname: AnyStr) -> Union[AnyStr, None]:
+        """
+        Downloads a file e.g. a batch's output.
+        :param file_id: file ID
+        :param fname: file to write to
+        :return: fname
+        """
+        r = self._call('GET', '/files/{0}/content'.format(file_id))
+        if r is None:
+            return None
+        with open(fname, 'wb') as fidout:
+            fidout.write(r.content)
+        return fname
+
+
+class LocalBatchClient:
+    """
+    File-based stand-in for "BatchClient", for tests and local runs: batches are kept in a folder and run by calling
+    completion_function for each request, concurrently, the first time the batch is retrieved.
+    """
+
+    def __init__(self, root: AnyStr, completion_function: Callable[[Dict], Union[AnyStr, None]], max_workers: int = 4):
+        """
+        :param root: folder to keep files and batches in, created if it doesn't exist.
+        :param completion_function: function taking a request body (model, messages, ...) and returning the model's
+        response, or None on error, e.g. lambda body: openai.completions(**body)
+        :param max_workers: maximum number of requests run at once
+        """
+        self.root = root
+        self.completion_function = completion_function
+        self.max_workers = max_workers
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name: AnyStr) -> AnyStr:
+        return os.path.join(self.root, name)
+
+    def _save_batch(self, batch: Dict):
+        with open(self._path(batch['id'] + '.json'), 'w') as fidout:
+            json.dump(batch, fidout)
+
+    def upload(self, fname: AnyStr) -> AnyStr:
+        file_id = 'file-' + uuid.uuid4().hex
+        with open(fname, 'rb') as fidin, open(self._path(file_id), 'wb') as fidout:
+            fidout.write(fidin.read())
+        return file_id
+
+    def create(self, file_id: AnyStr, endpoint: AnyStr = COMPLETIONS_ENDPOINT) -> Dict:
+        batch = {
+            'id': 'batch-' + uuid.uuid4().hex,
+            'status': 'in_progress',
+            'endpoint': endpoint,
+            'input_file_id': file_id,
+            'output_file_id': None,
+            'error_file_id': None
+        }
+        self._save_batch(batch)
+        return batch
+
+    def retrieve(self, batch_id: AnyStr) -> Dict:
+        with open(self._path(batch_id + '.json')) as fidin:
+            batch = json.load(fidin)
+        if batch['status'] == 'in_progress':
+            self._run(batch)
+        return batch
+
+    def download(self, file_id: AnyStr, fname: AnyStr) -> AnyStr:
+        with open(self._path(file_id), 'rb') as fidin, open(fname, 'wb') as fidout:
+            fidout.write(fidin.read())
+        return fname
+
+    def _run(self, batch: Dict):
+        with open(self._path(batch['input_file_id']), encoding='utf-8') as fidin:
+            requests = [json.loads(line) for line in fidin if line.strip()]
+
+        def complete(request):
+            content = self.completion_function(request['body'])
+            if content is None:
+                return {'custom_id': request['custom_id'], 'response': None, 'error': {'message': 'Request failed'}}
+            return {
+                'custom_id': request['custom_id'],
+                'response': {
+                    'status_code': 200,
+                    'body': {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}}]}
+                },
+                'error': None
+            }
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            records = list(executor.map(complete, requests))
+        batch['output_file_id'] = 'file-' + uuid.uuid4().hex
+        with open(self._path(batch['output_file_id']), 'w', encoding='utf-8') as fidout:
+            for record in records:
+                fidout.write(json.dumps(record) + '\n')
+        batch['status'] = 'completed'
+        self._save_batch(batch)
+
+
+def run_batch(
+        requests: List[Dict[AnyStr, Any]],
+        client: Union[BatchClient, LocalBatchClient],
+        workdir: AnyStr,
+        poll_interval: float = 60.,
+        timeout: float = None,
+        max_retrieve_failures: int = 10
+) -> Dict[AnyStr, Union[AnyStr, None]]:
+    """
+    Submits requests as a batch and waits for the results.
+    :param requests: requests from "make_request"
+    :param client: batch client
+    :param workdir: folder to write the input and output files to
+    :param poll_interval: seconds between two checks of the batch's status
+    :param timeout: if specified, stop waiting after this many seconds. The batch keeps running and can be retrieved
+    later with its ID, which is logged.
+    :param max_retrieve_failures: stop waiting after this many consecutive failed checks of the batch's status. The
+    batch keeps running and can be retrieved later with its ID.
+    :return: dict of custom_id -> model's response, None for requests that failed or didn't complete.
+    """
+    results = {request['custom_id']: None for request in requests}
+    if not requests:
+        return results
+    os.makedirs(workdir, exist_ok=True)
+    # Unique per run, so that runs started in the same second don't overwrite each other's files
+    stamp = '{0}-{1}'.format(time.strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:8])
+    input_fname = write_batch_file(requests, os.path.join(workdir, 'batch-{0}-input.jsonl'.format(stamp)))
+    file_id = client.upload(input_fname)
+    batch = client.create(file_id) if file_id else None
+    if batch is None:
+        logging.error("Couldn't submit batch {0}".format(input_fname))
+        return results
+    logging.info("Submitted batch {0} with {1} request(s)".format(batch['id'], len(requests)))
+    metrics.incr('batch_requests', len(requests))
+    start = time.monotonic()
+    retrieve_failures = 0
+    while batch and batch['status'] not in FINAL_STATUSES:
+        if timeout is not None and time.monotonic() - start > timeout:
+            logging.warning("Batch {0} still {1} after {2}s, not waiting".format(batch['id'], batch['status'], timeout))
+            return results
+        time.sleep(poll_interval)
+        retrieved = client.retrieve(batch['id'])
+        if retrieved is None:
+            retrieve_failures += 1
+            if retrieve_failures >= max_retrieve_failures:
+                logging.error("Couldn't check batch {0} {1} times in a row, not waiting".format(
+                    batch['id'],
+                    retrieve_failures
+                ))
+                return results
+            continue
+        retrieve_failures = 0
+        batch = retrieved
+    logging.info("Batch {0} {1}".format(batch['id'], batch['status']))
+    for key in ('output_file_id', 'error_file_id'):
+        if batch.get(key):
+            fname = client.download(
+                batch[key],
+                os.path.join(workdir, 'batch-{0}-{1}.jsonl'.format(stamp, key.split('_')[0]))
+            )
+            if fname:
+                results.update(read_batch_results(fname))
+    metrics.incr('batch_failures', sum(1 for content in results.values() if content is None))
+    return results
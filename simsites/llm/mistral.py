@@ -1,19 +1,22 @@
 """
 mistral - code for working w. Mistral AI API
 """
-import os
 from typing import *
 
-from simsites.llm.backend import get_completions, get_embeddings, system_message, user_message
+from simsites.config import get_config
+from simsites.llm.backend import format_recommendations, get_completions, get_embeddings, system_message, \
+    user_message
 
-MISTRAL_API_KEY = os.environ["MISTRAL_API_KEY"]
 MISTRAL_COMPLETIONS_URL = "https://api.mistral.ai/v1/chat/completions"
 MISTRAL_MEDIUM = "mistral-medium-latest"
 MISTRAL_LARGE = "mistral-large-latest"
 DEFAULT_MISTRAL_MODEL = MISTRAL_LARGE
+DEFAULT_MODEL = DEFAULT_MISTRAL_MODEL
 
 MISTRAL_EMBEDDINGS = "mistral-embed"
+EMBEDDINGS_MODEL = MISTRAL_EMBEDDINGS
 MISTRAL_EMBEDDINGS_URL = "https://api.mistral.ai/v1/embeddings"
+JSON_RESPONSE_FORMAT = {'type': 'json_object'}
 
 MISTRAL_SEO_KEYWORDS_PROMPT = '''
 You are an expert Search Engine Optimization (SEO) Consultant. You are helping a client optimize their site contents to improve their search engine ranking for a specific search. You performed the search and clustered key terms from the top 10 search results for that same search. Your task is to explain these keywords to your customer in easy to understand terms, that they can then use to improve the contents of their own site.
@@ -73,6 +76,22 @@ And here are the most relevant excerpts from your client's current web site.
 {excerpts}
 '''
 
+MISTRAL_CHECK_RECOMMENDATIONS_PROMPT = '''
+You are an expert Search Engine Optimization (SEO) Consultant. You are helping a client optimize their site contents to improve their search engine ranking for a specific search. You have come up with several recommendations, based on your analysis of the top search results for that particular search.
+
+For each recommendation you will be shown excerpts from your client's website that were found to be the most similar to it. Your task is to examine the excerpts for each recommendation and decide if they meet the criteria for that recommendation. If they do, tell your client that they have done a good job implementing it. If they do not satisfy the criteria or do not seem relevant, offer suggestions on how your client can improve their site based on the recommendation.
+
+Here is the web search that your client seeks your help with.
+
+Search: {search}
+
+Here are your recommendations, each followed by the most relevant excerpts from your client's current web site.
+
+{recommendations}
+
+Respond with a JSON object of the form {{"results": [{{"id": <recommendation number>, "implemented": <true or false>, "assessment": "<your assessment of the excerpts>", "suggestions": "<your suggestions, or an empty string if implemented>"}}]}}, with one result per recommendation.
+'''
+
 
 def gen_json_response_message(content: AnyStr) -> Dict:
     """
@@ -86,22 +105,25 @@ def gen_json_response_message(content: AnyStr) -> Dict:
 def completions(
         messages: List[Dict],
         model: AnyStr = DEFAULT_MISTRAL_MODEL,
-        timeout: int = 30
+        timeout: int = 30,
+        response_format: Dict = None
 ) -> AnyStr:
     """
     Makes a chat completion request to the Mistral API.
     :param messages: list of messages to send w. the request
     :param model: model to target, defaults to "DEFAULT_MISTRAL_MODEL"
     :param timeout: request timeout in seconds
+    :param response_format: if specified, the response format to request e.g. {'type': 'json_object'}
     :return: model's response, or None if an error occurred.
     """
     # TODO: include check for first & second messages - if first is system, second must be user
     return get_completions(
-        api_key=MISTRAL_API_KEY,
+        api_key=get_config().get('mistral_api_key'),
         messages=messages,
         completions_url=MISTRAL_COMPLETIONS_URL,
         model=model,
-        timeout=timeout
+        timeout=timeout,
+        response_format=response_format
     )
 
 
@@ -116,7 +138,7 @@ def embeddings(
     :return: list of lists of floats
     """
     return get_embeddings(
-        api_key=MISTRAL_API_KEY,
+        api_key=get_config().get('mistral_api_key'),
         embeddings_url=MISTRAL_EMBEDDINGS_URL,
         model=MISTRAL_EMBEDDINGS,
         lines=lines,
@@ -124,6 +146,73 @@ def embeddings(
     )
 
 
+def seo_recommendations_messages(search: AnyStr, keywords: List[AnyStr]) -> List[Dict]:
+    """
+    Builds the messages of a "make_seo_recommendations" request, e.g. to submit them in a batch.
+    :param search: search to consider
+    :param keywords: list of keywords for that search
+    :return: list of messages
+    """
+    return [
+        system_message(MISTRAL_SEO_KEYWORDS_PROMPT.format(keywords=keywords, search=search)),
+        user_message(
+            "What do these keywords for the top search results for this search tell me about optimizing my "
+            "site for the same search?"
+        )
+    ]
+
+
+def check_recommendation_messages(
+        search: AnyStr,
+        recommendation: AnyStr,
+        most_relevant_excerpts: List[AnyStr]
+) -> List[Dict]:
+    """
+    Builds the messages of a "check_seo_recommendation" request, e.g. to submit them in a batch.
+    :param search: search to consider
+    :param recommendation: recommendation to check
+    :param most_relevant_excerpts: most relevant excerpts from the site
+    :return: list of messages
+    """
+    return [
+        system_message(
+            MISTRAL_CHECK_RECOMMENDATION_PROMPT.format(
+                search=search,
+                recommendation=recommendation,
+                excerpts=most_relevant_excerpts
+            )
+        ),
+        user_message(
+            "Does my website meet the conditions you detailed in your SEO recommendations?"
+        )
+    ]
+
+
+def check_recommendations_messages(
+        search: AnyStr,
+        recommendations: List[AnyStr],
+        most_relevant_excerpts: List[List[AnyStr]]
+) -> List[Dict]:
+    """
+    Builds the messages of a "check_seo_recommendations" request, e.g. to submit them in a batch.
+    :param search: search to consider
+    :param recommendations: recommendations to check
+    :param most_relevant_excerpts: for each recommendation, the most relevant excerpts from the site.
+    :return: list of messages
+    """
+    return [
+        system_message(
+            MISTRAL_CHECK_RECOMMENDATIONS_PROMPT.format(
+                search=search,
+                recommendations=format_recommendations(recommendations, most_relevant_excerpts)
+            )
+        ),
+        user_message(
+            "Does my website meet the conditions you detailed in each of your SEO recommendations?"
+        )
+    ]
+
+
 def make_seo_recommendations(search: AnyStr, keywords: List[AnyStr]) -> Any:
     """
     Makes SEO recommendations for a given search, based on the list of keywords.
@@ -131,29 +220,37 @@ def make_seo_recommendations(search: AnyStr, keywords: List[AnyStr]) -> Any:
     :param keywords: list of keywords for that search e.g. topk most common words used in first 10 search results.
     :return: Mistral LLM's suggestions
     """
+    return completions(messages=seo_recommendations_messages(search=search, keywords=keywords))
+
+
+def check_seo_recommendation(search: AnyStr, recommendation: AnyStr, most_relevant_excerpts: List[AnyStr]) -> Any:
     return completions(
-        messages=[
-            system_message(MISTRAL_SEO_KEYWORDS_PROMPT.format(keywords=keywords, search=search)),
-            user_message(
-                "What do these keywords for the top search results for this search tell me about optimizing my "
-                "site for the same search?"
-            )
-        ]
+        messages=check_recommendation_messages(
+            search=search,
+            recommendation=recommendation,
+            most_relevant_excerpts=most_relevant_excerpts
+        )
     )
 
 
-def check_seo_recommendation(search: AnyStr, recommendation: AnyStr, most_relevant_excerpts: List[AnyStr]) -> Any:
+def check_seo_recommendations(
+        search: AnyStr,
+        recommendations: List[AnyStr],
+        most_relevant_excerpts: List[List[AnyStr]]
+) -> Any:
+    """
+    Checks a site against several SEO recommendations in a single request.
+    :param search: search to consider
+    :param recommendations: recommendations to check
+    :param most_relevant_excerpts: for each recommendation, the most relevant excerpts from the site.
+    :return: JSON string of the form {"results": [{"id": ..., "implemented": ..., "assessment": ..., "suggestions":
+    ...}]} where ids are the 1-based positions of the recommendations, or None if an error occurred.
+    """
     return completions(
-        messages=[
-            system_message(
-                MISTRAL_CHECK_RECOMMENDATION_PROMPT.format(
-                    search=search,
-                    recommendation=recommendation,
-                    excerpts=most_relevant_excerpts
-                )
-            ),
-            user_message(
-                "Does my website meet the conditions you detailed in your SEO recommendations?"
-            )
-        ]
+        messages=check_recommendations_messages(
+            search=search,
+            recommendations=recommendations,
+            most_relevant_excerpts=most_relevant_excerpts
+        ),
+        response_format=JSON_RESPONSE_FORMAT
     )
@@ -0,0 +1,441 @@
+"""
+router - spreads chat completion requests across several LLM providers and models, and fails over to another provider
+when one is rate limited, erroring or timing out.
+
+Providers are picked at random in proportion to their weight divided by their recent latency, so faster providers get
+more of the traffic. A provider that fails is put in a cooldown that doubles with each consecutive failure, and is
+skipped until the cooldown ends (unless every provider is cooling down).
+
+The module can be used in place of simsites.llm.openai or simsites.llm.mistral, routing across every provider whose API
+key is configured:
+
+    import simsites.llm.router as router
+    router.make_seo_recommendations(search, keywords)
+    router.get_router().stats()
+
+or with explicit providers:
+
+    llm = ProviderRouter([Provider('openai', OPENAI_COMPLETIONS_URL, api_key, 'gpt-4-turbo-preview', weight=2.), ...])
+"""
+import random
+import threading
+import time
+from typing import *
+import logging
+
+import simsites.llm.mistral as mistral
+import simsites.llm.openai as openai
+from simsites.config import get_config
+from simsites.llm.backend import get_completions_status
+from simsites.util import metrics
+
+# Statuses worth retrying with another provider: the request may succeed elsewhere, including 404 (e.g. a model or
+# endpoint one provider doesn't have) and 422 (a payload one provider's API doesn't accept). Anything else (e.g. 400 Bad
+# Request) would fail on every provider.
+FAILOVER_STATUSES = (401, 403, 404, 408, 409, 422, 429, 500, 502, 503, 504)
+# Seconds a provider is skipped after its first consecutive failure, doubled after each further failure
+DEFAULT_COOLDOWN = 5.
+MAX_COOLDOWN = 300.
+# Weight of the latest request in a provider's average latency
+LATENCY_SMOOTHING = 0.3
+
+# Embeddings aren't routed: vectors from different models can't be compared, so they always come from OpenAI.
+EMBEDDINGS_MODEL = openai.EMBEDDINGS_MODEL
+embeddings = openai.embeddings
+
+DEFAULT_MODEL = 'router'
+
+
+class Provider:
+    """
+    A completions endpoint and model requests can be routed to.
+    """
+
+    def __init__(
+            self,
+            name: AnyStr,
+            completions_url: AnyStr,
+            api_key: AnyStr,
+            model: AnyStr,
+            weight: float = 1.,
+            prompts: Any = openai
+    ):
+        """
+        :param name: unique name of the provider e.g. "openai" or "openai-gpt35"
+        :param completions_url: chat completions URL
+        :param api_key: API key
+        :param model: model to target
+        :param weight: relative share of the requests sent to this provider when latencies are equal
+        :param prompts: LLM module whose message builders are used for this provider e.g. simsites.llm.mistral.
+        Defaults to simsites.llm.openai.
+        """
+        if weight <= 0:
+            raise ValueError("Provider '{0}' weight must be positive, got {1}".format(name, weight))
+        self.name = name
+        self.completions_url = completions_url
+        self.api_key = api_key
+        self.model = model
+        self.weight = weight
+        self.prompts = prompts
+        # Health and latency stats, updated by the router
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.statuses = dict()
+        self.latency = None
+        self.cooldown_until = 0.
+
+    def available(self, now: float) -> bool:
+        """
+        :param now: time.monotonic() value
+        :return: True if the provider isn't cooling down
+        """
+        return now >= self.cooldown_until
+
+    def stats(self, now: float) -> Dict[AnyStr, Any]:
+        """
+        :param now: time.monotonic() value
+        :return: dict of the provider's health and latency stats
+        """
+        return {
+            'model': self.model,
+            'weight': self.weight,
+            'requests': self.requests,
+            'successes': self.successes,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'statuses': dict(self.statuses),
+            'latency': self.latency,
+            'healthy': self.available(now),
+            'cooldown_remaining': max(0., self.cooldown_until - now)
+        }
+
+
+class ProviderRouter:
+    """
+    Routes chat completion requests across providers by weight and latency, with failover. Thread-safe. Has the same
+    completion functions and attributes (__name__, DEFAULT_MODEL) as the LLM modules, so it can be passed wherever they
+    are e.g. workflow.run_search(llm=router) or SimsitesService(llm=router).
+    Prompts are built for each attempt with the message builders of the provider's prompts module.
+    """
+
+    def __init__(
+            self,
+            providers: List[Provider],
+            max_attempts: int = None,
+            cooldown: float = DEFAULT_COOLDOWN,
+            max_cooldown: float = MAX_COOLDOWN,
+            smoothing: float = LATENCY_SMOOTHING,
+            seed: int = None
+    ):
+        """
+        :param providers: providers to route to, at least one.
+        :param max_attempts: maximum number of providers tried per request, defaults to all of them.
+        :param cooldown: seconds a provider is skipped after a failure, doubled after each consecutive failure.
+        :param max_cooldown: maximum cooldown in seconds
+        :param smoothing: weight of the latest request in each provider's average latency, between 0 and 1.
+        :param seed: random seed, for reproducible routing.
+        """
+        if not providers:
+            raise ValueError("At least one provider is required")
+        names = [provider.name for provider in providers]
+        if len(set(names)) != len(names):
+            raise ValueError("Provider names must be unique, got {0}".format(names))
+        self.providers = list(providers)
+        self.max_attempts = max_attempts or len(self.providers)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.smoothing = smoothing
+        # Identity of the router for checkpoint keys, like an LLM module's (see "workflow.run_search")
+        self.__name__ = __name__
+        self.DEFAULT_MODEL = ','.join('{0}:{1}'.format(provider.name, provider.model) for provider in self.providers)
+        self.EMBEDDINGS_MODEL = EMBEDDINGS_MODEL
+        self.embeddings = embeddings
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _score(self, provider: Provider, default_latency: float) -> float:
+        return provider.weight / max(provider.latency or default_latency, 1e-3)
+
+    def select(self, exclude: Collection[AnyStr] = ()) -> Union[Provider, None]:
+        """
+        Picks the provider for the next attempt: at random among the providers that aren't cooling down, in proportion
+        to their weight divided by their average latency. Providers that haven't answered yet are scored with the
+        average latency of the others, so they get tried. If every provider is cooling down, picks the one whose
+        cooldown ends first.
+        :param exclude: names of providers not to pick e.g. those that already failed this request.
+        :return: Provider, or None if every provider is excluded.
+        """
+        with self._lock:
+            candidates = [provider for provider in self.providers if provider.name not in exclude]
+            if not candidates:
+                return None
+            now = time.monotonic()
+            available = [provider for provider in candidates if provider.available(now)]
+            if not available:
+                return min(candidates, key=lambda provider: provider.cooldown_until)
+            latencies = [provider.latency for provider in self.providers if provider.latency is not None]
+            default_latency = sum(latencies) / len(latencies) if latencies else 1.
+            scores = [self._score(provider, default_latency) for provider in available]
+            return self._random.choices(available, weights=scores)[0]
+
+    def _record(self, provider: Provider, status: Union[int, None], outcome: AnyStr, elapsed: float):
+        """
+        Updates a provider's stats after an attempt.
+        :param provider: provider that was tried
+        :param status: HTTP status code, or None if no response was received.
+        :param outcome: "success", "failure" (the provider is unhealthy: counted as a failure and put in cooldown) or
+        "rejected" (the request itself was refused e.g. 400: only its status is counted).
+        :param elapsed: seconds the attempt took
+        :return: None
+        """
+        status_key = str(status) if status is not None else 'timeout'
+        with self._lock:
+            provider.requests += 1
+            provider.statuses[status_key] = provider.statuses.get(status_key, 0) + 1
+            if outcome == 'success':
+                provider.successes += 1
+                provider.consecutive_failures = 0
+                provider.cooldown_until = 0.
+                if provider.latency is None:
+                    provider.latency = elapsed
+                else:
+                    provider.latency = self.smoothing * elapsed + (1 - self.smoothing) * provider.latency
+            elif outcome == 'failure':
+                provider.failures += 1
+                provider.consecutive_failures += 1
+                cooldown = min(self.cooldown * 2 ** (provider.consecutive_failures - 1), self.max_cooldown)
+                provider.cooldown_until = time.monotonic() + cooldown
+        metrics.incr('router_requests', provider=provider.name, status=status_key)
+
+    def completions(
+            self,
+            messages: List[Dict],
+            model: AnyStr = None,
+            timeout: int = 30,
+            response_format: Dict = None
+    ) -> Union[AnyStr, None]:
+        """
+        Makes a chat completion request, trying another provider if the first one is rate limited (429), erroring (5xx),
+        times out or can't be reached.
+        :param messages: list of messages to send w. the request, to every provider.
+        :param model: ignored, each provider targets its own model. Accepted for compatibility with the LLM modules.
+        :param timeout: timeout in seconds of each attempt
+        :param response_format: if specified, the response format to request e.g. {'type': 'json_object'}
+        :return: model's response, or None if every attempt failed.
+        """
+        return self._complete(lambda prompts: messages, timeout=timeout, response_format=response_format)
+
+    def _complete(
+            self,
+            build_messages: Callable[[Any], List[Dict]],
+            timeout: int = 30,
+            response_format: Dict = None,
+            json_response: bool = False
+    ) -> Union[AnyStr, None]:
+        """
+        Makes a chat completion request with failover, building the messages for each provider tried.
+        :param build_messages: function taking the provider's prompts module and returning the messages to send.
+        :param timeout: timeout in seconds of each attempt
+        :param response_format: if specified, the response format to request e.g. {'type': 'json_object'}
+        :param json_response: if True, requests the JSON response format of the provider's prompts module.
+        :return: model's response, or None if every attempt failed.
+        """
+        tried = list()
+        while len(tried) < self.max_attempts:
+            provider = self.select(exclude=tried)
+            if provider is None:
+                break
+            tried.append(provider.name)
+            start = time.monotonic()
+            response, status = get_completions_status(
+                messages=build_messages(provider.prompts),
+                api_key=provider.api_key,
+                completions_url=provider.completions_url,
+                model=provider.model,
+                timeout=timeout,
+                response_format=provider.prompts.JSON_RESPONSE_FORMAT if json_response else response_format
+            )
+            elapsed = time.monotonic() - start
+            if response is not None:
+                self._record(provider, status, 'success', elapsed)
+                if len(tried) > 1:
+                    metrics.incr('router_failovers')
+                return response
+            if status is not None and status != 200 and status not in FAILOVER_STATUSES:
+                # The request was refused, not the provider failing: don't put a healthy provider in cooldown
+                self._record(provider, status, 'rejected', elapsed)
+                logging.error("Provider '{0}' returned {1}, not retrying".format(provider.name, status))
+                break
+            # Timeouts, connection errors, failover statuses and unreadable 200 responses
+            self._record(provider, status, 'failure', elapsed)
+            logging.warning("Provider '{0}' failed ({1}), {2}".format(
+                provider.name,
+                status if status is not None else 'no response',
+                'failing over' if len(tried) < min(self.max_attempts, len(self.providers)) else 'giving up'
+            ))
+        return None
+
+    def stats(self) -> Dict[AnyStr, Dict[AnyStr, Any]]:
+        """
+        Returns each provider's health and latency stats.
+        :return: dict of provider name -> {'model', 'weight', 'requests', 'successes', 'failures',
+        'consecutive_failures', 'statuses' (status code or 'timeout' -> count), 'latency' (average seconds of successful
+        requests), 'healthy', 'cooldown_remaining'}
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {provider.name: provider.stats(now) for provider in self.providers}
+
+    def make_seo_recommendations(self, search: AnyStr, keywords: List[AnyStr]) -> Any:
+        """
+        Makes SEO recommendations for a given search, based on the list of keywords.
+        :param search: search to consider
+        :param keywords: list of keywords for that search e.g. topk most common words used in first 10 search results.
+        :return: LLM's suggestions
+        """
+        return self._complete(lambda prompts: prompts.seo_recommendations_messages(search=search, keywords=keywords))
+
+    def check_seo_recommendation(
+            self,
+            search: AnyStr,
+            recommendation: AnyStr,
+            most_relevant_excerpts: List[AnyStr]
+    ) -> Any:
+        return self._complete(
+            lambda prompts: prompts.check_recommendation_messages(
+                search=search,
+                recommendation=recommendation,
+                most_relevant_excerpts=most_relevant_excerpts
+            )
+        )
+
+    def check_seo_recommendations(
+            self,
+            search: AnyStr,
+            recommendations: List[AnyStr],
+            most_relevant_excerpts: List[List[AnyStr]]
+    ) -> Any:
+        """
+        Checks a site against several SEO recommendations in a single request, see "openai.check_seo_recommendations".
+        :param search: search to consider
+        :param recommendations: recommendations to check
+        :param most_relevant_excerpts: for each recommendation, the most relevant excerpts from the site.
+        :return: JSON string, or None if an error occurred.
+        """
+        return self._complete(
+            lambda prompts: prompts.check_recommendations_messages(
+                search=search,
+                recommendations=recommendations,
+                most_relevant_excerpts=most_relevant_excerpts
+            ),
+            json_response=True
+        )
+
+
+def default_providers() -> List[Provider]:
+    """
+    Builds a provider for each LLM API whose key is configured, targeting its default model with its own prompts.
+    :return: list of Provider
+    """
+    config = get_config()
+    providers = list()
+    for name, module, key_name, url_name in (
+            ('openai', openai, 'openai_api_key', 'OPENAI_COMPLETIONS_URL'),
+            ('mistral', mistral, 'mistral_api_key', 'MISTRAL_COMPLETIONS_URL')
+    ):
+        api_key = config.get(key_name, required=False)
+        if api_key:
+            providers.append(Provider(
+                name=name,
+                completions_url=getattr(module, url_name),
+                api_key=api_key,
+                model=module.DEFAULT_MODEL,
+                prompts=module
+            ))
+    return providers
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ProviderRouter:
+    """
+    Returns the router used by this module's functions, built from "default_providers" on first use.
+    :return: ProviderRouter
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            providers = default_providers()
+            if not providers:
+                raise ValueError("No LLM API key configured: set openai_api_key and/or mistral_api_key")
+            _router = ProviderRouter(providers)
+        return _router
+
+
+def set_router(router: Union[ProviderRouter, None]):
+    """
+    Replaces the router used by this module's functions.
+    :param router: ProviderRouter, or None to rebuild it from the configuration on next use.
+    :return: None
+    """
+    global _router
+    with _router_lock:
+        _router = router
+
+
+def completions(
+        messages: List[Dict],
+        model: AnyStr = None,
+        timeout: int = 30,
+        response_format: Dict = None
+) -> AnyStr:
+    """
+    Makes a chat completion request through the router, see "ProviderRouter.completions".
+    :param messages: list of messages to send w. the request
+    :param model: ignored, each provider targets its own model.
+    :param timeout: timeout in seconds of each attempt
+    :param response_format: if specified, the response format to request e.g. {'type': 'json_object'}
+    :return: model's response, or None if every attempt failed.
+    """
+    return get_router().completions(messages=messages, model=model, timeout=timeout, response_format=response_format)
+
+
+def make_seo_recommendations(search: AnyStr, keywords: List[AnyStr]) -> Any:
+    """
+    Makes SEO recommendations for a given search, based on the list of keywords.
+    :param search: search to consider
+    :param keywords: list of keywords for that search e.g. topk most common words used in first 10 search results.
+    :return: LLM's suggestions
+    """
+    return get_router().make_seo_recommendations(search=search, keywords=keywords)
+
+
+def check_seo_recommendation(search: AnyStr, recommendation: AnyStr, most_relevant_excerpts: List[AnyStr]) -> Any:
+    return get_router().check_seo_recommendation(
+        search=search,
+        recommendation=recommendation,
+        most_relevant_excerpts=most_relevant_excerpts
+    )
+
+
+def check_seo_recommendations(
+        search: AnyStr,
+        recommendations: List[AnyStr],
+        most_relevant_excerpts: List[List[AnyStr]]
+) -> Any:
+    """
+    Checks a site against several SEO recommendations in a single request, see "openai.check_seo_recommendations".
+    :param search: search to consider
+    :param recommendations: recommendations to check
+    :param most_relevant_excerpts: for each recommendation, the most relevant excerpts from the site.
+    :return: JSON string, or None if an error occurred.
+    """
+    return get_router().check_seo_recommendations(
+        search=search,
+        recommendations=recommendations,
+        most_relevant_excerpts=most_relevant_excerpts
+    )
@@ -0,0 +1,277 @@
+"""
+pipeline - runs fetch -> clean -> embed -> cluster as concurrent stages connected by bounded queues
+"""
+import logging
+import queue
+import threading
+import time
+from typing import *
+
+from simsites.cluster import cluster_lines, site_lines
+from simsites.util import serpapi
+from simsites.util.embed import embedding_model_id, generate_embeddings
+
+_DONE = object()
+
+
+def concat_embeddings(chunks: List[Any]) -> Any:
+    """
+    Concatenates the embeddings returned by several calls to an embed function into the type a single call would
+    have returned.
+    :param chunks: list of embeddings e.g. tensors, arrays or lists of lists of floats.
+    :return: concatenated embeddings
+    """
+    if len(chunks) == 0:
+        return list()
+    if hasattr(chunks[0], 'dim'):
+        import torch
+        return torch.cat(chunks)
+    if hasattr(chunks[0], 'ndim'):
+        import numpy as np
+        return np.concatenate(chunks)
+    return [embedding for chunk in chunks for embedding in chunk]
+
+
+class StageStats:
+    """
+    Busy time and item count of a pipeline stage.
+    """
+
+    def __init__(self, name: AnyStr, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, items: int = 1):
+        """
+        Records work done by the stage.
+        :param elapsed: seconds spent working
+        :param items: number of items processed
+        :return: None
+        """
+        with self._lock:
+            self.busy += elapsed
+            self.items += items
+
+    def as_dict(self, wall_time: float) -> Dict[AnyStr, Any]:
+        """
+        Summarizes the stage.
+        :param wall_time: total pipeline run time in seconds
+        :return: dict with number of items, busy seconds and utilization (fraction of the stage workers' time spent
+        working rather than waiting on other stages).
+        """
+        return {
+            'items': self.items,
+            'workers': self.workers,
+            'busy_s': self.busy,
+            'utilization': self.busy / (wall_time * self.workers) if wall_time > 0 else 0.
+        }
+
+
+class Pipeline:
+    """
+    Clusters the text of several websites with fetching, cleaning and embedding running concurrently: pages are cleaned
+    and embedded while later pages are still downloading. Queues between the stages are bounded, so a slow stage
+    applies back-pressure to the stages before it.
+
+    Output is the same as fetching every site and calling "cluster_sites": by default lines are embedded in the same
+    order, in one call after cleaning. Setting embed_batch_size embeds lines in batches as they arrive instead, which
+    overlaps embedding with downloading; models that pad each batch may then return embeddings that differ from a
+    single call by floating point noise.
+    """
+
+    def __init__(
+            self,
+            fetch_function: Callable[[Any], AnyStr] = serpapi.fetch_result,
+            embed_function: Any = generate_embeddings,
+            min_cluster_size: int = 5,
+            threshold: float = 0.75,
+            fetch_workers: int = 8,
+            queue_size: int = 4,
+            embed_batch_size: Union[int, None] = None,
+            segment: bool = False
+    ):
+        """
+        :param fetch_function: function that accepts an item (e.g. an organic search result) and returns the HTML
+        source of the site. Defaults to "serpapi.fetch_result".
+        :param embed_function: function to generate embeddings, should accept a list of strings and return a list of
+        floats or tensors.
+        :param min_cluster_size: minimum cluster size in lines, see "cluster_sites".
+        :param threshold: clustering (similarity) threshold, see "cluster_sites".
+        :param fetch_workers: number of sites fetched concurrently.
+        :param queue_size: maximum number of items waiting between two stages.
+        :param embed_batch_size: if specified, number of lines per call to embed_function, to embed lines while later
+        sites are still downloading. Defaults to None, which embeds all lines at once like "cluster_sites".
+        :param segment: if True, clusters size-balanced segments rather than lines, see "cluster_sites".
+        """
+        self.fetch_function = fetch_function
+        self.embed_function = embed_function
+        self.min_cluster_size = min_cluster_size
+        self.threshold = threshold
+        self.fetch_workers = fetch_workers
+        self.queue_size = queue_size
+        self.embed_batch_size = embed_batch_size
+        self.segment = segment
+        self._stats = dict()
+        self._wall_time = 0.
+        self._errors = list()
+
+    def stats(self) -> Dict[AnyStr, Any]:
+        """
+        Per-stage statistics of the last run.
+        :return: dict of the form {'wall_s': run time in seconds, 'stages': {stage name: stage stats}}
+        """
+        return {
+            'wall_s': self._wall_time,
+            'stages': {name: stage.as_dict(self._wall_time) for name, stage in self._stats.items()}
+        }
+
+    def _fetch(self, inbox: queue.Queue, outbox: queue.Queue, remaining: List[int], lock: threading.Lock):
+        stats = self._stats['fetch']
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            idx, search_result = item
+            start = time.perf_counter()
+            try:
+                site_src = self.fetch_function(search_result)
+            except Exception as err:
+                logging.exception(err)
+                self._errors.append(err)
+                site_src = None
+            stats.record(time.perf_counter() - start)
+            outbox.put((idx, site_src))
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                outbox.put(_DONE)
+
+    def _clean(self, inbox: queue.Queue, outbox: queue.Queue):
+        stats = self._stats['clean']
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            idx, site_src = item
+            start = time.perf_counter()
+            try:
+                lines = site_lines(site_src, segment=self.segment) if site_src else list()
+            except Exception as err:
+                logging.exception(err)
+                self._errors.append(err)
+                lines = list()
+            stats.record(time.perf_counter() - start)
+            outbox.put((idx, lines))
+        outbox.put(_DONE)
+
+    def _embed(self, inbox: queue.Queue, lines: List[AnyStr], chunks: List[Any]):
+        stats = self._stats['embed']
+        pending = dict()
+        next_idx = 0
+        embedded = 0
+        while True:
+            item = inbox.get()
+            if item is not _DONE:
+                pending[item[0]] = item[1]
+            # Sites arrive in completion order: lines are embedded in site order so output matches "cluster_sites"
+            while next_idx in pending:
+                lines.extend(pending.pop(next_idx))
+                next_idx += 1
+            last = item is _DONE
+            while not self._errors and self.embed_batch_size and len(lines) - embedded >= self.embed_batch_size:
+                embedded = self._embed_batch(stats, lines, chunks, embedded, embedded + self.embed_batch_size)
+            if last:
+                if not self._errors and len(lines) > embedded:
+                    self._embed_batch(stats, lines, chunks, embedded, len(lines))
+                break
+
+    def _embed_batch(self, stats: StageStats, lines: List[AnyStr], chunks: List[Any], start: int, end: int) -> int:
+        started = time.perf_counter()
+        try:
+            chunks.append(self.embed_function(lines[start:end]))
+        except Exception as err:
+            logging.exception(err)
+            self._errors.append(err)
+        stats.record(time.perf_counter() - started, items=end - start)
+        return end
+
+    def run(self, items: List[Any]) -> Union[Dict[AnyStr, Any], None]:
+        """
+        Fetches, cleans, embeds and clusters the sites.
+        :param items: items to fetch e.g. organic search results, passed to fetch_function one at a time.
+        :return: dict of the same form as "cluster_sites", or None if no text was found.
+        """
+        self._stats = {
+            'fetch': StageStats('fetch', workers=min(self.fetch_workers, max(len(items), 1))),
+            'clean': StageStats('clean'),
+            'embed': StageStats('embed'),
+            'cluster': StageStats('cluster')
+        }
+        self._errors = list()
+        start = time.perf_counter()
+        to_fetch = queue.Queue()
+        fetched = queue.Queue(maxsize=self.queue_size)
+        cleaned = queue.Queue(maxsize=self.queue_size)
+        for item in enumerate(items):
+            to_fetch.put(item)
+        num_fetchers = self._stats['fetch'].workers
+        for _ in range(num_fetchers):
+            to_fetch.put(_DONE)
+        lines = list()
+        chunks = list()
+        lock = threading.Lock()
+        remaining_fetchers = [num_fetchers]
+        threads = [
+            threading.Thread(target=self._fetch, args=(to_fetch, fetched, remaining_fetchers, lock), daemon=True)
+            for _ in range(num_fetchers)
+        ]
+        threads.append(threading.Thread(target=self._clean, args=(fetched, cleaned), daemon=True))
+        threads.append(threading.Thread(target=self._embed, args=(cleaned, lines, chunks), daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result = None
+        if self._errors:
+            self._wall_time = time.perf_counter() - start
+            raise self._errors[0]
+        if len(lines) > 0:
+            cluster_start = time.perf_counter()
+            result = cluster_lines(
+                lines=lines,
+                embeddings=concat_embeddings(chunks),
+                min_cluster_size=self.min_cluster_size,
+                threshold=self.threshold,
+                embedding_model=embedding_model_id(self.embed_function)
+            )
+            self._stats['cluster'].record(time.perf_counter() - cluster_start)
+        else:
+            logging.warning("No text received returning None")
+        self._wall_time = time.perf_counter() - start
+        return result
+
+
+def cluster_search(
+        search: AnyStr,
+        max_results: int = 10,
+        timeout: int = 30,
+        **kwargs
+) -> Tuple[Union[Dict[AnyStr, Any], None], Dict[AnyStr, Any]]:
+    """
+    Conducts a search and clusters the text of the top results with a "Pipeline".
+    :param search: search to perform
+    :param max_results: maximum number of results to fetch (defaults to 10)
+    :param timeout: request timeout in seconds. Defaults to 30.
+    :param kwargs: passed on to "Pipeline".
+    :return: tuple of ("cluster_sites" results, per-stage statistics)
+    """
+    pipeline = Pipeline(
+        fetch_function=lambda search_result: serpapi.fetch_result(search_result, timeout=timeout),
+        **kwargs
+    )
+    search_results = serpapi.get_organic_search_results(search=search, timeout=timeout)
+    result = pipeline.run(search_results[:max_results])
+    return result, pipeline.stats()
@@ -0,0 +1,308 @@
+"""
+service - long-running local HTTP service that keeps embedding models, HTTP connections and results warm between
+requests.
+
+Endpoints (JSON in, JSON out):
+    POST /cluster   {"search": ..., "max_results": 10, "recommend": true}
+    POST /check     {"search": ..., "url": ..., "recommendation": ..., "crawl": false, "k": 2}
+    GET  /health
+    GET  /metrics   (Prometheus text format, run with --metrics)
+"""
+import argparse
+import collections
+import importlib
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import *
+
+import requests
+
+from simsites import cluster, pipeline
+from simsites.util import crawler, embed, metrics, vector_store
+from simsites.util.batcher import EmbeddingBatcher
+from simsites.util.text_cleaner import strip_site, split_site
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache.
+    """
+
+    def __init__(self, name: AnyStr, max_size: int = 32):
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        """
+        Returns a cached value.
+        :param key: key of the value
+        :return: the value, or None if it isn't cached.
+        """
+        with self._lock:
+            if key in self._items:
+                self.hits += 1
+                self._items.move_to_end(key)
+                metrics.incr('cache_hits', cache=self.name)
+                return self._items[key]
+            self.misses += 1
+            metrics.incr('cache_misses', cache=self.name)
+            return None
+
+    def put(self, key: Any, value: Any):
+        """
+        Caches a value, evicting the least recently used value if the cache is full.
+        :param key: key of the value
+        :param value: value to cache
+        :return: None
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+class SimsitesService:
+    """
+    Clusters searches and checks sites against SEO recommendations, sharing one embedder (and embedding micro-batches)
+    across all concurrent requests.
+    """
+
+    def __init__(
+            self,
+            llm: Any,
+            local_embed: bool = True,
+            max_batch_size: int = 256,
+            max_wait: float = 0.01,
+            cache_size: int = 32
+    ):
+        """
+        :param llm: LLM module e.g. simsites.llm.openai or simsites.llm.mistral
+        :param local_embed: if True (default), uses local embeddings models. Otherwise uses the LLM module's embeddings.
+        :param max_batch_size: maximum number of lines per embedding call
+        :param max_wait: maximum time in seconds an embedding request waits to share a batch with other requests
+        :param cache_size: number of searches and site indexes to keep in memory
+        """
+        self.llm = llm
+        if local_embed:
+            embed.get_local_embedder()
+            self.model_id = embed.MULTILINGUAL_EMBEDDING_MODEL
+            embed_function = embed.generate_embeddings
+        else:
+            self.model_id = llm.EMBEDDINGS_MODEL
+            embed_function = llm.embeddings
+        self.embedder = EmbeddingBatcher(embed_function, max_batch_size=max_batch_size, max_wait=max_wait)
+        self.searches = LRUCache('searches', max_size=cache_size)
+        self.sites = LRUCache('sites', max_size=cache_size)
+
+    def cluster_search(self, search: AnyStr, max_results: int = 10, recommend: bool = True) -> Dict[AnyStr, Any]:
+        """
+        Clusters the top results for a search and (optionally) asks the LLM for recommendations on the top clusters.
+        :param search: search to perform
+        :param max_results: number of search results to cluster
+        :param recommend: if True (default), includes LLM recommendations for each of the top clusters.
+        :return: dict of the form {'search': ..., 'recommendations': [{'cluster_keywords': ..., 'llm_recommendations':
+        ...}]}
+        """
+        key = (search, max_results)
+        top_keywords = self.searches.get(key)
+        if top_keywords is None:
+            clustered, _ = pipeline.cluster_search(
+                search=search,
+                max_results=max_results,
+                embed_function=self.embedder
+            )
+            top_keywords = list()
+            if clustered:
+                top_keywords = cluster.top_keywords(clusters=clustered['clusters'], sentences=clustered['lines'])
+            self.searches.put(key, top_keywords)
+        return {
+            'search': search,
+            'recommendations': [
+                {
+                    'cluster_keywords': top_set,
+                    'llm_recommendations': self.llm.make_seo_recommendations(search=search, keywords=top_set)
+                    if recommend else None
+                } for top_set in top_keywords
+            ]
+        }
+
+    def site_index(self, url: AnyStr, crawl: bool = False) -> vector_store.NNVectorStore:
+        """
+        Returns the vector store for a site, building it on first use.
+        :param url: URL of the site (include http[s])
+        :param crawl: if True, indexes the site's pages (sitemap and same-site links) rather than the URL alone.
+        :return: populated vector store
+        """
+        key = (url, crawl)
+        vs = self.sites.get(key)
+        if vs is None:
+            vs = vector_store.NNVectorStore(embed_function=self.embedder, index='numpy', model_id=self.model_id)
+            if crawl:
+                crawler.index_site(url, vs)
+            else:
+                r = requests.get(url, timeout=60)
+                r.raise_for_status()
+                vs.add_texts(split_site(strip_site(r.text)))
+            self.sites.put(key, vs)
+        return vs
+
+    def check_recommendation(
+            self,
+            search: AnyStr,
+            url: AnyStr,
+            recommendation: AnyStr,
+            crawl: bool = False,
+            k: int = 2
+    ) -> Dict[AnyStr, Any]:
+        """
+        Checks a site's contents against an SEO recommendation for a search.
+        :param search: web search to optimize the site against
+        :param url: URL of the site (include http[s])
+        :param recommendation: SEO recommendation to check
+        :param crawl: if True, checks against all of the site's pages rather than the URL alone.
+        :param k: number of site excerpts to show the LLM
+        :return: dict with the most relevant site contents and the LLM's assessment
+        """
+        most_relevant_site_contents = self.site_index(url, crawl=crawl).get_relevant_texts(query=recommendation, k=k)
+        return {
+            'search': search,
+            'recommendation': recommendation,
+            'most_relevant_site_contents': most_relevant_site_contents,
+            'recommendation_check_results': self.llm.check_seo_recommendation(
+                search=search,
+                recommendation=recommendation,
+                most_relevant_excerpts=most_relevant_site_contents
+            )
+        }
+
+    def health(self) -> Dict[AnyStr, Any]:
+        """
+        Service statistics.
+        :return: dict
+        """
+        return {
+            'status': 'ok',
+            'embedder': self.embedder.stats(),
+            'search_cache': {'hits': self.searches.hits, 'misses': self.searches.misses},
+            'site_cache': {'hits': self.sites.hits, 'misses': self.sites.misses}
+        }
+
+
+def make_handler(service: SimsitesService) -> type:
+    """
+    Creates the HTTP request handler class for a service.
+    :param service: service handling the requests
+    :return: BaseHTTPRequestHandler subclass
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _respond(self, status: int, payload: Any):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._respond(200, service.health())
+            elif self.path == '/metrics':
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._respond(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            try:
+                params = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if self.path == '/cluster':
+                    self._respond(200, service.cluster_search(
+                        search=params['search'],
+                        max_results=params.get('max_results', 10),
+                        recommend=params.get('recommend', True)
+                    ))
+                elif self.path == '/check':
+                    self._respond(200, service.check_recommendation(
+                        search=params['search'],
+                        url=params['url'],
+                        recommendation=params['recommendation'],
+                        crawl=params.get('crawl', False),
+                        k=params.get('k', 2)
+                    ))
+                else:
+                    self._respond(404, {'error': 'Not found'})
+            except (KeyError, ValueError) as err:
+                self._respond(400, {'error': 'Bad request: {0}'.format(err)})
+            except Exception as err:
+                logging.exception(err)
+                self._respond(500, {'error': str(err)})
+
+        def log_message(self, fmt, *args):
+            logging.info(fmt % args)
+
+    return Handler
+
+
+def serve(service: SimsitesService, host: AnyStr = '127.0.0.1', port: int = 8080):
+    """
+    Serves requests until interrupted.
+    :param service: service handling the requests
+    :param host: interface to listen on, defaults to localhost only
+    :param port: port to listen on
+    :return: None
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    logging.info("Listening on http://{0}:{1}".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(
+        prog='simsites.service',
+        description='Runs simsites as a local HTTP service'
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (defaults to 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on (defaults to 8080)')
+    parser.add_argument('--llm', choices=['openai', 'mistral', 'router'], default='openai', help='LLM API to use')
+    parser.add_argument(
+        '--local_embed',
+        help='If specified, uses local embedding model rather than LLM API call.',
+        action='store_true'
+    )
+    parser.add_argument('--max_batch_size', type=int, default=256, help='Maximum lines per embedding batch')
+    parser.add_argument('--max_wait_ms', type=float, default=10., help='Maximum wait to fill an embedding batch (ms)')
+    parser.add_argument('--metrics', help='If specified, records metrics served on /metrics', action='store_true')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+    serve(
+        SimsitesService(
+            llm=importlib.import_module('simsites.llm.' + args.llm),
+            local_embed=args.local_embed,
+            max_batch_size=args.max_batch_size,
+            max_wait=args.max_wait_ms / 1000.
+        ),
+        host=args.host,
+        port=args.port
+    )
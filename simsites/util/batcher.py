@@ -0,0 +1,108 @@
+"""
+batcher - coalesces embedding requests from concurrent callers into shared micro-batches
+"""
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+from typing import *
+
+
+class EmbeddingBatcher:
+    """
+    Wraps an embed function so that concurrent calls are merged into a single call of up to max_batch_size lines. The
+    first request of a batch waits at most max_wait seconds for others to join it. Instances are callable with the same
+    signature as the embed function, so they can be used anywhere an embed function is expected.
+    """
+
+    def __init__(
+            self,
+            embed_function: Callable[[List[AnyStr]], Any],
+            max_batch_size: int = 256,
+            max_wait: float = 0.01
+    ):
+        """
+        :param embed_function: function to generate embeddings, should accept a list of strings and return a list of
+        floats or tensors.
+        :param max_batch_size: maximum number of lines per call to embed_function. A single request larger than this is
+        embedded on its own.
+        :param max_wait: maximum time in seconds a request waits for other requests to share its batch.
+        """
+        self.embed_function = embed_function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self.lines = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __call__(self, lines: List[AnyStr]) -> Any:
+        """
+        Embeds lines, sharing the call to the embed function with any concurrent requests.
+        :param lines: lines to embed.
+        :return: embeddings of the lines, as returned by the embed function.
+        """
+        future = concurrent.futures.Future()
+        self._queue.put((list(lines), future))
+        return future.result()
+
+    def stats(self) -> Dict[AnyStr, Any]:
+        """
+        Batching statistics since the batcher was created.
+        :return: dict with the number of batches, requests and lines embedded, and the mean number of requests per batch.
+        """
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'lines': self.lines,
+            'requests_per_batch': self.requests / self.batches if self.batches else 0.
+        }
+
+    def _run(self):
+        carry = None
+        while True:
+            batch = [carry if carry else self._queue.get()]
+            carry = None
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if size + len(request[0]) > self.max_batch_size:
+                    carry = request
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._embed_batch(batch)
+
+    def _embed_batch(self, batch: List[Tuple[List[AnyStr], concurrent.futures.Future]]):
+        lines = [line for request_lines, _ in batch for line in request_lines]
+        try:
+            embeddings = self.embed_function(lines) if lines else list()
+        except Exception as err:
+            logging.exception(err)
+            for _, future in batch:
+                future.set_exception(err)
+            return
+        if len(embeddings) != len(lines):
+            # e.g. an API embed function that lost a chunk: the rows can't be matched to their requests anymore
+            err = ValueError("Embedded {0} of {1} line(s) in batch".format(len(embeddings), len(lines)))
+            logging.error(err)
+            for _, future in batch:
+                future.set_exception(err)
+            return
+        self.batches += 1
+        self.requests += len(batch)
+        self.lines += len(lines)
+        offset = 0
+        for request_lines, future in batch:
+            future.set_result(embeddings[offset:offset + len(request_lines)])
+            offset += len(request_lines)
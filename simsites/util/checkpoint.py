@@ -0,0 +1,99 @@
+"""
+checkpoint - content-addressed store for the outputs of intermediate stages, so interrupted runs can resume.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import *
+
+
+class CheckpointStore:
+    """
+    Persists the output of each stage under a key derived from the stage name, its parameters and the keys of the
+    stages it depends on. Changing a parameter changes the key of that stage and of every stage downstream of it, so
+    only those are recomputed.
+    """
+
+    def __init__(self, root: AnyStr):
+        """
+        :param root: folder to store checkpoints in, created if it doesn't exist.
+        """
+        self.root = root
+        self.hits = dict()
+        self.misses = dict()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(stage: AnyStr, *upstream: AnyStr, **params) -> AnyStr:
+        """
+        Computes the key of a stage's output.
+        :param stage: stage name e.g. "embed"
+        :param upstream: keys of the stages this stage's input comes from
+        :param params: parameters that affect the stage's output, must be JSON-serializable (or have a stable str()).
+        :return: hex digest
+        """
+        payload = json.dumps(
+            {'stage': stage, 'upstream': list(upstream), 'params': params},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, stage: AnyStr, key: AnyStr) -> AnyStr:
+        """
+        Returns the file a checkpoint is stored in.
+        :param stage: stage name
+        :param key: checkpoint key
+        :return: path
+        """
+        return os.path.join(self.root, stage, key[:2], key + '.pkl')
+
+    def has(self, stage: AnyStr, key: AnyStr) -> bool:
+        return os.path.exists(self.path(stage, key))
+
+    def load(self, stage: AnyStr, key: AnyStr) -> Any:
+        with open(self.path(stage, key), 'rb') as fidin:
+            return pickle.load(fidin)
+
+    def save(self, stage: AnyStr, key: AnyStr, value: Any):
+        """
+        Saves a checkpoint atomically: it's written to a temporary file then renamed, so an interrupted write never
+        leaves a partial checkpoint behind.
+        :param stage: stage name
+        :param key: checkpoint key
+        :param value: value to store, must be picklable.
+        :return: None
+        """
+        fname = self.path(stage, key)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        fd, tmp_fname = tempfile.mkstemp(dir=os.path.dirname(fname), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fidout:
+                pickle.dump(value, fidout, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_fname, fname)
+        except BaseException:
+            os.remove(tmp_fname)
+            raise
+
+    def cached(self, stage: AnyStr, key: AnyStr, compute: Callable[[], Any]) -> Any:
+        """
+        Returns a stage's checkpointed output, computing and saving it if there's no checkpoint yet. None results are
+        not saved (e.g. a failed LLM call), so they are retried on the next run.
+        :param stage: stage name
+        :param key: checkpoint key, see "key"
+        :param compute: function computing the stage's output
+        :return: output of the stage
+        """
+        if self.has(stage, key):
+            self.hits[stage] = self.hits.get(stage, 0) + 1
+            return self.load(stage, key)
+        self.misses[stage] = self.misses.get(stage, 0) + 1
+        value = compute()
+        if value is not None:
+            self.save(stage, key, value)
+        else:
+            logging.warning("Stage '{0}' returned None, not checkpointed".format(stage))
+        return value
@@ -0,0 +1,304 @@
+"""
+columnar - compact, column-oriented storage for the results of batch runs: clusters, keywords, LLM responses and
+vector store contents, written incrementally with one row group per query.
+
+A store is a folder with a manifest.jsonl listing the row groups, and one folder per row group holding its columns in
+a columns.npz file (text as a UTF-8 buffer plus offsets, lists as values plus offsets) and its embeddings in an
+embeddings.npy file that's memory-mapped when read.
+"""
+import json
+import os
+import time
+from typing import *
+
+import numpy as np
+
+from simsites.util import metrics
+from simsites.util.embed import generate_embeddings
+from simsites.util.nn_index import normalize, to_matrix
+from simsites.util.vector_store import NNVectorStore
+
+MANIFEST_FNAME = 'manifest.jsonl'
+COLUMNS_FNAME = 'columns.npz'
+EMBEDDINGS_FNAME = 'embeddings.npy'
+
+
+def encode_strings(values: List[Union[AnyStr, None]]) -> Dict[AnyStr, np.ndarray]:
+    """
+    Encodes a list of strings as a UTF-8 buffer, offsets and a validity mask (False for None).
+    :param values: list of strings or None
+    :return: dict with 'data', 'offsets' and 'valid' arrays
+    """
+    encoded = [value.encode('utf-8') if value is not None else b'' for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return {
+        'data': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'offsets': offsets,
+        'valid': np.array([value is not None for value in values], dtype=bool)
+    }
+
+
+def decode_strings(data: np.ndarray, offsets: np.ndarray, valid: np.ndarray) -> List[Union[AnyStr, None]]:
+    """
+    Decodes strings encoded by "encode_strings".
+    :param data: UTF-8 buffer
+    :param offsets: start of each string in the buffer, followed by the end of the last string.
+    :param valid: False for strings that were None
+    :return: list of strings or None
+    """
+    buffer = data.tobytes()
+    return [
+        buffer[start:end].decode('utf-8') if is_valid else None
+        for start, end, is_valid in zip(offsets[:-1].tolist(), offsets[1:].tolist(), valid.tolist())
+    ]
+
+
+def encode_lists(values: List[List[Any]]) -> Tuple[List[Any], np.ndarray]:
+    """
+    Flattens a list of lists.
+    :param values: list of lists
+    :return: tuple of (flattened values, offsets of each list in the flattened values)
+    """
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in values])
+    return [item for value in values for item in value], offsets
+
+
+def decode_lists(flat: List[Any], offsets: np.ndarray) -> List[List[Any]]:
+    """
+    Rebuilds the lists flattened by "encode_lists".
+    :param flat: flattened values
+    :param offsets: start of each list in the flattened values, followed by the end of the last list.
+    :return: list of lists
+    """
+    return [list(flat[start:end]) for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+class ColumnarWriter:
+    """
+    Appends row groups to a columnar store. Several writers, in different processes or on different hosts sharing the
+    folder, can append to the same store: each group's number is claimed by creating its folder, which only one writer
+    can do, and its files are written before the group is added to the manifest, so readers never see a partially
+    written group.
+    """
+
+    def __init__(self, root: AnyStr):
+        """
+        :param root: folder of the store, created if it doesn't exist. Groups are added to any already in the store.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._next_group = len(ColumnarReader(root).groups) if os.path.exists(os.path.join(root, MANIFEST_FNAME)) else 0
+
+    def _claim_group(self) -> Tuple[int, AnyStr]:
+        group = self._next_group
+        while True:
+            group_dir = os.path.join(self.root, '{0:06d}'.format(group))
+            try:
+                os.mkdir(group_dir)
+            except FileExistsError:
+                # Taken by another writer, or left behind by a writer that stopped before updating the manifest
+                group += 1
+                continue
+            self._next_group = group + 1
+            return group, group_dir
+
+    def _write_group(
+            self,
+            kind: AnyStr,
+            name: AnyStr,
+            columns: Dict[AnyStr, np.ndarray],
+            embeddings: np.ndarray,
+            **meta
+    ) -> int:
+        group, group_dir = self._claim_group()
+        with metrics.timer('columnar_write', kind=kind):
+            np.savez(os.path.join(group_dir, COLUMNS_FNAME), **columns)
+            np.save(os.path.join(group_dir, EMBEDDINGS_FNAME), embeddings)
+            entry = json.dumps({
+                'group': group,
+                'kind': kind,
+                'name': name,
+                'num_rows': int(embeddings.shape[0]),
+                'written': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                **meta
+            }) + '\n'
+            # A single append-mode write, so lines from concurrent writers don't interleave
+            fd = os.open(os.path.join(self.root, MANIFEST_FNAME), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, entry.encode('utf-8'))
+            finally:
+                os.close(fd)
+        return group
+
+    def write_clusters(
+            self,
+            search: AnyStr,
+            clustered: Dict[AnyStr, Any],
+            keywords: List[List[AnyStr]] = None,
+            responses: List[Union[AnyStr, None]] = None
+    ) -> int:
+        """
+        Writes the results for one query as a row group.
+        :param search: search the results are for
+        :param clustered: results of "cluster_sites" (or "cluster_portfolio")
+        :param keywords: optional output of "top_keywords" for the clusters
+        :param responses: optional LLM responses, one per keywords set (None where there is no response).
+        :return: group number
+        """
+        cluster_members, cluster_offsets = encode_lists(clustered['clusters'])
+        columns = {'line_' + key: value for key, value in encode_strings(clustered['lines']).items()}
+        columns['cluster_members'] = np.array(cluster_members, dtype=np.int64)
+        columns['cluster_offsets'] = cluster_offsets
+        keywords = keywords or list()
+        flat_keywords, keyword_offsets = encode_lists(keywords)
+        columns.update({'keyword_' + key: value for key, value in encode_strings(flat_keywords).items()})
+        columns['keyword_set_offsets'] = keyword_offsets
+        columns.update({'response_' + key: value for key, value in encode_strings(responses or list()).items()})
+        return self._write_group(
+            'clusters',
+            search,
+            columns,
+            to_matrix(clustered['embeddings']),
+            embedding_model=clustered.get('embedding_model'),
+            num_clusters=len(clustered['clusters'])
+        )
+
+    def write_vector_store(self, name: AnyStr, vector_store: NNVectorStore) -> int:
+        """
+        Writes the contents of a vector store as a row group.
+        :param name: name of the group e.g. the site's URL
+        :param vector_store: NNVectorStore
+        :return: group number
+        """
+        columns = {'text_' + key: value for key, value in encode_strings(vector_store.texts).items()}
+        columns.update({
+            'metadata_' + key: value
+            for key, value in encode_strings([json.dumps(metadata) for metadata in vector_store.metadatas]).items()
+        })
+        return self._write_group(
+            'vector_store',
+            name,
+            columns,
+            normalize(to_matrix(vector_store.embeddings)),
+            embedding_model=vector_store.model_id
+        )
+
+
+class ColumnarReader:
+    """
+    Reads the row groups of a columnar store.
+    """
+
+    def __init__(self, root: AnyStr, mmap: bool = True):
+        """
+        :param root: folder of the store
+        :param mmap: if True (default), memory-maps the embeddings rather than reading them into memory.
+        """
+        self.root = root
+        self.mmap = mmap
+        self.groups = list()
+        with open(os.path.join(root, MANIFEST_FNAME), encoding='utf-8') as fidin:
+            for line in fidin:
+                if line.strip():
+                    self.groups.append(json.loads(line))
+        # Concurrent writers may add groups to the manifest out of number order
+        self._groups = {group['group']: group for group in self.groups}
+
+    def find(self, name: AnyStr, kind: AnyStr = None) -> Union[int, None]:
+        """
+        Returns the number of the last group written with a given name.
+        :param name: group name e.g. a search
+        :param kind: if specified, only groups of this kind ("clusters" or "vector_store") are considered.
+        :return: group number, or None if not found.
+        """
+        for group in reversed(self.groups):
+            if group['name'] == name and (kind is None or group['kind'] == kind):
+                return group['group']
+        return None
+
+    def _group_dir(self, group: int) -> AnyStr:
+        return os.path.join(self.root, '{0:06d}'.format(group))
+
+    def columns(self, group: int) -> Dict[AnyStr, np.ndarray]:
+        """
+        Returns the raw columns of a group.
+        :param group: group number
+        :return: dict of column name -> array
+        """
+        with np.load(os.path.join(self._group_dir(group), COLUMNS_FNAME), allow_pickle=False) as npz:
+            return {key: npz[key] for key in npz.files}
+
+    def embeddings(self, group: int) -> np.ndarray:
+        """
+        Returns the embeddings of a group, memory-mapped unless disabled.
+        :param group: group number
+        :return: array of shape (number of rows, embedding dimensions)
+        """
+        return np.load(os.path.join(self._group_dir(group), EMBEDDINGS_FNAME), mmap_mode='r' if self.mmap else None)
+
+    def read_clusters(self, group: int) -> Dict[AnyStr, Any]:
+        """
+        Reads a group written by "ColumnarWriter.write_clusters".
+        :param group: group number
+        :return: dict of the same form as "cluster_sites", plus the 'search' and, when written, the 'keywords' and
+        'responses'.
+        """
+        columns = self.columns(group)
+        flat_keywords = decode_strings(columns['keyword_data'], columns['keyword_offsets'], columns['keyword_valid'])
+        return {
+            'search': self._groups[group]['name'],
+            'lines': decode_strings(columns['line_data'], columns['line_offsets'], columns['line_valid']),
+            'embeddings': self.embeddings(group),
+            'clusters': decode_lists(columns['cluster_members'].tolist(), columns['cluster_offsets']),
+            'embedding_model': self._groups[group].get('embedding_model'),
+            'keywords': decode_lists(flat_keywords, columns['keyword_set_offsets']),
+            'responses': decode_strings(
+                columns['response_data'],
+                columns['response_offsets'],
+                columns['response_valid']
+            )
+        }
+
+    def read_vector_store(
+            self,
+            group: int,
+            embed_function: Any = generate_embeddings,
+            model_id: AnyStr = None,
+            index: Any = 'numpy',
+            **kwargs
+    ) -> NNVectorStore:
+        """
+        Reads a group written by "ColumnarWriter.write_vector_store", see "NNVectorStore.load".
+        :param group: group number
+        :param embed_function: function to generate embeddings for new texts and queries, must use the same model.
+        :param model_id: identifier of the embedding model used by embed_function, checked against the group's.
+        :param index: index backend, defaults to "numpy" which uses the stored embeddings without copying them.
+        :param kwargs: passed on to the index backend's constructor.
+        :return: NNVectorStore
+        """
+        store = NNVectorStore(embed_function=embed_function, index=index, model_id=model_id, **kwargs)
+        stored_model_id = self._groups[group].get('embedding_model')
+        if store.model_id and stored_model_id and store.model_id != stored_model_id:
+            raise ValueError("Group {0} was embedded with '{1}', not '{2}'".format(
+                group,
+                stored_model_id,
+                store.model_id
+            ))
+        store.model_id = store.model_id or stored_model_id
+        columns = self.columns(group)
+        store.texts = decode_strings(columns['text_data'], columns['text_offsets'], columns['text_valid'])
+        metadatas = decode_strings(columns['metadata_data'], columns['metadata_offsets'], columns['metadata_valid'])
+        store.metadatas = [json.loads(metadata) for metadata in metadatas]
+        store._index.attach(self.embeddings(group))
+        return store
+
+    def iter_clusters(self) -> Iterator[Dict[AnyStr, Any]]:
+        """
+        Reads every "clusters" group in the order they were written.
+        :return: generator of "read_clusters" results
+        """
+        for group in self.groups:
+            if group['kind'] == 'clusters':
+                yield self.read_clusters(group['group'])
@@ -0,0 +1,274 @@
+"""
+crawler - bounded, concurrent crawler for fetching a (client) site's pages
+"""
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import *
+from urllib.parse import urljoin, urldefrag, urlparse
+from xml.etree import ElementTree
+
+import requests
+
+from simsites.util.text_cleaner import strip_site, split_site
+
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+SKIPPED_EXTENSIONS = (
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.ico', '.css', '.js', '.zip', '.mp3', '.mp4', '.xml'
+)
+
+
+class HostLimiter:
+    """
+    Per-host politeness: caps the number of concurrent requests to each host, and spaces out the start of consecutive
+    requests to the same host by a minimum delay.
+    """
+
+    def __init__(self, max_per_host: int = 2, delay: float = 0.25):
+        self.max_per_host = max_per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores = dict()
+        self._next_start = dict()
+
+    def _semaphore(self, host: AnyStr) -> threading.Semaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.Semaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def acquire(self, host: AnyStr):
+        """
+        Blocks until a request to the host is allowed.
+        :param host: host name
+        :return: None
+        """
+        self._semaphore(host).acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, host: AnyStr):
+        """
+        Signals that a request to the host has completed.
+        :param host: host name
+        :return: None
+        """
+        self._semaphore(host).release()
+
+
+def same_site(url: AnyStr, root_url: AnyStr) -> bool:
+    """
+    Returns True if a URL is on the same host as the root URL (ignoring a leading "www.").
+    :param url: URL to check
+    :param root_url: URL of the site
+    :return: bool
+    """
+    def host(u):
+        netloc = urlparse(u).netloc.lower()
+        return netloc[4:] if netloc.startswith('www.') else netloc
+    return host(url) == host(root_url)
+
+
+def normalize_url(url: AnyStr, base_url: AnyStr = None) -> Union[AnyStr, None]:
+    """
+    Resolves a (possibly relative) link and strips its fragment.
+    :param url: link to normalize
+    :param base_url: URL of the page the link was found on
+    :return: absolute URL, or None if the link is not an HTTP(S) link to a page.
+    """
+    absolute = urldefrag(urljoin(base_url, url.strip()) if base_url else url.strip())[0]
+    parsed = urlparse(absolute)
+    if parsed.scheme not in ('http', 'https') or parsed.path.lower().endswith(SKIPPED_EXTENSIONS):
+        return None
+    return absolute
+
+
+def extract_links(page_url: AnyStr, site_src: AnyStr) -> List[AnyStr]:
+    """
+    Extracts the same-site links from a page.
+    :param page_url: URL of the page
+    :param site_src: HTML source of the page
+    :return: list of absolute URLs, in the order they appear on the page, without duplicates.
+    """
+    from bs4 import BeautifulSoup
+    links = list()
+    soup = BeautifulSoup(site_src, 'html.parser')
+    for anchor in soup.find_all('a', href=True):
+        link = normalize_url(anchor['href'], base_url=page_url)
+        if link and same_site(link, page_url) and link not in links:
+            links.append(link)
+    return links
+
+
+def fetch_sitemap_urls(
+        root_url: AnyStr,
+        session: requests.Session = None,
+        timeout: int = 30,
+        max_urls: int = 1000
+) -> List[AnyStr]:
+    """
+    Returns the page URLs listed in a site's /sitemap.xml, following one level of sitemap index files.
+    :param root_url: URL of the site
+    :param session: optional requests Session to reuse connections
+    :param timeout: request timeout in seconds
+    :param max_urls: maximum number of URLs to return
+    :return: list of same-site URLs, may be empty if the site has no sitemap.
+    """
+    session = session or requests.Session()
+    urls = list()
+    sitemaps = [urljoin(root_url, '/sitemap.xml')]
+    for depth in range(2):
+        nested = list()
+        for sitemap_url in sitemaps:
+            try:
+                r = session.get(sitemap_url, timeout=timeout)
+                if r.status_code != 200:
+                    logging.info("No sitemap at {0} (status code {1})".format(sitemap_url, r.status_code))
+                    continue
+                root = ElementTree.fromstring(r.content)
+            except Exception as err:
+                logging.warning("Couldn't read sitemap {0}: {1}".format(sitemap_url, err))
+                continue
+            for loc in root.iter(SITEMAP_NS + 'loc'):
+                if not loc.text:
+                    continue
+                if root.tag == SITEMAP_NS + 'sitemapindex':
+                    nested.append(loc.text.strip())
+                else:
+                    url = normalize_url(loc.text)
+                    if url and same_site(url, root_url) and url not in urls:
+                        urls.append(url)
+                if len(urls) >= max_urls:
+                    return urls
+        sitemaps = nested
+    return urls
+
+
+def fetch_page(
+        url: AnyStr,
+        session: requests.Session,
+        limiter: HostLimiter,
+        timeout: int = 30,
+        max_page_bytes: int = 2 * 1024 * 1024
+) -> Union[AnyStr, None]:
+    """
+    Fetches a single HTML page under the per-host politeness limits.
+    :param url: URL to fetch
+    :param session: requests Session
+    :param limiter: per-host limiter
+    :param timeout: request timeout in seconds
+    :param max_page_bytes: pages are truncated to this many bytes
+    :return: page source, or None if the page couldn't be retrieved or isn't HTML.
+    """
+    host = urlparse(url).netloc
+    limiter.acquire(host)
+    try:
+        with session.get(url, timeout=timeout, stream=True) as r:
+            if r.status_code != 200:
+                logging.warning("Received status code {0} for {1}, skipping".format(r.status_code, url))
+                return None
+            if 'html' not in r.headers.get('Content-Type', 'text/html'):
+                return None
+            content = bytearray()
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                content.extend(chunk)
+                if len(content) >= max_page_bytes:
+                    logging.info("Truncating {0} at {1} bytes".format(url, max_page_bytes))
+                    break
+            return bytes(content[:max_page_bytes]).decode(r.encoding or 'utf-8', errors='replace')
+    except Exception as err:
+        logging.warning("Encountered error fetching {0}: {1}".format(url, err))
+        return None
+    finally:
+        limiter.release(host)
+
+
+def crawl_site(
+        root_url: AnyStr,
+        max_pages: int = 50,
+        max_depth: int = 2,
+        max_bytes: int = 50 * 1024 * 1024,
+        max_page_bytes: int = 2 * 1024 * 1024,
+        max_workers: int = 8,
+        max_per_host: int = 2,
+        delay: float = 0.25,
+        timeout: int = 30,
+        use_sitemap: bool = True
+) -> Iterator[Tuple[AnyStr, AnyStr]]:
+    """
+    Crawls a site breadth-first, starting from its sitemap (if any) and the root URL and following same-site links.
+    Pages are fetched concurrently and yielded as soon as each one arrives.
+    :param root_url: URL to start from (include http[s])
+    :param max_pages: maximum number of pages to fetch
+    :param max_depth: maximum number of links followed from the root URL or the sitemap
+    :param max_bytes: stop crawling once this many bytes of HTML have been fetched
+    :param max_page_bytes: pages are truncated to this many bytes
+    :param max_workers: maximum number of pages fetched at once
+    :param max_per_host: maximum number of concurrent requests to the same host
+    :param delay: minimum delay in seconds between the start of two requests to the same host
+    :param timeout: request timeout in seconds
+    :param use_sitemap: if True (default), seeds the crawl with the URLs in the site's sitemap.xml
+    :return: generator of (URL, HTML source) tuples, in the order the pages were received
+    """
+    session = requests.Session()
+    limiter = HostLimiter(max_per_host=max_per_host, delay=delay)
+    seeds = [normalize_url(root_url)]
+    if use_sitemap:
+        seeds.extend(fetch_sitemap_urls(root_url, session=session, timeout=timeout, max_urls=max_pages))
+    frontier = list()
+    seen = set()
+    for url in seeds:
+        if url and url not in seen:
+            seen.add(url)
+            frontier.append((url, 0))
+    submitted = 0
+    total_bytes = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = dict()
+        while frontier or pending:
+            while frontier and len(pending) < max_workers and submitted < max_pages and total_bytes < max_bytes:
+                url, depth = frontier.pop(0)
+                future = executor.submit(fetch_page, url, session, limiter, timeout, max_page_bytes)
+                pending[future] = (url, depth)
+                submitted += 1
+            if not pending:
+                break
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                url, depth = pending.pop(future)
+                site_src = future.result()
+                if site_src is None:
+                    continue
+                # Count bytes rather than characters, so that max_bytes holds for non-ASCII pages
+                total_bytes += len(site_src.encode('utf-8'))
+                if depth < max_depth:
+                    for link in extract_links(url, site_src):
+                        if link not in seen:
+                            seen.add(link)
+                            frontier.append((link, depth + 1))
+                yield url, site_src
+    logging.info("Crawled {0} page(s), {1} bytes from {2}".format(submitted, total_bytes, root_url))
+
+
+def index_site(root_url: AnyStr, vector_store: Any, **kwargs) -> List[AnyStr]:
+    """
+    Crawls a site and streams each page's cleaned lines into a vector store as the page arrives, recording the page's
+    URL as the "source" metadata of each line.
+    :param root_url: URL to start from (include http[s])
+    :param vector_store: NNVectorStore to populate. An index backend that doesn't refit on add (e.g. "numpy") is
+    recommended.
+    :param kwargs: crawl limits, see "crawl_site".
+    :return: list of the URLs that were indexed
+    """
+    indexed = list()
+    for url, site_src in crawl_site(root_url, **kwargs):
+        site_as_lines = split_site(strip_site(site_src))
+        if len(site_as_lines) > 0:
+            vector_store.add_texts(site_as_lines, metadatas=[{'source': url} for _ in site_as_lines])
+            indexed.append(url)
+    return indexed
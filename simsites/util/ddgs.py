@@ -2,7 +2,6 @@
 ddgs_search - DuckDuckGo search
 """
 import requests
-from duckduckgo_search import DDGS
 from typing import *
 import logging
 
@@ -20,6 +19,7 @@ def search_ddgs(
     :param max_results: maximum number of results to return (defaults to 10)
     :return: list of dicts with search params.
     """
+    from duckduckgo_search import DDGS
     with DDGS(proxies=proxies, timeout=timeout) as ddgs:
         return [r for r in ddgs.text(search, timelimit='y', max_results=max_results)]
 
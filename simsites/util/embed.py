@@ -2,46 +2,175 @@
 embed.py - generate embeddings locally instead of making calls to an API.
 """
 from typing import *
+import functools
+import inspect
 import logging
+import re
 
-from sentence_transformers import SentenceTransformer
-from torch import Tensor
+from simsites.util import metrics
+
+if TYPE_CHECKING:
+    # Imported when first used: loading torch takes seconds
+    from sentence_transformers import SentenceTransformer
+    from torch import Tensor
 
 MULTILINGUAL_EMBEDDING_MODEL = "paraphrase-multilingual-mpnet-base-v2"
 ENGLISH_EMBEDDING_MODEL = "all-mpnet-base-v2"
+# Smaller English-only model, several times faster than the mpnet models
+FAST_ENGLISH_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Frequent function words of the languages we see most often in SERPs, used to guess the language of a text
+STOPWORDS = {
+    'en': {'the', 'and', 'of', 'to', 'in', 'is', 'for', 'with', 'you', 'your', 'our', 'we', 'are', 'on', 'that',
+           'this', 'it', 'be', 'or', 'from', 'at', 'by', 'have', 'more', 'can', 'an', 'will', 'all', 'about'},
+    'es': {'el', 'la', 'los', 'las', 'de', 'del', 'y', 'que', 'en', 'un', 'una', 'por', 'para', 'con', 'su', 'sus',
+           'es', 'al', 'lo', 'como', 'mas', 'nuestro', 'nuestros'},
+    'fr': {'le', 'la', 'les', 'de', 'des', 'du', 'et', 'est', 'un', 'une', 'pour', 'dans', 'que', 'qui', 'sur',
+           'avec', 'nous', 'vous', 'votre', 'vos', 'au', 'aux', 'pas', 'plus'},
+    'de': {'der', 'die', 'das', 'und', 'ist', 'ein', 'eine', 'zu', 'den', 'dem', 'mit', 'fur', 'von', 'auf', 'sie',
+           'wir', 'ihr', 'ihre', 'nicht', 'auch', 'bei', 'oder'},
+    'pt': {'o', 'os', 'as', 'de', 'do', 'da', 'dos', 'das', 'e', 'que', 'em', 'um', 'uma', 'para', 'com', 'nao',
+           'por', 'seu', 'sua', 'nos', 'mais'},
+    'it': {'il', 'lo', 'la', 'gli', 'le', 'di', 'del', 'della', 'e', 'che', 'un', 'una', 'per', 'con', 'non', 'sono',
+           'nel', 'alla', 'dei', 'delle', 'piu'}
+}
+WORD_REGEX = re.compile(r"[^\W\d_]+")
+
+
+@functools.lru_cache(maxsize=None)
+def _load_embedder(model_name: AnyStr) -> 'SentenceTransformer':
+    logging.info("Loading {0}".format(model_name))
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
 
 
-def get_local_embedder(multi_lang: bool = True) -> SentenceTransformer:
+def get_local_embedder(multi_lang: bool = True, model_name: AnyStr = None) -> 'SentenceTransformer':
     """
     Returns a SentenceTransformer embedder model to embed strings on the local device. Will use a GPU if
-    available but not required.
+    available but not required. Models are loaded once per process and reused by subsequent calls, whichever arguments
+    select them.
     :param multi_lang: if True (default), return an embedding model that supports multiple languages (perhaps at
     the expense of performance). If False, returns an English-only model that may perform slightly better.
+    :param model_name: if specified, the name of the model to load, overrides multi_lang.
     :return:
     """
-    if multi_lang:
-        model_name = MULTILINGUAL_EMBEDDING_MODEL
-    else:
-        model_name = ENGLISH_EMBEDDING_MODEL
-    logging.info("Returning {0}".format(model_name))
-    return SentenceTransformer(model_name)
+    if model_name is None:
+        if multi_lang:
+            model_name = MULTILINGUAL_EMBEDDING_MODEL
+        else:
+            model_name = ENGLISH_EMBEDDING_MODEL
+    return _load_embedder(model_name)
 
 
 def generate_embeddings(
         lines: List[AnyStr],
-        model: SentenceTransformer = None
-) -> List[Tensor]:
+        model: 'SentenceTransformer' = None,
+        model_name: AnyStr = None
+) -> List['Tensor']:
     """
     Generates embeddings for a list of strings.
     :param lines: lines to embed.
-    :param model: SentenceTransformer model. If not specified, defaults to DEFAULT_EMBEDDING_MODEL.
+    :param model: SentenceTransformer model. If not specified, defaults to the model_name model.
+    :param model_name: name of the model to use if model isn't specified, defaults to MULTILINGUAL_EMBEDDING_MODEL.
     :return: list of PyTorch Tensors
     """
     if not model:
-        model = get_local_embedder()
-    return model.encode(
-        lines,
-        batch_size=64,
-        show_progress_bar=False,
-        convert_to_tensor=True
-    )
+        model = get_local_embedder(model_name=model_name)
+    with metrics.timer('generate_embeddings'):
+        embeddings = model.encode(
+            lines,
+            batch_size=64,
+            show_progress_bar=False,
+            convert_to_tensor=True
+        )
+    metrics.incr('embedded_lines', len(lines), backend='local')
+    return embeddings
+
+
+def detect_language(text: AnyStr, min_words: int = 20) -> Union[AnyStr, None]:
+    """
+    Guesses the language of a text by counting the stopwords of each language in "STOPWORDS". Cheap enough to run on
+    every site, but only meant to tell English from everything else.
+    :param text: text to examine
+    :param min_words: texts with fewer words than this are too short to call.
+    :return: language code e.g. "en", "other" if the text has non-Latin script or no recognised stopwords, or None if
+    the text is too short to tell.
+    """
+    words = WORD_REGEX.findall(text.lower())
+    if len(words) < min_words:
+        return None
+    if sum(1 for word in words if not word.isascii()) > 0.1 * len(words):
+        return 'other'
+    counts = {lang: sum(1 for word in words if word in stopwords) for lang, stopwords in STOPWORDS.items()}
+    lang = max(counts, key=counts.get)
+    return lang if counts[lang] > 0 else 'other'
+
+
+def select_embedding_model(texts: List[AnyStr], fast: bool = True) -> AnyStr:
+    """
+    Picks the fastest local model suited to every text in a corpus. A single non-English text switches the whole
+    corpus to the multilingual model, so that all of its embeddings share one embedding space.
+    :param texts: texts to examine e.g. one per site
+    :param fast: if True (default), English corpora use FAST_ENGLISH_EMBEDDING_MODEL, otherwise
+    ENGLISH_EMBEDDING_MODEL.
+    :return: model name
+    """
+    languages = [detect_language(text) for text in texts]
+    known = [lang for lang in languages if lang is not None]
+    if known and all(lang == 'en' for lang in known):
+        model_name = FAST_ENGLISH_EMBEDDING_MODEL if fast else ENGLISH_EMBEDDING_MODEL
+    else:
+        model_name = MULTILINGUAL_EMBEDDING_MODEL
+    logging.info("Detected languages {0}, using {1}".format(sorted(set(known)), model_name))
+    metrics.incr('embedding_model_selected', model=model_name)
+    return model_name
+
+
+def local_embed_function(model_name: AnyStr) -> Callable[[List[AnyStr]], List['Tensor']]:
+    """
+    Returns an embed function that generates embeddings with a specific local model.
+    :param model_name: model name e.g. FAST_ENGLISH_EMBEDDING_MODEL
+    :return: embed function
+    """
+    return functools.partial(generate_embeddings, model_name=model_name)
+
+
+def local_model_name(embed_function: Callable) -> Union[AnyStr, None]:
+    """
+    Returns the name of the local model behind an embed function.
+    :param embed_function: embed function
+    :return: model name, or None if the embed function doesn't use a local model.
+    """
+    if embed_function is generate_embeddings:
+        return MULTILINGUAL_EMBEDDING_MODEL
+    if isinstance(embed_function, functools.partial) and embed_function.func is generate_embeddings:
+        return embed_function.keywords.get('model_name') or MULTILINGUAL_EMBEDDING_MODEL
+    return None
+
+
+def embedding_model_id(embed_function: Callable) -> AnyStr:
+    """
+    Returns an identifier for the model behind an embed function, used to tell embeddings from different models apart.
+    Callable objects identify their model with a "model_id" attribute, or by wrapping another embed function in an
+    "embed_function" attribute (e.g. EmbeddingBatcher).
+    :param embed_function: embed function
+    :return: model name for local embeddings, the model_id or wrapped function's identifier for callable objects,
+    otherwise the embed function's qualified name.
+    """
+    model_name = local_model_name(embed_function)
+    if model_name:
+        return model_name
+    if getattr(embed_function, 'model_id', None):
+        return embed_function.model_id
+    if getattr(embed_function, 'embed_function', None) is not None:
+        return embedding_model_id(embed_function.embed_function)
+    if isinstance(embed_function, functools.partial):
+        return '{0}({1})'.format(
+            embedding_model_id(embed_function.func),
+            ', '.join('{0}={1!r}'.format(key, value) for key, value in sorted(embed_function.keywords.items()))
+        )
+    if not (inspect.isfunction(embed_function) or inspect.ismethod(embed_function) or
+            inspect.isbuiltin(embed_function)):
+        # Every instance of a class would otherwise share the same identifier, whatever model it uses
+        raise ValueError("Can't identify the model of {0!r}: set its model_id attribute".format(embed_function))
+    return '{0}.{1}'.format(embed_function.__module__, embed_function.__qualname__)
@@ -0,0 +1,259 @@
+"""
+metrics - lightweight instrumentation: timers, counters and optional tracing spans.
+
+Instrumentation is disabled by default and then costs one function call and a flag check per timer or counter. Enable it
+with "enable()" or by setting the SIMSITES_METRICS environment variable, and export with "to_json()" or
+"to_prometheus()".
+"""
+import functools
+import json
+import os
+import re
+import threading
+import time
+from typing import *
+
+_enabled = bool(os.environ.get('SIMSITES_METRICS'))
+_tracing = False
+_lock = threading.Lock()
+_counters = dict()
+_timers = dict()
+_spans = list()
+_local = threading.local()
+
+MAX_SPANS = 10000
+PROMETHEUS_PREFIX = 'simsites_'
+
+
+def enable(tracing: bool = False):
+    """
+    Turns instrumentation on.
+    :param tracing: if True, also records a span (start, duration, parent span, attributes) for every timer.
+    :return: None
+    """
+    global _enabled, _tracing
+    _enabled = True
+    _tracing = tracing
+
+
+def disable():
+    """
+    Turns instrumentation (and tracing) off. Recorded values are kept until "reset()".
+    :return: None
+    """
+    global _enabled, _tracing
+    _enabled = False
+    _tracing = False
+
+
+def enabled() -> bool:
+    """
+    Whether instrumentation is on.
+    :return: bool
+    """
+    return _enabled
+
+
+def reset():
+    """
+    Clears all recorded counters, timers and spans.
+    :return: None
+    """
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+        del _spans[:]
+
+
+def _key(name: AnyStr, labels: Dict[AnyStr, Any]) -> Tuple:
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def incr(name: AnyStr, value: float = 1, **labels):
+    """
+    Increments a counter.
+    :param name: counter name e.g. "fetch_bytes"
+    :param value: amount to add, defaults to 1
+    :param labels: optional labels e.g. model="gpt-4"
+    :return: None
+    """
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: AnyStr, seconds: float, **labels):
+    """
+    Records a duration.
+    :param name: timer name e.g. "strip_site"
+    :param seconds: duration in seconds
+    :param labels: optional labels
+    :return: None
+    """
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        stats = _timers.get(key)
+        if stats is None:
+            _timers[key] = [1, seconds, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = min(stats[2], seconds)
+            stats[3] = max(stats[3], seconds)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, name: AnyStr, labels: Dict[AnyStr, Any]):
+        self.name = name
+        self.labels = labels
+        self.parent = None
+
+    def __enter__(self):
+        if _tracing:
+            self.parent = getattr(_local, 'span', None)
+            _local.span = self
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        observe(self.name, elapsed, **self.labels)
+        if _tracing:
+            _local.span = self.parent
+            with _lock:
+                if len(_spans) < MAX_SPANS:
+                    _spans.append({
+                        'name': self.name,
+                        'parent': self.parent.name if self.parent else None,
+                        'thread': threading.current_thread().name,
+                        'start': self.start,
+                        'duration_s': elapsed,
+                        'attributes': self.labels
+                    })
+        return False
+
+
+def timer(name: AnyStr, **labels) -> Any:
+    """
+    Times a block of code:
+        with metrics.timer('strip_site'):
+            ...
+    :param name: timer name
+    :param labels: optional labels, also recorded as span attributes when tracing.
+    :return: context manager
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def timed(name: AnyStr) -> Callable:
+    """
+    Decorator that times every call of a function.
+    :param name: timer name
+    :return: decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name, dict()):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> Dict[AnyStr, Any]:
+    """
+    Returns the recorded metrics.
+    :return: dict of the form
+    {
+        'counters': [{'name': ..., 'labels': {...}, 'value': ...}],
+        'timers': [{'name': ..., 'labels': {...}, 'count': ..., 'total_s': ..., 'min_s': ..., 'max_s': ...,
+        'mean_s': ...}],
+        'spans': [recorded spans, if tracing]
+    }
+    """
+    with _lock:
+        return {
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(_counters.items())
+            ],
+            'timers': [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': count,
+                    'total_s': total,
+                    'min_s': low,
+                    'max_s': high,
+                    'mean_s': total / count
+                } for (name, labels), (count, total, low, high) in sorted(_timers.items())
+            ],
+            'spans': list(_spans)
+        }
+
+
+def to_json(**kwargs) -> AnyStr:
+    """
+    Exports the recorded metrics as JSON.
+    :param kwargs: passed on to json.dumps e.g. indent=2
+    :return: JSON string, see "snapshot" for its structure.
+    """
+    return json.dumps(snapshot(), **kwargs)
+
+
+def _prometheus_name(name: AnyStr) -> AnyStr:
+    return PROMETHEUS_PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _prometheus_labels(labels: Dict[AnyStr, Any]) -> AnyStr:
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels.items()
+    ) + '}'
+
+
+def to_prometheus() -> AnyStr:
+    """
+    Exports the recorded metrics in the Prometheus text exposition format: counters as "<name>_total" and timers as
+    "<name>_seconds" summaries (count and sum).
+    :return: string
+    """
+    current = snapshot()
+    lines = list()
+    typed = set()
+    for counter in current['counters']:
+        metric = _prometheus_name(counter['name']) + '_total'
+        if metric not in typed:
+            lines.append('# TYPE {0} counter'.format(metric))
+            typed.add(metric)
+        lines.append('{0}{1} {2}'.format(metric, _prometheus_labels(counter['labels']), counter['value']))
+    for t in current['timers']:
+        metric = _prometheus_name(t['name']) + '_seconds'
+        if metric not in typed:
+            lines.append('# TYPE {0} summary'.format(metric))
+            typed.add(metric)
+        labels = _prometheus_labels(t['labels'])
+        lines.append('{0}_count{1} {2}'.format(metric, labels, t['count']))
+        lines.append('{0}_sum{1} {2}'.format(metric, labels, t['total_s']))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,349 @@
+"""
+nn_index - nearest neighbor index backends for the vector store
+"""
+from typing import *
+import numpy as np
+
+
+def to_matrix(embeddings: Any) -> np.ndarray:
+    """
+    Converts embeddings to a 2D float32 NumPy matrix.
+    :param embeddings: embeddings as returned by an embed function - a tensor, an array, a list of tensors or a list of
+    lists of floats.
+    :return: NumPy array of shape (number of embeddings, embedding dimensions)
+    """
+    if hasattr(embeddings, 'detach'):
+        embeddings = embeddings.detach().cpu().numpy()
+    if isinstance(embeddings, np.ndarray):
+        return np.atleast_2d(embeddings).astype(np.float32, copy=False)
+    rows = [row.detach().cpu().numpy() if hasattr(row, 'detach') else row for row in embeddings]
+    if len(rows) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack(rows).astype(np.float32, copy=False)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalizes the rows of a matrix so that dot products are cosine similarities. Zero rows are left as-is.
+    :param matrix: 2D array
+    :return: normalized copy of the matrix
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.
+    return matrix / norms
+
+
+def top_k(similarities: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the k most similar columns for each row of a similarity matrix, most similar first.
+    :param similarities: 2D array of cosine similarities, one row per query.
+    :param k: number of results per query. Must not exceed the number of columns.
+    :return: tuple of (cosine distances, column indices), each of shape (number of queries, k)
+    """
+    if k < similarities.shape[1]:
+        idxs = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        idxs = np.tile(np.arange(similarities.shape[1]), (similarities.shape[0], 1))
+    top_sims = np.take_along_axis(similarities, idxs, axis=1)
+    order = np.argsort(-top_sims, axis=1, kind='stable')
+    idxs = np.take_along_axis(idxs, order, axis=1)
+    return 1. - np.take_along_axis(top_sims, order, axis=1), idxs
+
+
+class SklearnIndex:
+    """
+    Exact index using scikit-learn's Nearest Neighbors. Every add refits the whole index.
+    """
+
+    def __init__(self, **kwargs):
+        from sklearn.neighbors import NearestNeighbors
+        self._neighbors = NearestNeighbors(
+            metric=kwargs.pop('metric', 'cosine'),
+            **kwargs
+        )
+        self.embeddings = list()
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def fit(self):
+        """
+        Fits the underlying nearest neighbors model.
+        :return: None
+        """
+        self._neighbors.fit(self.embeddings)
+
+    def add(self, embeddings: Any):
+        """
+        Adds embeddings to the index. Triggers a refit operation.
+        :param embeddings: embeddings to add.
+        :return: None
+        """
+        self.embeddings.extend(embeddings)
+        self.fit()
+
+    def attach(self, matrix: np.ndarray):
+        """
+        Replaces the contents of the index with an existing embeddings matrix e.g. a memory-mapped snapshot.
+        :param matrix: 2D array of embeddings
+        :return: None
+        """
+        self.embeddings = list(matrix)
+        if len(self.embeddings) > 0:
+            self.fit()
+
+    def search(self, queries: Any, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches for the nearest neighbors of one or more queries.
+        :param queries: query embeddings
+        :param k: number of neighbors per query, capped at the size of the index.
+        :return: tuple of (distances, indices), each of shape (number of queries, k)
+        """
+        return self._neighbors.kneighbors(X=queries, n_neighbors=min(k, len(self)), return_distance=True)
+
+
+class NumpyIndex:
+    """
+    Exact cosine index over a contiguous, growable float32 matrix of normalized embeddings. Adds are O(batch) (amortized),
+    searches are a single matrix product plus a partial sort.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._initial_capacity = initial_capacity
+        self._matrix = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """
+        Normalized embeddings currently in the index.
+        :return: view of the underlying matrix, shape (len(self), embedding dimensions)
+        """
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    def fit(self):
+        """
+        No-op, the index is always up to date.
+        :return: None
+        """
+        pass
+
+    def _reserve(self, num_rows: int, dims: int):
+        """
+        Ensures the underlying matrix can hold at least num_rows rows, doubling its capacity as required.
+        :param num_rows: total number of rows required
+        :param dims: embedding dimensions
+        :return: None
+        """
+        if self._matrix is None:
+            self._matrix = np.empty((max(num_rows, self._initial_capacity), dims), dtype=np.float32)
+        elif num_rows > self._matrix.shape[0]:
+            grown = np.empty((max(num_rows, 2 * self._matrix.shape[0]), dims), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+
+    def add(self, embeddings: Any):
+        """
+        Appends embeddings to the index.
+        :param embeddings: embeddings to add.
+        :return: None
+        """
+        rows = normalize(to_matrix(embeddings))
+        if len(rows) > 0:
+            self._reserve(self._size + len(rows), rows.shape[1])
+            self._matrix[self._size:self._size + len(rows)] = rows
+            self._size += len(rows)
+
+    def attach(self, matrix: np.ndarray):
+        """
+        Replaces the contents of the index with an existing matrix of normalized embeddings without copying it, e.g. a
+        memory-mapped snapshot. The matrix is only read; it is copied the first time more embeddings are added.
+        :param matrix: 2D float32 array of L2-normalized embeddings
+        :return: None
+        """
+        self._matrix = matrix
+        self._size = len(matrix)
+
+    def search(self, queries: Any, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches for the nearest neighbors of one or more queries by cosine distance.
+        :param queries: query embeddings
+        :param k: number of neighbors per query, capped at the size of the index.
+        :return: tuple of (distances, indices), each of shape (number of queries, k)
+        """
+        query_matrix = normalize(to_matrix(queries))
+        if self._size == 0:
+            empty = np.empty((len(query_matrix), 0))
+            return empty, empty.astype(np.int64)
+        return top_k(query_matrix @ self.embeddings.T, min(k, self._size))
+
+
+class IVFIndex(NumpyIndex):
+    """
+    Approximate cosine index: an inverted file (IVF) over the same growable matrix as "NumpyIndex". Embeddings are
+    assigned to the nearest of n_lists k-means centroids, and searches only scan the n_probe lists whose centroids are
+    closest to the query. Searches are exact until train_size embeddings have been added; after training, new
+    embeddings are assigned to the existing centroids, and the centroids are retrained whenever the index has grown by
+    retrain_factor since they were last trained, so that lists don't stay skewed toward the early data.
+    """
+
+    def __init__(
+            self,
+            n_lists: int = 64,
+            n_probe: int = 8,
+            train_size: int = None,
+            n_iter: int = 10,
+            seed: int = 0,
+            initial_capacity: int = 1024,
+            retrain_factor: float = 4.
+    ):
+        """
+        :param n_lists: number of k-means clusters (inverted lists). More lists means fewer candidates scanned per list.
+        :param n_probe: number of lists scanned per query. Higher values increase recall at the expense of speed, and
+        can be changed at any time.
+        :param train_size: number of embeddings required before the centroids are trained. Defaults to 39 * n_lists.
+        :param n_iter: number of k-means iterations when training.
+        :param seed: random seed for k-means initialization.
+        :param initial_capacity: initial number of rows in the embeddings matrix.
+        :param retrain_factor: the centroids are retrained once the index holds this many times the number of
+        embeddings they were trained on. None never retrains.
+        """
+        super().__init__(initial_capacity=initial_capacity)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size if train_size else 39 * n_lists
+        self.n_iter = n_iter
+        self.seed = seed
+        self.retrain_factor = retrain_factor
+        self._centroids = None
+        # Row numbers of each list, in arrays that grow like the embeddings matrix; only the first _list_sizes are used
+        self._lists = None
+        self._list_sizes = None
+        self._trained_size = 0
+
+    @property
+    def trained(self) -> bool:
+        """
+        Whether the centroids have been trained, i.e. whether searches are approximate.
+        :return: bool
+        """
+        return self._centroids is not None
+
+    def train(self):
+        """
+        Trains the centroids with spherical k-means over (a sample of) the current embeddings and assigns every
+        embedding to its nearest centroid.
+        :return: None
+        """
+        rng = np.random.default_rng(self.seed)
+        data = self.embeddings
+        sample = data[np.sort(rng.choice(len(data), size=min(len(data), 256 * self.n_lists), replace=False))]
+        n_lists = min(self.n_lists, len(sample))
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists)
+            centroids = np.where(counts[:, None] > 0, normalize(sums), centroids)
+        self._centroids = centroids
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self._list_sizes = np.zeros(n_lists, dtype=np.int64)
+        self._trained_size = self._size
+        self._assign(0, self._size)
+
+    def _assign(self, start: int, end: int):
+        """
+        Assigns rows [start, end) of the embeddings matrix to their nearest centroid's list.
+        :param start: first row
+        :param end: last row (exclusive)
+        :return: None
+        """
+        assignments = np.argmax(self._matrix[start:end] @ self._centroids.T, axis=1)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=len(self._centroids))
+        offset = 0
+        for list_id in np.flatnonzero(counts):
+            self._append(list_id, order[offset:offset + counts[list_id]] + start)
+            offset += counts[list_id]
+
+    def _append(self, list_id: int, rows: np.ndarray):
+        size = self._list_sizes[list_id]
+        needed = size + len(rows)
+        if needed > len(self._lists[list_id]):
+            grown = np.empty(max(needed, 2 * len(self._lists[list_id]), 16), dtype=np.int64)
+            grown[:size] = self._lists[list_id][:size]
+            self._lists[list_id] = grown
+        self._lists[list_id][size:needed] = rows
+        self._list_sizes[list_id] = needed
+
+    def _list(self, list_id: int) -> np.ndarray:
+        return self._lists[list_id][:self._list_sizes[list_id]]
+
+    def add(self, embeddings: Any):
+        """
+        Appends embeddings to the index, training the centroids once enough embeddings are available and retraining
+        them once the index has grown by retrain_factor.
+        :param embeddings: embeddings to add.
+        :return: None
+        """
+        start = self._size
+        super().add(embeddings)
+        if not self.trained:
+            if self._size >= self.train_size:
+                self.train()
+        elif self.retrain_factor and self._size >= self.retrain_factor * self._trained_size:
+            self.train()
+        else:
+            self._assign(start, self._size)
+
+    def attach(self, matrix: np.ndarray):
+        """
+        Replaces the contents of the index with an existing matrix of normalized embeddings, training the centroids
+        if the matrix is large enough.
+        :param matrix: 2D float32 array of L2-normalized embeddings
+        :return: None
+        """
+        super().attach(matrix)
+        self._centroids = None
+        self._lists = None
+        self._list_sizes = None
+        self._trained_size = 0
+        if self._size >= self.train_size:
+            self.train()
+
+    def search(self, queries: Any, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches for the approximate nearest neighbors of one or more queries by cosine distance.
+        :param queries: query embeddings
+        :param k: number of neighbors per query, capped at the size of the index.
+        :return: tuple of (distances, indices), each of shape (number of queries, k)
+        """
+        if not self.trained:
+            return super().search(queries=queries, k=k)
+        query_matrix = normalize(to_matrix(queries))
+        k = min(k, self._size)
+        n_probe = min(self.n_probe, len(self._centroids))
+        probes = top_k(query_matrix @ self._centroids.T, n_probe)[1]
+        dists = np.empty((len(query_matrix), k))
+        idxs = np.empty((len(query_matrix), k), dtype=np.int64)
+        for i, query in enumerate(query_matrix):
+            candidates = np.concatenate([self._list(list_id) for list_id in probes[i]])
+            if len(candidates) < k:
+                candidates = np.arange(self._size)
+            query_dists, query_idxs = top_k((self._matrix[candidates] @ query)[None, :], k)
+            dists[i] = query_dists[0]
+            idxs[i] = candidates[query_idxs[0]]
+        return dists, idxs
+
+
+INDEX_BACKENDS = {
+    'sklearn': SklearnIndex,
+    'numpy': NumpyIndex,
+    'ivf': IVFIndex
+}
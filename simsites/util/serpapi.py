@@ -2,14 +2,15 @@
 serpapi - functions for working with SerpApi
 """
 import json
-import os
 import logging
 import requests
 from typing import *
 
 import urllib3.exceptions
 
-SERPAPI_KEY = os.environ['SERPAPI_KEY']
+from simsites.config import get_config
+from simsites.util import metrics
+
 SERPAPI_HTML_URL = 'https://serpapi.com/search.html'
 SERPAPI_JSON_URL = 'https://serpapi.com/search.json'
 
@@ -24,7 +25,7 @@ def get_params(query: str, location: str = None, country: str = "us", search_lan
     :return: dict
     """
     params = {
-        "api_key": SERPAPI_KEY,
+        "api_key": get_config().get('serpapi_key'),
         "engine": "google",
         "q": query,
         "google_domain": "google.com",
@@ -108,6 +109,60 @@ def get_organic_search_results(
         return results
 
 
+def fetch_result(search_result: Dict, timeout: int = 30) -> AnyStr:
+    """
+    Fetches the source of a single organic search result.
+    :param search_result: organic search result, as returned by "get_organic_search_results".
+    :param timeout: request timeout in seconds. Defaults to 30.
+    :return: source of the search result. If the site couldn't be retrieved (e.g. blocked), returns the search result
+    snippet instead.
+    """
+    result = search_result['snippet']
+    try:
+        with metrics.timer('fetch_result'):
+            r = requests.get(search_result['link'], timeout=timeout)
+        if r.status_code == 200:
+            result = r.text
+            metrics.incr('fetch_bytes', len(r.content))
+        else:
+            metrics.incr('fetch_fallbacks')
+            logging.warning("Received status code {0} for {1}, using search result body".format(
+                r.status_code,
+                search_result['link']
+            ))
+    except urllib3.exceptions.ReadTimeoutError:
+        metrics.incr('fetch_fallbacks')
+        logging.warning("Timed out waiting for {0}, using search result body".format(search_result['link']))
+    except Exception as err:
+        metrics.incr('fetch_fallbacks')
+        logging.error(err)
+        logging.warning("Encountered error fetching {0}, using search result body".format(search_result['link']))
+    finally:
+        return result
+
+
+def fetch_sites(
+        search: AnyStr,
+        timeout: int = 30,
+        max_results: int = 10) -> List[Tuple[AnyStr, AnyStr]]:
+    """
+    Conducts a search on DuckDuckGo and returns the URL and source of each result.
+    :param search: search to perform
+    :param timeout: request timeout in seconds. Defaults to 30.
+    :param max_results: maximum number of results to return (defaults to 10)
+    :return: list of (URL, source) of each search result, see "fetch_results".
+    """
+    with metrics.timer('fetch_results'):
+        search_results = get_organic_search_results(
+            search=search,
+            timeout=timeout
+        )
+        return [
+            (search_result['link'], fetch_result(search_result, timeout=timeout))
+            for search_result in search_results[:max_results]
+        ]
+
+
 def fetch_results(
         search: AnyStr,
         timeout: int = 30,
@@ -120,27 +175,4 @@ def fetch_results(
     :return: source of each search result. If a site couldn't be retrieved (e.g. blocked), returns search result
     snippet for that result instead.
     """
-    site_sources = list()
-    search_results = get_organic_search_results(
-        search=search,
-        timeout=timeout
-    )
-    for search_result in search_results:
-        result = search_result['snippet']
-        try:
-            r = requests.get(search_result['link'], timeout=timeout)
-            if r.status_code == 200:
-                result = r.text
-            else:
-                logging.warning("Received status code {0} for {1}, using search result body".format(
-                    r.status_code,
-                    search_result['link']
-                ))
-        except urllib3.exceptions.ReadTimeoutError:
-            logging.warning("Timed out waiting for {0}, using search result body".format(search_result['link']))
-        except Exception as err:
-            logging.error(err)
-            logging.warning("Encountered error fetching {0}, using search result body".format(search_result['link']))
-        finally:
-            site_sources.append(result)
-    return site_sources[:max_results]
+    return [src for _, src in fetch_sites(search=search, timeout=timeout, max_results=max_results)]
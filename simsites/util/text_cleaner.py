@@ -1,26 +1,159 @@
 """
 text_cleaner - functions for cleaning text
 """
+import functools
+import re
 from typing import *
-from bs4 import BeautifulSoup
-from cleantext import clean
 
+from simsites.util import metrics
 
-def split_site(site_text: AnyStr) -> List[AnyStr]:
-    results = list()
-    for line in site_text.split('\n'):
-        stripped_line = line.strip()
-        if len(stripped_line) > 0:
-            results.append(stripped_line)
+# Segment sizes in characters. The default local model (paraphrase-multilingual-mpnet-base-v2) reads 128 tokens before
+# truncating, and at ~3.5 characters per token 450 characters stay under that limit (the English models read more).
+SEGMENT_MIN_CHARS = 40
+SEGMENT_MAX_CHARS = 450
+NOISE_REGEX = re.compile(r"^[\W\d_]*$")
+SENTENCE_END_REGEX = re.compile(r"(?<=[.!?])\s+")
+# Lines "sanitize_text" leaves unchanged apart from whitespace: printable ASCII and tabs, without backslashes
+# (unicode-escape decoding), backticks (quote normalization), HTML entities or emoji aliases like ":smile:".
+CLEAN_ASCII_REGEX = re.compile(r"(?:[\t\x20-\x25\x27-\x5b\x5d-\x5f\x61-\x7e]|&(?![#0-9A-Za-z]))*")
+EMOJI_ALIAS_REGEX = re.compile(r":[^:\s]+:")
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+def split_site(
+        site_text: AnyStr,
+        segment: bool = False,
+        min_chars: int = SEGMENT_MIN_CHARS,
+        max_chars: int = SEGMENT_MAX_CHARS
+) -> List[AnyStr]:
+    """
+    Splits the text of a site into the units that are embedded and clustered.
+    :param site_text: text of the site e.g. from "strip_site"
+    :param segment: if True, returns size-balanced segments (see "segment_site") rather than every non-empty line.
+    :param min_chars: minimum segment length when segment is True
+    :param max_chars: maximum segment length when segment is True
+    :return: list of lines or segments
+    """
+    if segment:
+        results = segment_site(site_text, min_chars=min_chars, max_chars=max_chars)
+    else:
+        results = list()
+        for line in site_text.split('\n'):
+            stripped_line = line.strip()
+            if len(stripped_line) > 0:
+                results.append(stripped_line)
+    metrics.incr('site_lines', len(results))
     return results
 
 
+def segment_site(
+        site_text: AnyStr,
+        min_chars: int = SEGMENT_MIN_CHARS,
+        max_chars: int = SEGMENT_MAX_CHARS
+) -> List[AnyStr]:
+    """
+    Splits the text of a site into segments of roughly even size: lines made only of numbers and punctuation are
+    dropped, runs of short lines (menu items, labels, prices) are joined until they reach min_chars, and lines longer
+    than max_chars are split at sentence boundaries into windows of at most max_chars. Short lines left over before a
+    long line or at the end of the text are merged into the neighbouring segment, so no segment is shorter than
+    min_chars unless the whole text is.
+    :param site_text: text of the site
+    :param min_chars: consecutive lines shorter than this are joined
+    :param max_chars: lines longer than this are split
+    :return: list of segments
+    """
+    segments = list()
+    fragments = list()
+    fragments_len = 0
+    for line in site_text.split('\n'):
+        line = line.strip()
+        if NOISE_REGEX.match(line):
+            continue
+        if len(line) < min_chars:
+            fragments.append(line)
+            fragments_len += len(line) + (1 if fragments_len else 0)
+            if fragments_len >= min_chars:
+                segments.append(' '.join(fragments))
+                fragments = list()
+                fragments_len = 0
+            continue
+        if fragments:
+            # Too short to stand alone: prefix the leftover to this line
+            line = ' '.join(fragments) + ' ' + line
+            fragments = list()
+            fragments_len = 0
+        if len(line) > max_chars:
+            segments.extend(split_long_text(line, max_chars=max_chars, min_chars=min_chars))
+        else:
+            segments.append(line)
+    if fragments:
+        leftover = ' '.join(fragments)
+        if segments:
+            tail = segments.pop() + ' ' + leftover
+            if len(tail) > max_chars:
+                segments.extend(split_long_text(tail, max_chars=max_chars, min_chars=min_chars))
+            else:
+                segments.append(tail)
+        else:
+            segments.append(leftover)
+    return segments
+
+
+def split_long_text(
+        text: AnyStr,
+        max_chars: int = SEGMENT_MAX_CHARS,
+        min_chars: int = SEGMENT_MIN_CHARS
+) -> List[AnyStr]:
+    """
+    Splits text into windows of at most max_chars, breaking at sentence ends where possible and between words
+    otherwise. Windows shorter than min_chars are filled with the words that follow them, and a short last window is
+    rebalanced with the one before it.
+    :param text: text to split
+    :param max_chars: maximum window length
+    :param min_chars: minimum window length, unless the whole text is shorter
+    :return: list of windows
+    """
+    pieces = list()
+    for sentence in SENTENCE_END_REGEX.split(text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars + 1)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+    windows = list()
+    for piece in pieces:
+        if windows and len(windows[-1]) + 1 + len(piece) <= max_chars:
+            windows[-1] += ' ' + piece
+            continue
+        if windows and len(windows[-1]) < min_chars:
+            # Too short to stand alone: fill the window with the words at the start of the piece
+            cut = piece.rfind(' ', 0, max_chars - len(windows[-1]))
+            if cut > 0:
+                windows[-1] += ' ' + piece[:cut]
+                piece = piece[cut:].strip()
+        windows.append(piece)
+    if len(windows) > 1 and len(windows[-1]) < min_chars:
+        # Both windows didn't fit in one, so splitting them near the middle gives two windows over max_chars / 2
+        last = windows.pop()
+        combined = windows.pop() + ' ' + last
+        middle = len(combined) // 2
+        before = combined.rfind(' ', 0, middle + 1)
+        after = combined.find(' ', middle)
+        candidates = [cut for cut in (before, after) if cut > 0]
+        cut = min(candidates, key=lambda cut: abs(cut - middle)) if candidates else middle
+        windows.extend([combined[:cut].strip(), combined[cut:].strip()])
+    return windows
+
+
 def sanitize_text(raw: AnyStr) -> AnyStr:
     """
     Sanitizes text input - tries to fix Unicode, normalize line breaks, etc.
     :param raw: raw text
     :return: hopefully cleaner text
     """
+    from cleantext import clean
     return clean(
         raw,
         fix_unicode=True,               # fix various unicode errors
@@ -45,6 +178,41 @@ def sanitize_text(raw: AnyStr) -> AnyStr:
     )
 
 
+def sanitize_text_fast(raw: AnyStr) -> AnyStr:
+    """
+    Returns the same text as "sanitize_text", faster: the text is sanitized line by line, lines that are already clean
+    ASCII only have their whitespace normalized, and the other lines go through the enabled cleaning steps only, with
+    the results of repeated lines (navigation, footers) memoized. Falls back to "sanitize_text" for the rare texts
+    where a line's result depends on the rest of the text (backslash escapes, HTML entities after a "<").
+    :param raw: raw text
+    :return: hopefully cleaner text
+    """
+    if raw is None:
+        return ""
+    raw = str(raw)
+    if '\\' in raw or ('<' in raw and raw.rfind('&') > raw.find('<')):
+        metrics.incr('sanitize_fallbacks')
+        return sanitize_text(raw)
+    lines = [sanitize_line(line) for line in raw.split('\n')]
+    return '\n'.join(line for line in lines if line)
+
+
+@functools.lru_cache(maxsize=65536)
+def sanitize_line(line: AnyStr) -> AnyStr:
+    """
+    Sanitizes a single line of text, see "sanitize_text_fast".
+    :param line: line of text without line breaks
+    :return: sanitized line, empty if the line was blank. May contain line breaks if the line contained other
+    line break characters (e.g. carriage returns).
+    """
+    if CLEAN_ASCII_REGEX.fullmatch(line) and not EMOJI_ALIAS_REGEX.search(line):
+        return WHITESPACE_REGEX.sub(' ', line.strip())
+    from cleantext.clean import fix_bad_unicode, normalize_whitespace, to_ascii_unicode
+    text = fix_bad_unicode(line)
+    text = to_ascii_unicode(text, lang="en", no_emoji=False)
+    return normalize_whitespace(text, no_line_breaks=False, strip_lines=True, keep_two_line_breaks=False)
+
+
 def strip_site(site_src: AnyStr, sanitize: bool = True) -> AnyStr:
     """
     Extract text contents from HTML source.
@@ -52,8 +220,11 @@ def strip_site(site_src: AnyStr, sanitize: bool = True) -> AnyStr:
     :param sanitize: if True (default), try to sanitize the text (fix Unicode, normalize line breaks, etc.)
     :return: text of the site
     """
-    soup = BeautifulSoup(site_src, 'html.parser')
-    site_text = soup.get_text()
-    if sanitize:
-        site_text = sanitize_text(site_text)
+    from bs4 import BeautifulSoup
+    with metrics.timer('strip_site'):
+        soup = BeautifulSoup(site_src, 'html.parser')
+        site_text = soup.get_text()
+        if sanitize:
+            site_text = sanitize_text_fast(site_text)
+    metrics.incr('strip_site_bytes', len(site_src))
     return site_text
@@ -1,10 +1,19 @@
 """
 vector_store - utils for simple vector stores (!)
 """
+import gzip
+import json
+import os
 from typing import *
-from sklearn.neighbors import NearestNeighbors
 
-from simsites.util.embed import generate_embeddings
+import numpy as np
+
+from simsites.util import metrics
+from simsites.util.embed import generate_embeddings, local_model_name
+from simsites.util.nn_index import INDEX_BACKENDS, normalize, to_matrix
+
+SNAPSHOT_TEXTS_FNAME = 'texts.json.gz'
+SNAPSHOT_EMBEDDINGS_FNAME = 'embeddings.npy'
 
 
 class NNVectorStore:
@@ -12,32 +21,64 @@ class NNVectorStore:
     Basic in-memory vector store, using the Nearest Neighbors algorithm.
     """
 
-    def __init__(self, embed_function: Any = generate_embeddings, **kwargs):
-        self._neighbors = NearestNeighbors(
-            metric=kwargs.pop('metric', 'cosine'),
+    def __init__(
+            self,
+            embed_function: Any = generate_embeddings,
+            index: Any = 'sklearn',
+            model_id: AnyStr = None,
             **kwargs
-        )
+    ):
+        """
+        :param embed_function: function to generate embeddings, should accept a list of strings and return a list of
+        floats or tensors.
+        :param index: nearest neighbors index backend - either the name of one of "INDEX_BACKENDS" or an index instance.
+        Defaults to "sklearn", which refits on every add; "numpy" appends without refitting and is preferred when
+        texts are added in several batches; "ivf" is approximate, for stores too large for exact search (see
+        "IVFIndex" for its recall/speed parameters).
+        :param model_id: identifier of the embedding model used by embed_function, recorded in snapshots. Defaults to
+        the local model's name when using "generate_embeddings" (see "local_model_name").
+        :param kwargs: passed on to the index backend's constructor.
+        """
+        if isinstance(index, str):
+            if index not in INDEX_BACKENDS:
+                raise ValueError("Index '{0}' not available, must be one of {1}".format(index, list(INDEX_BACKENDS)))
+            index = INDEX_BACKENDS[index](**kwargs)
+        self._index = index
         self.embed_function = embed_function
-        self.embeddings = list()
+        if model_id is None:
+            model_id = local_model_name(embed_function)
+        self.model_id = model_id
         self.texts = list()
+        self.metadatas = list()
+
+    @property
+    def embeddings(self) -> Any:
+        """
+        Embeddings of the texts in the vector store, in the same order as the texts.
+        :return: embeddings as stored by the index backend
+        """
+        return self._index.embeddings
 
     def fit(self):
         """
         Fits the underlying nearest neighbors vector store.
         :return:
         """
-        self._neighbors.fit(self.embeddings)
+        self._index.fit()
 
-    def add_texts(self, texts: List[AnyStr]):
+    def add_texts(self, texts: List[AnyStr], metadatas: List[Dict] = None):
         """
-        Adds texts to the vector store. Triggers a refit operation.
+        Adds texts to the vector store. Triggers a refit operation if the index backend requires it.
         :param texts: texts to be added to the vector store.
+        :param metadatas: optional metadata (e.g. source URL) for each text, must be JSON-serializable.
         :return: None
         """
         if len(texts) > 0:
-            self.texts.extend(texts)
-            self.embeddings.extend(self.embed_function(texts))
-            self.fit()
+            with metrics.timer('vector_store_add'):
+                self.texts.extend(texts)
+                self.metadatas.extend(metadatas if metadatas else [dict() for _ in texts])
+                self._index.add(self.embed_function(texts))
+            metrics.incr('vector_store_texts', len(texts))
 
     def get_relevant_texts(self, query: AnyStr, k: int = 2, t: float = None) -> List[AnyStr]:
         """
@@ -49,13 +90,103 @@ class NNVectorStore:
         :return: list of strings representing the most similar strings to the query in the current vector store. List
         may be empty if no results found or if no results had smaller distances than the target distance specified.
         """
-        query_embedding = self.embed_function([query])
-        knn_dists, knn_idxs = self._neighbors.kneighbors(X=query_embedding, n_neighbors=k, return_distance=True)
-        if t:
-            valid_idxs = list()
-            for i in range(len(knn_dists[0])):
-                if knn_dists[0][i] < t:
-                    valid_idxs.append(knn_idxs[0][i])
-        else:
-            valid_idxs = knn_idxs[0]
-        return [self.texts[idx] for idx in valid_idxs]
+        return self.get_relevant_texts_batch(queries=[query], k=k, t=t)[0]['texts']
+
+    def get_relevant_texts_batch(
+            self,
+            queries: List[AnyStr],
+            k: Union[int, List[int]] = 2,
+            t: Union[float, List[float]] = None
+    ) -> List[Dict[AnyStr, Any]]:
+        """
+        Searches for the most similar texts to several queries at once: all queries are embedded in a single call and
+        searched in a single pass over the index.
+        :param queries: queries to match
+        :param k: number of nearest results to return, either one value for all queries or one per query (defaults
+        to 2).
+        :param t: distance threshold, either one value for all queries or one per query: if specified, only results with
+        a lower distance are returned. Default is None, i.e. all results are returned regardless of distance metric.
+        :return: list with one dict per query, in the same order as the queries, of the form
+        {
+            'texts': [most similar texts, most similar first],
+            'indices': [indices of these texts in the vector store],
+            'distances': [distances of these texts from the query]
+        }
+        """
+        if len(queries) == 0:
+            return list()
+        ks = k if isinstance(k, (list, tuple)) else [k] * len(queries)
+        ts = t if isinstance(t, (list, tuple)) else [t] * len(queries)
+        query_embeddings = self.embed_function(queries)
+        with metrics.timer('vector_store_search'):
+            knn_dists, knn_idxs = self._index.search(queries=query_embeddings, k=max(ks))
+        metrics.incr('vector_store_queries', len(queries))
+        results = list()
+        for query_dists, query_idxs, query_k, query_t in zip(knn_dists, knn_idxs, ks, ts):
+            valid = [
+                (int(idx), float(dist)) for idx, dist in zip(query_idxs[:query_k], query_dists[:query_k])
+                if not query_t or dist < query_t
+            ]
+            results.append({
+                'texts': [self.texts[idx] for idx, _ in valid],
+                'indices': [idx for idx, _ in valid],
+                'distances': [dist for _, dist in valid]
+            })
+        return results
+
+    def save(self, path: AnyStr):
+        """
+        Saves a snapshot of the vector store to a folder: texts, metadata and embedding model ID as gzipped JSON, and
+        the normalized embeddings as a .npy file that can be memory-mapped on load.
+        :param path: folder to write the snapshot to, created if it doesn't exist.
+        :return: None
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, SNAPSHOT_EMBEDDINGS_FNAME), normalize(to_matrix(self.embeddings)))
+        with gzip.open(os.path.join(path, SNAPSHOT_TEXTS_FNAME), 'wt', encoding='utf-8') as fidout:
+            json.dump(
+                {
+                    'model_id': self.model_id,
+                    'texts': self.texts,
+                    'metadatas': self.metadatas
+                },
+                fidout,
+                separators=(',', ':')
+            )
+
+    @classmethod
+    def load(
+            cls,
+            path: AnyStr,
+            embed_function: Any = generate_embeddings,
+            model_id: AnyStr = None,
+            index: Any = 'numpy',
+            mmap: bool = True,
+            **kwargs
+    ) -> 'NNVectorStore':
+        """
+        Loads a vector store snapshot written by "save".
+        :param path: folder containing the snapshot.
+        :param embed_function: function to generate embeddings for new texts and queries, must use the same model as
+        the snapshot.
+        :param model_id: identifier of the embedding model used by embed_function, checked against the model recorded in
+        the snapshot. Defaults to the local model's name when using "generate_embeddings".
+        :param index: index backend, defaults to "numpy" which uses the snapshot's embeddings without copying them.
+        :param mmap: if True (default), memory-maps the embeddings rather than reading them into memory.
+        :param kwargs: passed on to the index backend's constructor.
+        :return: NNVectorStore
+        """
+        store = cls(embed_function=embed_function, index=index, model_id=model_id, **kwargs)
+        with gzip.open(os.path.join(path, SNAPSHOT_TEXTS_FNAME), 'rt', encoding='utf-8') as fidin:
+            snapshot = json.load(fidin)
+        if store.model_id and snapshot['model_id'] and store.model_id != snapshot['model_id']:
+            raise ValueError("Snapshot '{0}' was embedded with '{1}', not '{2}'".format(
+                path,
+                snapshot['model_id'],
+                store.model_id
+            ))
+        store.model_id = store.model_id or snapshot['model_id']
+        store.texts = snapshot['texts']
+        store.metadatas = snapshot['metadatas']
+        store._index.attach(np.load(os.path.join(path, SNAPSHOT_EMBEDDINGS_FNAME), mmap_mode='r' if mmap else None))
+        return store
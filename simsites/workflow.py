@@ -0,0 +1,143 @@
+"""
+workflow - the search -> cluster -> recommend flow of examples/search_keywords.py, with optional checkpoints so that
+interrupted runs resume where they stopped.
+"""
+import logging
+from typing import *
+
+from simsites.cluster import cluster_lines, route_embed_function, site_lines, top_keywords
+from simsites.coverage import coverage_report, rank_gaps
+from simsites.util import serpapi
+from simsites.util.vector_store import NNVectorStore
+from simsites.util.checkpoint import CheckpointStore
+from simsites.util.embed import embedding_model_id, generate_embeddings
+
+
+def run_search(
+        search: AnyStr,
+        llm: Any = None,
+        embed_function: Callable = generate_embeddings,
+        checkpoints: CheckpointStore = None,
+        max_results: int = 10,
+        min_cluster_size: int = 5,
+        threshold: float = 0.75,
+        num_clusters: int = 5,
+        num_terms: int = 5,
+        recommend: bool = True,
+        route_language: bool = False,
+        segment: bool = False,
+        client_site_src: AnyStr = None,
+        coverage_threshold: float = 0.75
+) -> Dict[AnyStr, Any]:
+    """
+    Conducts a search, clusters the text of the top results and asks the LLM for recommendations on the largest
+    clusters. With a checkpoint store, the output of each stage (fetched sources, cleaned lines, embeddings, clusters and
+    LLM responses) is saved as it completes and reused by later runs with the same inputs.
+    :param search: search to perform
+    :param llm: LLM module e.g. simsites.llm.openai (the default) or simsites.llm.mistral
+    :param embed_function: function to generate embeddings, defaults to local embeddings.
+    :param checkpoints: optional checkpoint store
+    :param max_results: number of search results to cluster
+    :param min_cluster_size: minimum cluster size in lines, see "cluster_sites".
+    :param threshold: clustering (similarity) threshold, see "cluster_sites".
+    :param num_clusters: number of clusters to make recommendations for
+    :param num_terms: number of keywords per cluster
+    :param recommend: if True (default), asks the LLM for recommendations for each cluster.
+    :param route_language: if True and embed_function is a local model, picks the model from the language of the
+    fetched sites, see "route_embed_function".
+    :param segment: if True, clusters size-balanced segments rather than lines, see "cluster_sites".
+    :param client_site_src: if specified, HTML source of the client's site: clusters the site already covers (see
+    "coverage_report") are not sent to the LLM.
+    :param coverage_threshold: similarity at or above which the client's site covers a cluster.
+    :return: dict of the form {'search': ..., 'embedding_model': ..., 'recommendations': [{'cluster_keywords': ...,
+    'llm_recommendations': ..., 'coverage': ...}]}, plus a 'coverage_report' ranked from the largest gap when
+    client_site_src is specified. If no text was fetched, 'embedding_model' is missing and 'recommendations' is empty.
+    """
+    if llm is None:
+        import simsites.llm.openai as llm
+
+    def cached(stage, key, compute):
+        return checkpoints.cached(stage, key, compute) if checkpoints else compute()
+
+    key = CheckpointStore.key
+    fetch_key = key('fetch', search=search, max_results=max_results)
+    # Cleaned lines are kept per site, so that language routing decides on each site like "cluster_sites" does
+    clean_key = key('clean', fetch_key, segment=segment, per_site=True)
+
+    # Empty results are returned as None so they aren't checkpointed: fetch_results returns an empty list when SerpApi
+    # fails, and a transient outage shouldn't be reused as "no results" by every later run.
+    def fetch():
+        return serpapi.fetch_results(search=search, max_results=max_results) or None
+
+    def clean():
+        sources = cached('fetch', fetch_key, fetch) or list()
+        per_site = [site_lines(src, segment=segment) for src in sources]
+        return per_site if any(per_site) else None
+
+    per_site = cached('clean', clean_key, clean) or list()
+    lines = [line for site_as_lines in per_site for line in site_as_lines]
+    results = {
+        'search': search,
+        'recommendations': list()
+    }
+    if not lines:
+        logging.warning("No text received for '{0}'".format(search))
+        return results
+    if route_language:
+        embed_function = route_embed_function(embed_function, per_site)
+    results['embedding_model'] = embedding_model_id(embed_function)
+    embed_key = key('embed', clean_key, model=embedding_model_id(embed_function))
+    cluster_key = key('cluster', embed_key, min_cluster_size=min_cluster_size, threshold=threshold)
+
+    embedded = list()
+
+    def embed():
+        # Loaded at most once, and only if the cluster or coverage stages need it
+        if not embedded:
+            embedded.append(cached('embed', embed_key, lambda: embed_function(lines)))
+        return embedded[0]
+
+    def cluster():
+        return cluster_lines(
+            lines=lines,
+            embeddings=embed(),
+            min_cluster_size=min_cluster_size,
+            threshold=threshold,
+            embedding_model=embedding_model_id(embed_function)
+        )['clusters']
+
+    clusters = cached('cluster', cluster_key, cluster)
+    report = None
+    if client_site_src:
+        site_vector_store = NNVectorStore(embed_function=embed_function, index='numpy')
+        site_vector_store.add_texts(site_lines(client_site_src, segment=segment))
+        report = coverage_report(
+            clustered={
+                'lines': lines,
+                'embeddings': embed(),
+                'clusters': clusters,
+                'embedding_model': embedding_model_id(embed_function)
+            },
+            site_vector_store=site_vector_store,
+            num_clusters=num_clusters,
+            coverage_threshold=coverage_threshold
+        )
+        results['coverage_report'] = rank_gaps(report)
+    top_sets = top_keywords(clusters=clusters, sentences=lines, num_clusters=num_clusters, num_terms=num_terms)
+    for i, top_set in enumerate(top_sets):
+        response = None
+        if recommend and not (report and report[i]['covered']):
+            llm_key = key('llm', llm=llm.__name__, model=llm.DEFAULT_MODEL, search=search, keywords=top_set)
+            response = cached(
+                'llm',
+                llm_key,
+                lambda: llm.make_seo_recommendations(search=search, keywords=top_set)
+            )
+        results['recommendations'].append({
+            'cluster_keywords': top_set,
+            'llm_recommendations': response,
+            'coverage': report[i] if report else None
+        })
+    if checkpoints:
+        logging.info("Checkpoints reused: {0}, computed: {1}".format(checkpoints.hits, checkpoints.misses))
+    return results